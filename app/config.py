@@ -2,6 +2,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Literal
+
 from pydantic import Field
 
 class Settings(BaseSettings):
@@ -14,11 +16,91 @@ class Settings(BaseSettings):
     Атрибуты:
         TELEGRAM_BOT_TOKEN (str): Токен Telegram-бота, необходимый для запуска SmartSavings.
         DB_URL (str): URL подключения к базе данных (например, SQLite или PostgreSQL).
+        SQLITE_SINGLE_WRITER (bool): Для SQLite — все записи идут через одну задачу-писателя.
+        SQLITE_WRITE_BATCH_SIZE (int): Сколько операций записи писатель объединяет в один коммит.
+        SQLITE_BUSY_TIMEOUT_MS (int): `PRAGMA busy_timeout` для соединений SQLite.
+        SQLITE_CACHE_SIZE_KB (int): `PRAGMA cache_size` (в КиБ) для соединений SQLite.
+        SQLITE_MMAP_SIZE (int): `PRAGMA mmap_size` (в байтах) для соединений SQLite.
+        SQLITE_READ_POOL_SIZE (int): Размер отдельного пула соединений только для чтения.
+        ALERT_FLUSH_SECONDS (float): Как часто алерты отправляются в чат одной сводкой.
+        ALERT_BUFFER_SIZE (int): Сколько разных алертов копится до отправки; остальные отбрасываются.
+        REPORT_DISPATCH_CONCURRENCY (int): Сколько отчётов рассылки строится одновременно.
+        TELEGRAM_GLOBAL_RATE_LIMIT (float): Лимит отправки сообщений ботом, сообщений в секунду.
+        TELEGRAM_PER_CHAT_RATE_LIMIT (float): Лимит отправки в один чат, сообщений в секунду.
+        TELEGRAM_MAX_RETRIES (int): Сколько раз повторять запрос к Bot API после `RetryAfter`.
+        REPORT_WINDOW_MINUTES (int): На сколько минут растягивается рассылка регулярного отчёта.
+        REPORT_BATCH_SIZE (int): Сколько наступивших слотов рассылки обрабатывается одной пачкой.
+        JOB_LEASE_SECONDS (int): Срок аренды запуска задачи или пачки слотов репликой.
+        KEYPAD_EDIT_DEBOUNCE_MS (int): Окно, в которое нажатия цифровой клавиатуры схлопываются в одну правку.
+        BOT_MODE (str): Способ получения апдейтов: "polling" или "webhook".
+        WEBHOOK_URL (str | None): Публичный адрес бота (без пути), на который Telegram шлёт апдейты.
+        WEBHOOK_PATH (str): Путь приёма апдейтов на сервере.
+        WEBHOOK_SECRET (str | None): Секрет, который Telegram передаёт в `X-Telegram-Bot-Api-Secret-Token` (обязателен для webhook).
+        WEBHOOK_HOST (str): Адрес, на котором слушает webhook-сервер.
+        WEBHOOK_PORT (int): Порт webhook-сервера.
+        WEBHOOK_MAX_CONCURRENCY (int): Сколько апдейтов обрабатывается одновременно в режиме webhook.
+        WORKER_PROCESSES (int): Число процессов-обработчиков апдейтов; 1 — всё в одном процессе.
+            С SQLite и `SQLITE_SINGLE_WRITER` поддерживается только 1.
+        UPDATE_CONCURRENCY (int): Сколько апдейтов разных пользователей обрабатывается одновременно.
+        HANDLER_TIMEOUT_SECONDS (float): Бюджет времени обработчика по умолчанию (0 — без ограничения).
+        SQL_TRACE (bool): Писать в лог сводку SQL-запросов апдейта или задачи, вышедших за бюджет.
+        SQL_QUERY_BUDGET (int): Сколько запросов на апдейт допустимо; больше — сводка в лог.
+        SQL_JOB_QUERY_BUDGET (int | None): То же для одного запуска фоновой задачи; не задан — без бюджета.
+        PROFILE_SAMPLE_RATE (float): Доля обработчиков, которые профилируются целиком (0 — ни одного).
+        PROFILE_SLOW_SECONDS (float | None): Профилировать обработчики дольше этого порога; не задан — выключено.
+        PROFILE_DIR (str): Каталог для профилей (folded stacks для флеймграфов).
+        PROFILE_MAX_DUMPS (int): Сколько последних профилей хранить в `PROFILE_DIR`.
+        METRICS_PORT (int | None): Порт HTTP-эндпоинта `/metrics` (Prometheus); не задан — эндпоинт выключен.
+            Воркеры пула отдают метрики на следующих портах (`METRICS_PORT + 1 + номер`).
+        METRICS_HOST (str): Адрес эндпоинта метрик.
     """
     TELEGRAM_BOT_TOKEN: str = Field(..., alias="TELEGRAM_BOT_TOKEN")
     DB_URL: str = Field(..., alias="DB_URL")
     TELEGRAM_BOT_ALERT: str | None = Field(default=None, alias="TELEGRAM_BOT_ALERT")
     TELEGRAM_ALERT_CHAT_ID: str | None = Field(default=None, alias="TELEGRAM_ALERT_CHAT_ID")
+    ALERT_FLUSH_SECONDS: float = Field(default=10.0, alias="ALERT_FLUSH_SECONDS")
+    ALERT_BUFFER_SIZE: int = Field(default=200, alias="ALERT_BUFFER_SIZE")
+
+    SQLITE_SINGLE_WRITER: bool = Field(default=True, alias="SQLITE_SINGLE_WRITER")
+    SQLITE_WRITE_BATCH_SIZE: int = Field(default=64, alias="SQLITE_WRITE_BATCH_SIZE")
+    SQLITE_BUSY_TIMEOUT_MS: int = Field(default=5000, alias="SQLITE_BUSY_TIMEOUT_MS")
+    SQLITE_CACHE_SIZE_KB: int = Field(default=16384, alias="SQLITE_CACHE_SIZE_KB")
+    SQLITE_MMAP_SIZE: int = Field(default=268435456, alias="SQLITE_MMAP_SIZE")
+    SQLITE_READ_POOL_SIZE: int = Field(default=5, alias="SQLITE_READ_POOL_SIZE")
+
+    REPORT_DISPATCH_CONCURRENCY: int = Field(default=8, alias="REPORT_DISPATCH_CONCURRENCY")
+    TELEGRAM_GLOBAL_RATE_LIMIT: float = Field(default=30.0, alias="TELEGRAM_GLOBAL_RATE_LIMIT")
+    TELEGRAM_PER_CHAT_RATE_LIMIT: float = Field(default=1.0, alias="TELEGRAM_PER_CHAT_RATE_LIMIT")
+    TELEGRAM_MAX_RETRIES: int = Field(default=3, alias="TELEGRAM_MAX_RETRIES")
+    REPORT_WINDOW_MINUTES: int = Field(default=180, alias="REPORT_WINDOW_MINUTES")
+    REPORT_BATCH_SIZE: int = Field(default=100, alias="REPORT_BATCH_SIZE")
+    JOB_LEASE_SECONDS: int = Field(default=300, alias="JOB_LEASE_SECONDS")
+
+    KEYPAD_EDIT_DEBOUNCE_MS: int = Field(default=300, alias="KEYPAD_EDIT_DEBOUNCE_MS")
+
+    BOT_MODE: Literal["polling", "webhook"] = Field(default="polling", alias="BOT_MODE")
+    WEBHOOK_URL: str | None = Field(default=None, alias="WEBHOOK_URL")
+    WEBHOOK_PATH: str = Field(default="/telegram/webhook", alias="WEBHOOK_PATH")
+    WEBHOOK_SECRET: str | None = Field(default=None, alias="WEBHOOK_SECRET")
+    WEBHOOK_HOST: str = Field(default="0.0.0.0", alias="WEBHOOK_HOST")
+    WEBHOOK_PORT: int = Field(default=8080, alias="WEBHOOK_PORT")
+    WEBHOOK_MAX_CONCURRENCY: int = Field(default=64, alias="WEBHOOK_MAX_CONCURRENCY")
+
+    WORKER_PROCESSES: int = Field(default=1, alias="WORKER_PROCESSES")
+    UPDATE_CONCURRENCY: int = Field(default=64, alias="UPDATE_CONCURRENCY")
+    HANDLER_TIMEOUT_SECONDS: float = Field(default=20.0, alias="HANDLER_TIMEOUT_SECONDS")
+
+    SQL_TRACE: bool = Field(default=False, alias="SQL_TRACE")
+    SQL_QUERY_BUDGET: int = Field(default=20, alias="SQL_QUERY_BUDGET")
+    SQL_JOB_QUERY_BUDGET: int | None = Field(default=None, alias="SQL_JOB_QUERY_BUDGET")
+
+    PROFILE_SAMPLE_RATE: float = Field(default=0.0, alias="PROFILE_SAMPLE_RATE")
+    PROFILE_SLOW_SECONDS: float | None = Field(default=None, alias="PROFILE_SLOW_SECONDS")
+    PROFILE_DIR: str = Field(default="profiles", alias="PROFILE_DIR")
+    PROFILE_MAX_DUMPS: int = Field(default=200, alias="PROFILE_MAX_DUMPS")
+
+    METRICS_PORT: int | None = Field(default=None, alias="METRICS_PORT")
+    METRICS_HOST: str = Field(default="127.0.0.1", alias="METRICS_HOST")
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,11 +1,3 @@
-from collections import defaultdict
-
-# ================== In-memory prefs (на прод — в БД) ==================
-USER_PREFS = defaultdict(lambda: {
-    "currencies": [],  # общие
-    "categories": {"income": [], "expense": [], "asset": []},  # по режимам
-})
-
 # ================== Константы / утилиты ==================
 BASE_CURRENCIES = ["USD", "USDT", "RUB", "VND", "EUR"]
 CUR_PAGE_SIZE = 12
@@ -1,14 +1,24 @@
 from __future__ import annotations
 
 import os
+from typing import Awaitable, Callable, TypeVar
+
 from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from app.db.models import Base
+from app.db.writer import SQLiteWriter, enable_savepoints
+from app.db.tracing import attach_tracer, bind_trace
 from app.config import settings
+from app.utils.metrics import counter
 
 
 DB_URL = settings.DB_URL
+IS_SQLITE = DB_URL.startswith("sqlite")
+# In-memory SQLite у каждого соединения своя — отдельный пул чтения там бессмыслен
+SEPARATE_READ_POOL = IS_SQLITE and ":memory:" not in DB_URL
+
+T = TypeVar("T")
 
 engine = create_async_engine(
     url=settings.DB_URL,
@@ -22,16 +32,83 @@ SessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
     engine, autoflush=False, expire_on_commit=False
 )
 
+# Для SQLite читатели получают отдельный пул read-only соединений,
+# чтобы чтения не стояли в очереди за писателем
+if SEPARATE_READ_POOL:
+    read_engine = create_async_engine(
+        url=settings.DB_URL,
+        echo=False,
+        pool_pre_ping=True,
+        future=True,
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        connect_args={"check_same_thread": False} if DB_URL.startswith("sqlite+") else {},
+    )
+else:
+    read_engine = engine
+
+ReadSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
+    read_engine, autoflush=False, expire_on_commit=False
+)
+
+
+def _sqlite_common_pragmas(cur) -> None:
+    cur.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)};")
+    cur.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)};")
+    cur.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)};")
+
+
 # SQLite тюнинг: WAL + foreign_keys
 @event.listens_for(engine.sync_engine, "connect")
 def _sqlite_pragmas(dbapi_conn, connection_record):
-    if DB_URL.startswith("sqlite"):
+    if IS_SQLITE:
         cur = dbapi_conn.cursor()
         cur.execute("PRAGMA journal_mode=WAL;")
         cur.execute("PRAGMA synchronous=NORMAL;")
         cur.execute("PRAGMA foreign_keys=ON;")
+        _sqlite_common_pragmas(cur)
         cur.close()
 
+
+if SEPARATE_READ_POOL:
+    @event.listens_for(read_engine.sync_engine, "connect")
+    def _sqlite_read_pragmas(dbapi_conn, connection_record):
+        cur = dbapi_conn.cursor()
+        _sqlite_common_pragmas(cur)
+        cur.execute("PRAGMA query_only=ON;")
+        cur.close()
+
+
+DB_QUERIES = counter("db_queries_total", "SQL-запросы к БД", ["engine"])
+
+def _query_counter(name: str):
+    total = DB_QUERIES.labels(name)
+
+    def count(conn, cursor, statement, parameters, context, executemany) -> None:
+        total.inc()
+
+    return count
+
+
+event.listen(engine.sync_engine, "before_cursor_execute", _query_counter("write"))
+if read_engine is not engine:
+    event.listen(read_engine.sync_engine, "before_cursor_execute", _query_counter("read"))
+
+# Запросы апдейтов и задач считаются трассами (app/db/tracing.py): их открывают
+# UpdateMetricsMiddleware и run_exclusive, вне трассы слушатель почти ничего не стоит
+attach_tracer(engine)
+if read_engine is not engine:
+    attach_tracer(read_engine)
+
+
+writer: SQLiteWriter | None = (
+    SQLiteWriter(SessionLocal, batch_size=settings.SQLITE_WRITE_BATCH_SIZE)
+    if IS_SQLITE and settings.SQLITE_SINGLE_WRITER else None
+)
+if writer is not None:
+    # Операции пачки изолированы точками сохранения
+    enable_savepoints(engine)
+
+
 async def init_db():
     # создать папку, если надо
     if DB_URL.startswith("sqlite+"):
@@ -40,6 +117,42 @@ async def init_db():
         os.makedirs(d, exist_ok=True)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+
+def _create_missing_indexes(sync_conn) -> None:
+    # create_all создаёт индексы только вместе с новой таблицей;
+    # индексы, добавленные к уже существующим таблицам, досоздаём здесь
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+async def close_db():
+    """Дописывает очередь писателя и закрывает пулы соединений."""
+    if writer is not None:
+        await writer.stop()
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+async def get_read_session() -> AsyncSession:
+    """Сессия только для чтения (для SQLite — из отдельного read-only пула)."""
+    return ReadSessionLocal()
+
+async def run_write(fn: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    """Выполняет операцию записи `fn(session)` и коммитит её.
 
-async def get_session() -> AsyncSession:
-    return SessionLocal()
+    Для SQLite (при `SQLITE_SINGLE_WRITER`) операция уходит в очередь единственного
+    писателя и коммитится вместе с соседними операциями; для остальных БД выполняется
+    в отдельной сессии. `fn` не должна сама вызывать `commit()`.
+    """
+    fn = bind_trace(fn)
+    if writer is not None:
+        return await writer.submit(fn)
+    async with SessionLocal() as session:
+        try:
+            result = await fn(session)
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+    return result
@@ -0,0 +1,17 @@
+"""
+Диалектно-зависимые конструкции SQL.
+
+Проект работает на SQLite и PostgreSQL; у обоих есть `INSERT ... ON CONFLICT`,
+но строится он через insert() конкретного диалекта.
+"""
+from __future__ import annotations
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def dialect_insert(session: AsyncSession, model):
+    """Возвращает `insert(model)` диалекта сессии (с поддержкой `on_conflict_*`)."""
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
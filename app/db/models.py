@@ -3,7 +3,7 @@ import enum
 from datetime import datetime, timezone
 
 from sqlalchemy import (
-    BigInteger, Column, Integer, String, Numeric, DateTime, Date,
+    BigInteger, Column, Integer, String, Text, Numeric, DateTime, Date,
     ForeignKey, UniqueConstraint, Index, CheckConstraint, event
 )
 from sqlalchemy.orm import declarative_base, relationship
@@ -80,6 +80,8 @@ class Entry(Base):
     __table_args__ = (
         CheckConstraint("mode in ('income','expense','asset')", name="ck_entry_mode"),
         Index("ix_entry_user_created_at", "user_id", "created_at"),
+        # Поиск последнего значения позиции актива одним seek-ом (см. AssetPositionService)
+        Index("ix_entry_user_mode_position_created_at", "user_id", "mode", "currency_id", "category_id", "created_at"),
     )
 
 class CapitalSnapshot(Base):
@@ -135,3 +137,64 @@ class AssetLatestValues(Base):
         UniqueConstraint("user_id", "currency_code", "category_name", name="uq_asset_latest_user_currency_category"),
         Index("ix_asset_latest_user_currency_category", "user_id", "currency_code", "category_name"),
     )
+
+class ReportPreference(Base):
+    """Предпочтительное время получения регулярных отчётов пользователем."""
+    __tablename__ = "report_preferences"
+
+    user_id = Column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    local_minutes = Column(Integer, nullable=False)  # минуты от полуночи по местному времени
+    utc_offset_minutes = Column(Integer, nullable=False, default=0)  # смещение местного времени от UTC
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    user = relationship("User")
+
+class ScheduledDelivery(Base):
+    """Слот доставки регулярного отчёта пользователю в рамках одного запуска рассылки."""
+    __tablename__ = "scheduled_deliveries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_name = Column(String(64), nullable=False)  # напр. weekly_expense_report
+    run_key = Column(String(32), nullable=False)  # идентификатор запуска, напр. дата рассылки
+    user_id = Column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    due_at = Column(DateTime(timezone=True), nullable=False)
+    status = Column(String(16), nullable=False, default="pending")  # pending/sent/failed/blocked/expired
+    done_at = Column(DateTime(timezone=True), nullable=True)
+    # Аренда слота репликой: пока lease_until в будущем, слот не заберёт другая реплика
+    lease_owner = Column(String(128), nullable=True)
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+
+    user = relationship("User")
+
+    __table_args__ = (
+        UniqueConstraint("job_name", "run_key", "user_id", name="uq_scheduled_delivery_job_run_user"),
+        Index("ix_scheduled_delivery_status_due_at", "status", "due_at"),
+    )
+
+class JobRun(Base):
+    """Запуск фоновой задачи; аренда (lease) гарантирует, что его выполняет одна реплика."""
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_name = Column(String(64), nullable=False)
+    run_key = Column(String(32), nullable=False)  # идентификатор запуска, напр. дата
+    status = Column(String(16), nullable=False, default="pending")  # pending/done
+    lease_owner = Column(String(128), nullable=True)
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("job_name", "run_key", name="uq_job_run_name_key"),
+    )
+
+class FsmRecord(Base):
+    """Состояние FSM чата (форма ввода и т.п.), переживает рестарт бота."""
+    __tablename__ = "fsm_states"
+
+    key = Column(String(128), primary_key=True)  # bot:chat:user[:thread][:business][:destiny]
+    state = Column(String(64), nullable=True)
+    data = Column(Text, nullable=True)  # компактный JSON, см. app.states.storage
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,162 @@
+"""
+Трассировка SQL-запросов по апдейтам и фоновым задачам (поиск N+1).
+
+`attach_tracer(engine)` вешает слушатели `before/after_cursor_execute` на движок
+(в приложении — на оба пула в `app.db`). Запросы учитываются только внутри
+`trace_queries(...)` — его открывают `UpdateMetricsMiddleware` на каждый апдейт
+(число запросов идёт и в метрику `bot_update_db_queries`) и `run_exclusive` на
+каждый запуск задачи. Вне трассы слушатель стоит одно чтение contextvar.
+
+Трасса хранит число запросов, суммарное время и статистику по каждому тексту
+запроса: одинаковый SQL, повторённый много раз, — признак запроса в цикле. При
+`SQL_TRACE=true` трасса, в которой запросов больше бюджета (`SQL_QUERY_BUDGET`),
+пишется в лог сводкой с самыми медленными и самыми частыми запросами.
+
+В тестах число запросов проверяется через `assert_max_queries`:
+
+    attach_tracer(engine)
+    with assert_max_queries(3):
+        await handler(...)
+"""
+from __future__ import annotations
+
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Сколько запросов показывать в сводке (самых медленных и самых частых)
+SUMMARY_TOP = 3
+_STATEMENT_PREVIEW = 160
+
+_START_KEY = "sql_trace_started"
+
+
+@dataclass(slots=True)
+class _StatementStats:
+    count: int = 0
+    total: float = 0.0
+    slowest: float = 0.0
+
+
+@dataclass
+class QueryTrace:
+    """Запросы одного апдейта или запуска задачи."""
+    name: str
+    count: int = 0
+    total_seconds: float = 0.0
+    statements: Dict[str, _StatementStats] = field(default_factory=dict)
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = _StatementStats()
+        stats.count += 1
+        stats.total += seconds
+        stats.slowest = max(stats.slowest, seconds)
+
+    def slowest(self, n: int = SUMMARY_TOP) -> List[tuple]:
+        """(секунды, SQL) самых медленных запросов."""
+        top = sorted(self.statements.items(), key=lambda item: item[1].slowest, reverse=True)[:n]
+        return [(stats.slowest, sql) for sql, stats in top]
+
+    def repeated(self, n: int = SUMMARY_TOP) -> List[tuple]:
+        """(сколько раз, SQL) запросов, выполненных больше одного раза."""
+        top = sorted(self.statements.items(), key=lambda item: item[1].count, reverse=True)[:n]
+        return [(stats.count, sql) for sql, stats in top if stats.count > 1]
+
+    def summary(self) -> str:
+        lines = [f"{self.name}: {self.count} queries, {self.total_seconds * 1000:.1f} ms"]
+        for seconds, sql in self.slowest():
+            lines.append(f"  slow {seconds * 1000:.1f} ms: {_preview(sql)}")
+        for count, sql in self.repeated():
+            lines.append(f"  repeated {count}x: {_preview(sql)}")
+        return "\n".join(lines)
+
+
+def _preview(statement: str) -> str:
+    text = re.sub(r"\s+", " ", statement).strip()
+    return text if len(text) <= _STATEMENT_PREVIEW else text[:_STATEMENT_PREVIEW] + "…"
+
+
+_current: ContextVar[Optional[QueryTrace]] = ContextVar("sql_trace", default=None)
+
+
+def current_trace() -> Optional[QueryTrace]:
+    return _current.get()
+
+
+@contextmanager
+def trace_queries(name: str, budget: Optional[int] = None) -> Iterator[QueryTrace]:
+    """Собирает запросы внутри блока; при превышении `budget` пишет сводку в лог."""
+    trace = QueryTrace(name)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        if budget is not None and trace.count > budget:
+            logger.warning(f"SQL query budget {budget} exceeded by {trace.summary()}")
+
+
+@contextmanager
+def assert_max_queries(limit: int, name: str = "test") -> Iterator[QueryTrace]:
+    """Для тестов: падает, если внутри блока выполнено больше `limit` запросов."""
+    with trace_queries(name) as trace:
+        yield trace
+    assert trace.count <= limit, f"expected at most {limit} queries, got {trace.summary()}"
+
+
+def bind_trace(fn: Callable[[Any], Awaitable[T]]) -> Callable[[Any], Awaitable[T]]:
+    """Привязывает операцию записи к текущей трассе.
+
+    Операции `run_write` для SQLite выполняет отдельная задача-писатель со своим
+    контекстом; обёртка переносит в неё трассу того, кто операцию поставил.
+    """
+    trace = _current.get()
+    if trace is None:
+        return fn
+
+    async def traced(session: Any) -> T:
+        token = _current.set(trace)
+        try:
+            return await fn(session)
+        finally:
+            _current.reset(token)
+
+    return traced
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _current.get() is not None:
+        # Запросы на одном соединении идут последовательно — хватает одной отметки
+        conn.info[_START_KEY] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    trace = _current.get()
+    if trace is None:
+        return
+    started = conn.info.pop(_START_KEY, None)
+    if started is not None:
+        trace.record(statement, time.perf_counter() - started)
+
+
+def attach_tracer(engine: Any) -> None:
+    """Подключает трассировку к движку (`Engine` или `AsyncEngine`); повторный вызов ничего не делает."""
+    sync_engine: Engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,58 @@
+"""
+Версии пользовательских данных для инвалидации in-memory кэшей.
+
+Код записи помечает в сессии, чьи данные он изменил (`mark_changed`), а версия
+увеличивается только после успешного коммита. Так кэш не может сохранить значение,
+посчитанное по ещё не закоммиченным данным, под новой версией.
+
+Области (scope):
+    "assets" — позиции активов пользователя (`AssetLatestValues`).
+    "entries" — записи пользователя (`Entry`): доходы, расходы и активы.
+    "prefs" — списки валют и категорий пользователя в памяти (`app.services.prefs`);
+              меняются вне транзакций, поэтому версия увеличивается сразу (`bump`).
+"""
+from __future__ import annotations
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_INFO_KEY = "changed_versions"
+
+_versions: dict[tuple[str, int], int] = {}
+
+
+def get_version(scope: str, user_id: int) -> int:
+    """Текущая версия данных пользователя в области `scope`."""
+    return _versions.get((scope, user_id), 0)
+
+
+def bump(scope: str, user_id: int) -> None:
+    """Немедленно увеличивает версию (вне транзакции)."""
+    key = (scope, user_id)
+    _versions[key] = _versions.get(key, 0) + 1
+
+
+def mark_changed(session, scope: str, user_id: int) -> None:
+    """Отмечает изменение данных пользователя; версия вырастет после коммита сессии."""
+    session.info.setdefault(_INFO_KEY, set()).add((scope, user_id))
+
+
+def pending_changes(session) -> frozenset:
+    """Изменения, отмеченные в сессии и ещё не закоммиченные."""
+    return frozenset(session.info.get(_INFO_KEY, ()))
+
+
+def restore_changes(session, changes: frozenset) -> None:
+    """Возвращает отметки сессии к `pending_changes` (после отката точки сохранения)."""
+    session.info[_INFO_KEY] = set(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session: Session) -> None:
+    for scope, user_id in session.info.pop(_INFO_KEY, ()):
+        bump(scope, user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_INFO_KEY, None)
@@ -0,0 +1,154 @@
+"""
+Единственный писатель для SQLite.
+
+SQLite допускает только одну пишущую транзакцию одновременно, поэтому параллельные
+хендлеры, пишущие через общий пул, упираются в "database is locked". `SQLiteWriter`
+принимает операции записи в очередь и выполняет их в одной фоновой задаче, объединяя
+накопившиеся операции в один коммит (group commit).
+
+Операция записи — это корутинная функция `fn(session)`, которая только изменяет
+объекты/выполняет запросы и НЕ вызывает `commit()`: коммит выполняет писатель.
+В пачке каждая операция выполняется в своей точке сохранения (SAVEPOINT): упавшая
+откатывается одна, остальные коммитятся, и ни одна операция не выполняется дважды.
+Для этого движку нужен `enable_savepoints` (pysqlite сам транзакции не открывает).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.db.versions import pending_changes, restore_changes
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+WriteFn = Callable[[AsyncSession], Awaitable[Any]]
+
+
+def enable_savepoints(engine: AsyncEngine) -> None:
+    """Транзакции SQLite открываются явным `BEGIN`, чтобы SAVEPOINT работали.
+
+    Драйвер sqlite3 сам решает, когда начинать транзакцию, и без этого `RELEASE`
+    первой точки сохранения коммитит всю транзакцию.
+    """
+    @event.listens_for(engine.sync_engine, "connect")
+    def _autocommit_driver(dbapi_conn, connection_record):
+        dbapi_conn.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _explicit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+class SQLiteWriter:
+    """Очередь записей с одной задачей-писателем и групповыми коммитами."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], batch_size: int = 64):
+        self._session_factory = session_factory
+        self._batch_size = max(1, batch_size)
+        self._queue: asyncio.Queue[tuple[WriteFn, asyncio.Future] | None] | None = None
+        self._task: asyncio.Task | None = None
+
+    def _ensure_started(self) -> asyncio.Queue:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run(), name="sqlite-writer")
+        assert self._queue is not None
+        return self._queue
+
+    async def submit(self, fn: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        """Ставит операцию в очередь и ждёт её коммита. Возвращает результат `fn`.
+
+        `fn` выполняется ровно один раз; если она упадёт, откатятся только её изменения.
+        """
+        queue = self._ensure_started()
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        await queue.put((fn, fut))
+        return await fut
+
+    async def stop(self) -> None:
+        """Дописывает очередь и останавливает задачу-писателя."""
+        if self._task is None or self._task.done():
+            return
+        assert self._queue is not None
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        while True:
+            job = await self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            stop = False
+            while len(batch) < self._batch_size:
+                try:
+                    nxt = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+
+            try:
+                await self._commit_batch(batch)
+            except Exception:
+                logger.exception("SQLite writer batch failed")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(RuntimeError("SQLite writer batch failed"))
+            if stop:
+                return
+
+    async def _commit_batch(self, batch: list[tuple[WriteFn, asyncio.Future]]) -> None:
+        if len(batch) == 1:
+            fn, fut = batch[0]
+            await self._run_single(fn, fut)
+            return
+
+        done: list[tuple[asyncio.Future, Any]] = []
+        async with self._session_factory() as session:
+            for fn, fut in batch:
+                changes = pending_changes(session)
+                try:
+                    async with session.begin_nested():
+                        result = await fn(session)
+                except Exception as e:
+                    # Откатилась только точка сохранения этой операции; её отметки версий тоже снимаем
+                    restore_changes(session, changes)
+                    if not fut.done():
+                        fut.set_exception(e)
+                    continue
+                done.append((fut, result))
+            try:
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                for fut, _ in done:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+
+        for fut, result in done:
+            if not fut.done():
+                fut.set_result(result)
+
+    async def _run_single(self, fn: WriteFn, fut: asyncio.Future) -> None:
+        async with self._session_factory() as session:
+            try:
+                result = await fn(session)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                if not fut.done():
+                    fut.set_exception(e)
+                return
+        if not fut.done():
+            fut.set_result(result)
@@ -2,10 +2,13 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy import select
 
-from app.db import get_session
+from app.db import get_read_session
 from app.db.models import Entry
+from app.db.versions import get_version
 from app.states.form import FormState
-from app.utils.formatting import fmt_money_str, currencies_for_user, categories_for_user
+from app.utils.cache import LRUCache
+from app.services.prefs import prefs_cache
+from app.utils.formatting import fmt_money_str
 from app.constants.constants import MODE_META, CAT_PAGE_SIZE, CUR_PAGE_SIZE
 
 
@@ -21,7 +24,20 @@ def render_card(st: FormState) -> str:
         "Сначала введи сумму, затем выбери валюту и категорию. Можно переходить между вкладками."
     )
 
-# ================== Клавиатуры (без изменений) ==================
+# ================== Кэш клавиатур ==================
+# Клавиатура суммы зависит только от режима и наличия описания — строим все варианты
+# один раз. Страницы валют/категорий кэшируются по версии списков пользователя
+# (область "prefs" в `app.db.versions`; её увеличивает `app.services.prefs`).
+KB_PAGE_CACHE_MAX_ITEMS = 4096
+
+_page_cache = LRUCache(max_items=KB_PAGE_CACHE_MAX_ITEMS, name="keyboards")
+
+
+def _selected_key(value: str | None) -> str | None:
+    return value.lower() if value else None
+
+
+# ================== Клавиатуры ==================
 def kb_mode_tabs(st: FormState) -> list[InlineKeyboardButton]:
     def lab(m):
         meta = MODE_META[m]
@@ -30,6 +46,9 @@ def kb_mode_tabs(st: FormState) -> list[InlineKeyboardButton]:
     return [lab("expense"), lab("income"), lab("asset")]
 
 def kb_amount_tab(st: FormState) -> InlineKeyboardMarkup:
+    return _AMOUNT_TABS[(st.mode, bool(st.note))]
+
+def _build_amount_tab(st: FormState) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.row(*kb_mode_tabs(st))
     for row in [["1","2","3"],["4","5","6"],["7","8","9"],[".","0","⌫"]]:
@@ -50,15 +69,29 @@ def kb_amount_tab(st: FormState) -> InlineKeyboardMarkup:
     kb.row(InlineKeyboardButton(text="✅ Подтвердить", callback_data="submit"))
     return kb.as_markup()
 
+_AMOUNT_TABS = {
+    (mode, has_note): _build_amount_tab(FormState(mode=mode, note="✓" if has_note else None))
+    for mode in MODE_META
+    for has_note in (False, True)
+}
+
 def kb_currency_tab(user_id: int, st: FormState) -> InlineKeyboardMarkup:
+    key = ("cur", user_id, get_version("prefs", user_id), st.cur_page, _selected_key(st.currency), bool(st.note))
+    markup = _page_cache.get(key)
+    if markup is None:
+        markup = _build_currency_tab(user_id, st)
+        _page_cache.put(key, markup)
+    return markup
+
+def _build_currency_tab(user_id: int, st: FormState) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    all_cur = currencies_for_user(user_id)
+    all_cur = prefs_cache.get(user_id).currencies.merged()
     start = st.cur_page * CUR_PAGE_SIZE
     chunk = all_cur[start:start+CUR_PAGE_SIZE]
     row_buf = []
-    for i, c in enumerate(chunk, 1):
+    for i, (c, token) in enumerate(chunk, 1):
         mark = " ✅" if st.currency and st.currency.lower()==c.lower() else ""
-        row_buf.append(InlineKeyboardButton(text=c+mark, callback_data=f"cur:set:{c}"))
+        row_buf.append(InlineKeyboardButton(text=c+mark, callback_data=f"cur:set:{token}"))
         if i % 4 == 0:
             kb.row(*row_buf); row_buf = []
     if row_buf: kb.row(*row_buf)
@@ -83,14 +116,25 @@ def kb_currency_tab(user_id: int, st: FormState) -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 def kb_category_tab(user_id: int, st: FormState) -> InlineKeyboardMarkup:
+    key = (
+        "cat", user_id, get_version("prefs", user_id), st.mode, st.cat_page,
+        _selected_key(st.category), bool(st.note),
+    )
+    markup = _page_cache.get(key)
+    if markup is None:
+        markup = _build_category_tab(user_id, st)
+        _page_cache.put(key, markup)
+    return markup
+
+def _build_category_tab(user_id: int, st: FormState) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    all_cat = categories_for_user(user_id, st.mode)
+    all_cat = prefs_cache.get(user_id).items(st.mode).merged()
     start = st.cat_page * CAT_PAGE_SIZE
     chunk = all_cat[start:start+CAT_PAGE_SIZE]
     row_buf = []
-    for i, t in enumerate(chunk, 1):
+    for i, (t, token) in enumerate(chunk, 1):
         mark = " ✅" if st.category and st.category.lower()==t.lower() else ""
-        row_buf.append(InlineKeyboardButton(text=t+mark, callback_data=f"cat:set:{st.mode}:{t}"))
+        row_buf.append(InlineKeyboardButton(text=t+mark, callback_data=f"cat:set:{st.mode}:{token}"))
         if i % 3 == 0:
             kb.row(*row_buf); row_buf = []
     if row_buf: kb.row(*row_buf)
@@ -114,12 +158,13 @@ def kb_category_tab(user_id: int, st: FormState) -> InlineKeyboardMarkup:
     kb.row(InlineKeyboardButton(text="✅ Подтвердить", callback_data="submit"))
     return kb.as_markup()
 
-def kb_manage_list(items: list[str], kind: str, mode: str | None = None, page: int = 0, page_size: int = 12) -> InlineKeyboardMarkup:
+def kb_manage_list(items: list[tuple[str, str]], kind: str, mode: str | None = None, page: int = 0, page_size: int = 12) -> InlineKeyboardMarkup:
+    """Экран удаления своих значений; `items` — пары (значение, токен для callback_data)."""
     kb = InlineKeyboardBuilder()
     start = page*page_size; chunk = items[start:start+page_size]
     row_buf = []
-    for i, it in enumerate(chunk, 1):
-        cb = f"mg:cur:del:{it}" if kind=="cur" else f"mg:cat:{mode}:del:{it}"
+    for i, (it, token) in enumerate(chunk, 1):
+        cb = f"mg:cur:del:{token}" if kind=="cur" else f"mg:cat:{mode}:del:{token}"
         row_buf.append(InlineKeyboardButton(text=f"❌ {it}", callback_data=cb))
         if i % 3 == 0:
             kb.row(*row_buf); row_buf=[]
@@ -149,7 +194,7 @@ async def build_entry_actions_kb(user_id: int, entry_id: int) -> InlineKeyboardM
     Возвращает клавиатуру с кнопками Удалить/Изменить,
     только если entry_id входит в последние 10 записей пользователя.
     """
-    async with await get_session() as session:
+    async with await get_read_session() as session:
         last_ids = (await session.scalars(
             select(Entry.id)
             .where(Entry.user_id == user_id)
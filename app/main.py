@@ -2,15 +2,125 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 
-from app.db import init_db
+from app.db import IS_SQLITE, init_db, close_db
 from app.config import settings
 from app.routers.entries import r as entries_router
-from app.scheduler.scheduler import schedule_report_dispatch, schedule_monthly_snapshots
+from app.routers.report_settings import report_settings_router
+from app.scheduler.scheduler import (
+    schedule_staggered_report_dispatch,
+    schedule_monthly_snapshots,
+    schedule_job_recovery,
+)
 from app.routers.analytics.expenses_router import expenses_router
 from app.routers.analytics.incomes_router import incomes_router
-from app.services.analytics.expense.expense_reports import build_report
+from app.services.analytics.expense.expense_reports import build_report, build_reports_batch
 from app.routers.analytics.asset_router import asset_router
 from app.utils.alerts import setup_alert_logging
+from app.states.storage import DbStorage
+from app.middlewares.fsm_flush import FsmFlushMiddleware
+from app.middlewares.serial import SerialUpdateMiddleware, HandlerTimeoutMiddleware
+from app.middlewares.metrics import UpdateMetricsMiddleware, HandlerMetricsMiddleware
+from app.middlewares.profiling import ProfilingMiddleware
+from app.utils.metrics import start_metrics_server
+from app.webhook import run_webhook
+from app.sharding import ShardPool, poll_to_pool
+from app.utils.rate_limit import install_rate_limiter
+
+
+def build_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми роутерами и FSM storage в БД."""
+    # Состояние форм хранится в БД и переживает рестарт; пишется раз за апдейт
+    storage = DbStorage()
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Апдейты пользователя — по очереди (FSM пишется внутри его очереди), разных — параллельно
+    dp.update.outer_middleware(SerialUpdateMiddleware())
+    dp.update.outer_middleware(FsmFlushMiddleware(storage))
+    # Inner-middleware диспетчера действуют и на обработчики вложенных роутеров
+    timeouts = HandlerTimeoutMiddleware()
+    dp.message.middleware(HandlerMetricsMiddleware("message"))
+    dp.callback_query.middleware(HandlerMetricsMiddleware("callback_query"))
+    if settings.PROFILE_SAMPLE_RATE or settings.PROFILE_SLOW_SECONDS:
+        # Снаружи таймаута: прерванный по таймауту обработчик тоже попадает в профиль
+        profiler = ProfilingMiddleware()
+        dp.message.middleware(profiler)
+        dp.callback_query.middleware(profiler)
+    dp.message.middleware(timeouts)
+    dp.callback_query.middleware(timeouts)
+
+    # Регистрируем роутеры в нужном порядке
+    dp.include_router(router=entries_router)
+    dp.include_router(router=expenses_router)
+    dp.include_router(router=incomes_router)
+    dp.include_router(router=asset_router)
+    dp.include_router(router=report_settings_router)
+    return dp
+
+
+def build_worker_dispatcher() -> Dispatcher:
+    """Диспетчер процесса-воркера (`WORKER_PROCESSES` > 1): сам поднимает и закрывает БД."""
+    setup_alert_logging()
+    dp = build_dispatcher()
+    dp.startup.register(init_db)
+    dp.startup.register(_install_worker_rate_limiter)
+    # Storage закрывает сам диспетчер (`fsm.close`), БД закрываем после него
+    dp.shutdown.register(close_db)
+    if settings.METRICS_PORT:
+        _register_worker_metrics(dp)
+    return dp
+
+
+def _register_worker_metrics(dp: Dispatcher) -> None:
+    # Обработчики, роутеры и SQL считаются в воркерах: каждый отдаёт свои метрики
+    # на METRICS_PORT + 1 + номер воркера, основной процесс — на METRICS_PORT
+    runners = []
+
+    async def start_metrics(worker_index: int) -> None:
+        port = settings.METRICS_PORT + 1 + worker_index
+        runners.append(await start_metrics_server(settings.METRICS_HOST, port))
+
+    async def stop_metrics() -> None:
+        for runner in runners:
+            await runner.cleanup()
+
+    dp.startup.register(start_metrics)
+    dp.shutdown.register(stop_metrics)
+
+
+def _check_worker_processes() -> None:
+    """Пул воркеров и SQLite.
+
+    У каждого воркера своя очередь писателя (`app.db.writer`), и с `WORKER_PROCESSES` > 1
+    в файл SQLite снова пишут несколько процессов сразу. С `SQLITE_SINGLE_WRITER`
+    такой запуск отклоняем; если писатель выключен, только предупреждаем —
+    записи разных процессов будут ждать друг друга на блокировке (`SQLITE_BUSY_TIMEOUT_MS`).
+    """
+    if settings.WORKER_PROCESSES <= 1 or not IS_SQLITE:
+        return
+    if settings.SQLITE_SINGLE_WRITER:
+        raise RuntimeError(
+            "WORKER_PROCESSES > 1 is not supported with SQLite and SQLITE_SINGLE_WRITER: "
+            "every worker would run its own writer; use a server database or WORKER_PROCESSES=1"
+        )
+    logging.warning(
+        f"WORKER_PROCESSES={settings.WORKER_PROCESSES} with SQLite: "
+        f"{settings.WORKER_PROCESSES + 1} processes will write the database concurrently"
+    )
+
+
+def _rate_limit_share() -> float:
+    """Доля глобального лимита Telegram на процесс.
+
+    Лимит общий для бота, а отправляют и воркеры (ответы пользователям), и основной
+    процесс (рассылка отчётов) — делим его на `WORKER_PROCESSES` + 1.
+    """
+    if settings.WORKER_PROCESSES > 1:
+        return 1 / (settings.WORKER_PROCESSES + 1)
+    return 1.0
+
+
+async def _install_worker_rate_limiter(bot: Bot) -> None:
+    install_rate_limiter(bot, share=_rate_limit_share())
 
 
 async def main() -> None:
@@ -21,38 +131,66 @@ async def main() -> None:
       2. Запуск Telegram-бота с токеном из настроек.
       3. Создание и настройку диспетчера (`Dispatcher`).
       4. Подключение всех роутеров (например, `entries_router`) для обработки команд и событий.
-      5. Запуск цикла обработки сообщений (`start_polling`).
+      5. Запуск цикла обработки сообщений (`start_polling` или webhook-сервер, см. `BOT_MODE`);
+         при `WORKER_PROCESSES` > 1 апдейты обрабатывают процессы-воркеры (`app.sharding`).
 
     Эта функция вызывается при запуске проекта, когда скрипт
     запускается напрямую (`python main.py`).
     """
     # Включаем алерты в Telegram для ошибок
     setup_alert_logging()
+    _check_worker_processes()
 
     await init_db()
     bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-    dp = Dispatcher()
-
-    # Регистрируем роутеры в нужном порядке
-    dp.include_router(router=entries_router)
-    dp.include_router(router=expenses_router)
-    dp.include_router(router=incomes_router)
-    dp.include_router(router=asset_router)
-    schedule_report_dispatch(
+    # Все запросы к Bot API идут через лимиты Telegram с повторами после RetryAfter
+    install_rate_limiter(bot, share=_rate_limit_share())
+    dp = build_dispatcher()
+    storage = dp.fsm.storage
+    # Рассылки и снэпшоты планируются только здесь, в основном процессе
+    schedule_staggered_report_dispatch(
         bot=bot,
         report_fn=build_report,
-        cron="0 9 * * MON",  # Каждый понедельник в 09:00 по UTC
+        batch_fn=build_reports_batch,
+        cron="0 9 * * MON",  # Каждый понедельник с 09:00 по UTC, в течение REPORT_WINDOW_MINUTES
+        job_name="weekly_expense_report",
         report_name="📊 Weekly expense report"
     )
     
     # Планируем автоматические снэпшоты капитала
     schedule_monthly_snapshots()
 
+    # Доделываем запуски задач, брошенные упавшими репликами
+    schedule_job_recovery()
+
+    # Метрики в формате Prometheus на локальном порту (в режиме пула воркеры — на следующих портах)
+    metrics_runner = None
+    if settings.METRICS_PORT:
+        metrics_runner = await start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT)
+
+    # Несколько воркеров: этот процесс только принимает апдейты и раскладывает их по user_id
+    pool = None
+    if settings.WORKER_PROCESSES > 1:
+        pool = ShardPool(settings.WORKER_PROCESSES, build_worker_dispatcher, settings.TELEGRAM_BOT_TOKEN)
+        pool.start()
+
     try:
-        await dp.start_polling(bot)
+        if settings.BOT_MODE == "webhook":
+            await run_webhook(dp, bot, feed=pool.feed_update if pool else None)
+        elif pool is not None:
+            await poll_to_pool(bot, pool, dp.resolve_used_update_types())
+        else:
+            await dp.start_polling(bot)
     except Exception:
-        logging.exception("Bot polling crashed")
+        logging.exception(f"Bot {settings.BOT_MODE} crashed")
         raise
+    finally:
+        if pool is not None:
+            pool.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await storage.close()
+        await close_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
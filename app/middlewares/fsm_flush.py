@@ -0,0 +1,42 @@
+"""
+Запись состояния FSM в БД после обработки апдейта.
+
+Обработчики могут вызывать `state.update_data` несколько раз — `DbStorage` копит
+изменения в памяти, а эта middleware пишет их одной записью, когда апдейт обработан
+(в том числе с ошибкой).
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.types import TelegramObject
+
+from app.states.storage import DbStorage
+
+logger = logging.getLogger(__name__)
+
+
+class FsmFlushMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: после обработчика сбрасывает изменения FSM в БД."""
+
+    def __init__(self, storage: DbStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            state: FSMContext | None = data.get("state")
+            if state is not None:
+                try:
+                    await self.storage.flush(state.key)
+                except Exception:
+                    logger.exception(f"Failed to save FSM state for chat {state.key.chat_id}")
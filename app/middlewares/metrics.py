@@ -0,0 +1,90 @@
+"""
+Метрики обработки апдейтов.
+
+`UpdateMetricsMiddleware` (outer, на апдейтах) замеряет полное время обработки
+апдейта и число SQL-запросов, которые он сделал (включая записи через `run_write`):
+запросы собирает трасса `app.db.tracing`. При `SQL_TRACE` трасса апдейта, вышедшего
+за `SQL_QUERY_BUDGET`, пишется в лог. `HandlerMetricsMiddleware`
+(inner, на сообщениях и callback-запросах) замеряет время обработчика с разбивкой
+по роутеру, в котором он объявлен, и считает его ошибки.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.config import settings
+from app.db.tracing import trace_queries
+from app.utils.metrics import counter, histogram
+
+UPDATE_SECONDS = histogram("bot_update_seconds", "Полное время обработки апдейта")
+UPDATE_DB_QUERIES = histogram(
+    "bot_update_db_queries", "SQL-запросов на один апдейт",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+HANDLER_SECONDS = histogram("bot_handler_seconds", "Время работы обработчика", ["router", "event"])
+HANDLER_ERRORS = counter("bot_handler_errors_total", "Исключения из обработчиков", ["router", "event"])
+
+
+def _trace_name(update: Update) -> str:
+    try:
+        event_type = update.event_type
+    except Exception:
+        event_type = "unknown"
+    name = f"update {update.update_id} ({event_type})"
+    text = update.message.text if update.message is not None else None
+    if text and text.startswith("/"):
+        name += f" {text.split()[0]}"
+    elif update.callback_query is not None and update.callback_query.data:
+        name += f" {update.callback_query.data.split(':')[0]}"
+    return name
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: время обработки и число SQL-запросов."""
+
+    def __init__(self, query_budget: Optional[int] = None):
+        if query_budget is None and settings.SQL_TRACE:
+            query_budget = settings.SQL_QUERY_BUDGET
+        self.query_budget = query_budget
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        with trace_queries(_trace_name(event), budget=self.query_budget) as trace:
+            try:
+                return await handler(event, data)
+            finally:
+                UPDATE_SECONDS.observe(time.perf_counter() - started)
+                UPDATE_DB_QUERIES.observe(trace.count)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: время и ошибки обработчиков по роутерам."""
+
+    def __init__(self, event_name: str):
+        self.event_name = event_name
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        router = data.get("event_router")
+        labels = (router.name if router is not None else "unknown", self.event_name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(*labels).inc()
+            raise
+        finally:
+            HANDLER_SECONDS.labels(*labels).observe(time.perf_counter() - started)
@@ -0,0 +1,30 @@
+"""
+Загрузка списков валют и категорий пользователя перед обработчиками формы.
+
+Клавиатуры формы строятся синхронно и читают списки из `prefs_cache`, поэтому
+перед обработчиком списки должны быть в памяти. После рестарта они подгружаются
+здесь одним запросом при первом же действии пользователя, без `/start`.
+"""
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.services.prefs import prefs_cache
+
+
+class PrefsMiddleware(BaseMiddleware):
+    """Inner-middleware роутера: гарантирует, что списки пользователя загружены."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None:
+            await prefs_cache.load(user.id)
+        return await handler(event, data)
@@ -0,0 +1,125 @@
+"""
+Профилирование обработчиков (включается `PROFILE_SAMPLE_RATE` или `PROFILE_SLOW_SECONDS`).
+
+`ProfilingMiddleware` профилирует случайную долю `PROFILE_SAMPLE_RATE` обработчиков
+целиком, а обработчики дольше `PROFILE_SLOW_SECONDS` — начиная с этого порога.
+Профиль снимает `app.utils.profiler.Sampler` и пишет его в `PROFILE_DIR` в формате
+folded stacks:
+
+    profiles/list_assets-u17-20250101T120000-2300ms.folded
+
+В имени — обработчик, корзина пользователя (не сам user_id) и длительность.
+Хранятся только последние `PROFILE_MAX_DUMPS` профилей, старые удаляются.
+Флеймграф: `flamegraph.pl profiles/*.folded > flame.svg` или speedscope.
+
+Непрофилируемый обработчик стоит одного `random()` и таймера `call_later`.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.config import settings
+from app.utils.profiler import Sampler, TaskProfile
+
+logger = logging.getLogger(__name__)
+
+# На сколько корзин раскладываются пользователи в именах файлов
+USER_BUCKETS = 64
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Inner-middleware: профилирует часть обработчиков и все медленные."""
+
+    def __init__(
+        self,
+        sample_rate: Optional[float] = None,
+        slow_seconds: Optional[float] = None,
+        directory: Optional[str] = None,
+        sampler: Optional[Sampler] = None,
+        max_dumps: Optional[int] = None,
+    ):
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.slow_seconds = settings.PROFILE_SLOW_SECONDS if slow_seconds is None else slow_seconds
+        self.directory = settings.PROFILE_DIR if directory is None else directory
+        self.max_dumps = settings.PROFILE_MAX_DUMPS if max_dumps is None else max_dumps
+        self.sampler = sampler or Sampler()
+        self.dumps = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        sampled = random.random() < self.sample_rate
+        if not sampled and not self.slow_seconds:
+            return await handler(event, data)
+
+        task = asyncio.current_task()
+        profile: Optional[TaskProfile] = None
+        timer: Optional[asyncio.TimerHandle] = None
+
+        def start() -> None:
+            nonlocal profile
+            profile = self.sampler.start(task, _ROOT_CODE)
+
+        if sampled:
+            start()
+        else:
+            timer = asyncio.get_running_loop().call_later(self.slow_seconds, start)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if profile is not None:
+                self.sampler.stop(profile)
+                await self._dump(profile, data, time.perf_counter() - started)
+
+    async def _dump(self, profile: TaskProfile, data: Dict[str, Any], elapsed: float) -> None:
+        handler_obj = data.get("handler")
+        name = getattr(handler_obj.callback, "__name__", "handler") if handler_obj is not None else "handler"
+        if not profile.samples:
+            logger.debug(f"Profile of {name} has no samples ({elapsed:.3f}s)")
+            return
+        user = data.get("event_from_user")
+        bucket = zlib.crc32(str(user.id).encode()) % USER_BUCKETS if user is not None else 0
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(self.directory, f"{name}-u{bucket:02d}-{stamp}-{elapsed * 1000:.0f}ms.folded")
+        try:
+            # Диск не трогаем из event loop
+            await asyncio.to_thread(self._write, path, profile.folded())
+        except OSError:
+            logger.exception(f"Failed to write profile {path}")
+            return
+        self.dumps += 1
+        logger.info(f"Profile of {name} ({elapsed:.2f}s, {profile.total} samples) written to {path}")
+
+    def _write(self, path: str, text: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        # Оставляем только последние `max_dumps` профилей
+        dumps = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".folded")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in dumps[:max(len(dumps) - self.max_dumps, 0)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+# Стеки в профиле начинаются с того, что вызвано из этой middleware
+_ROOT_CODE = ProfilingMiddleware.__call__.__code__
@@ -0,0 +1,124 @@
+"""
+Порядок и параллельность обработки апдейтов.
+
+`SerialUpdateMiddleware` выполняет апдейты одного пользователя строго по очереди
+(в порядке поступления), а апдейты разных пользователей — параллельно, но не больше
+`UPDATE_CONCURRENCY` одновременно. Так два быстрых нажатия не читают и не пишут
+`FormState` наперегонки, а пропускная способность растёт с числом пользователей.
+
+`HandlerTimeoutMiddleware` ограничивает время работы обработчика: по умолчанию
+`HANDLER_TIMEOUT_SECONDS`, для отдельных обработчиков — флагом `timeout`:
+
+    @router.message(F.text == "/list_assets", flags={"timeout": 60})
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_TEXT = "⏳ Не получилось ответить вовремя, попробуйте ещё раз."
+
+
+@dataclass(slots=True)
+class _UserQueue:
+    """Очередь апдейтов пользователя: asyncio.Lock пропускает ожидающих по порядку."""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    size: int = 0
+
+
+class SerialUpdateMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: по очереди внутри пользователя, параллельно между пользователями."""
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self._slots = asyncio.Semaphore(max_concurrency or settings.UPDATE_CONCURRENCY)
+        self._queues: Dict[int, _UserQueue] = {}
+        self.active = 0
+
+    @property
+    def queued(self) -> int:
+        """Сколько апдейтов ждёт или выполняется сейчас."""
+        return sum(q.size for q in self._queues.values())
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        key = user.id if user is not None else chat.id if chat is not None else None
+        if key is None:
+            return await self._run(handler, event, data)
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _UserQueue()
+        queue.size += 1
+        try:
+            # Сначала очередь пользователя, потом общий слот: ожидающий своей
+            # очереди апдейт не занимает слот у других пользователей
+            async with queue.lock:
+                return await self._run(handler, event, data)
+        finally:
+            queue.size -= 1
+            if queue.size == 0:
+                del self._queues[key]
+
+    async def _run(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self._slots:
+            self.active += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.active -= 1
+
+
+class HandlerTimeoutMiddleware(BaseMiddleware):
+    """Inner-middleware: прерывает обработчик, превысивший свой бюджет времени."""
+
+    def __init__(self, default: Optional[float] = None):
+        self.default = settings.HANDLER_TIMEOUT_SECONDS if default is None else default
+        self.timeouts = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        budget = get_flag(data, "timeout", default=self.default)
+        if not budget:
+            return await handler(event, data)
+
+        try:
+            async with asyncio.timeout(budget) as deadline:
+                return await handler(event, data)
+        except TimeoutError:
+            # TimeoutError изнутри обработчика (например, от HTTP-клиента) — не наш
+            if not deadline.expired():
+                raise
+        self.timeouts += 1
+        handler_obj = data.get("handler")
+        name = getattr(handler_obj.callback, "__name__", "handler") if handler_obj is not None else "handler"
+        logger.warning(f"Handler {name} exceeded its {budget}s budget")
+        try:
+            await event.answer(TIMEOUT_TEXT)
+        except Exception:
+            logger.exception(f"Failed to report timeout of {name}")
+        return None
@@ -3,12 +3,16 @@ from decimal import Decimal
 from datetime import datetime, timezone
 from typing import List, Optional
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, literal, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.models import User, Currency, Category, Entry
+from app.db.models import User, Currency, Category, Entry, ReportPreference
+from app.db.versions import mark_changed
 from app.services.asset_service import AssetService
 
+# Функции записи только flush-ат изменения: коммит делает вызывающая сторона
+# (обычно `app.db.run_write`, который для SQLite объединяет записи в один коммит).
+
 # users
 async def ensure_user(session: AsyncSession, user_id: int, username: Optional[str]) -> None:
     u = (await session.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
@@ -16,7 +20,7 @@ async def ensure_user(session: AsyncSession, user_id: int, username: Optional[st
         session.add(User(id=user_id, username=username))
     else:
         u.username = username or u.username
-    await session.commit()
+    await session.flush()
 
 # currencies
 async def add_custom_currency(session: AsyncSession, user_id: int, code: str) -> None:
@@ -28,7 +32,7 @@ async def add_custom_currency(session: AsyncSession, user_id: int, code: str) ->
     )).scalar_one_or_none()
     if exists is None:
         session.add(Currency(user_id=user_id, code=code))
-        await session.commit()
+        await session.flush()
 
 async def list_user_currencies(session: AsyncSession, user_id: int) -> List[str]:
     # Сортируем по last_used_at DESC (последние использованные сначала), затем по id DESC
@@ -61,7 +65,7 @@ async def add_custom_category(session: AsyncSession, user_id: int, mode: str, na
     )).scalar_one_or_none()
     if exists is None:
         session.add(Category(user_id=user_id, mode=mode, name=name))
-        await session.commit()
+        await session.flush()
 
 async def list_user_categories(session: AsyncSession, user_id: int, mode: str) -> List[str]:
     # Сортируем по last_used_at DESC (последние использованные сначала), затем по id DESC
@@ -93,6 +97,7 @@ async def add_entry(
     currency_code: str,
     category_name: str | None,
     note: str | None = None,
+    rate_to_usd: float | None = None,
 ) -> int:
     # ensure currency
     cur = (await session.execute(
@@ -103,6 +108,7 @@ async def add_entry(
         session.add(cur)
         await session.flush()
 
+    cat = None
     cat_id = None
     if category_name:
         cat = (await session.execute(
@@ -116,6 +122,7 @@ async def add_entry(
 
     entry = Entry(user_id=user_id, mode=mode, amount=amount, currency_id=cur.id, category_id=cat_id, note=note)
     session.add(entry)
+    mark_changed(session, "entries", user_id)
     await session.flush()  # Используем flush для получения ID
     
     # Обновляем last_used_at для валюты и категории при сохранении записи
@@ -126,19 +133,52 @@ async def add_entry(
     # Если это актив, обновляем последние значения и сохраняем курсы
     if mode == "asset":
         analytics_service = AssetService(session)
-        await analytics_service.update_latest_asset_value(user_id, currency_code, category_name, amount, entry.id)
-        await analytics_service.save_current_rates(currency_code)
-    
-    await session.commit()
+        await analytics_service.update_latest_asset_value(user_id, cur.code, cat.name if cat else None, amount, entry.id)
+        await analytics_service.save_current_rates(currency_code, rate_to_usd)
+
+    await session.flush()
     return entry.id
 
+# report preferences
+async def set_report_time(
+    session: AsyncSession, user_id: int, local_minutes: Optional[int], utc_offset_minutes: int = 0
+) -> None:
+    """Сохраняет время получения отчётов; `local_minutes=None` сбрасывает на слот по умолчанию."""
+    pref = await session.get(ReportPreference, user_id)
+    if local_minutes is None:
+        if pref is not None:
+            await session.delete(pref)
+    elif pref is None:
+        session.add(ReportPreference(user_id=user_id, local_minutes=local_minutes, utc_offset_minutes=utc_offset_minutes))
+    else:
+        pref.local_minutes = local_minutes
+        pref.utc_offset_minutes = utc_offset_minutes
+        pref.updated_at = datetime.now(timezone.utc)
+    await session.flush()
+
 # snapshot для прогрева in-memory клавиатур
 async def get_user_prefs_snapshot(session: AsyncSession, user_id: int) -> dict:
-    return {
-        "currencies": await list_user_currencies(session, user_id),
-        "categories": {
-            "income": await list_user_categories(session, user_id, "income"),
-            "expense": await list_user_categories(session, user_id, "expense"),
-            "asset":  await list_user_categories(session, user_id, "asset"),
-        }
-    }
+    """Валюты и категории пользователя (последние использованные сначала) одним запросом.
+
+    Значения списков — пары (имя, id строки).
+    """
+    prefs = union_all(
+        select(literal("currency").label("kind"), Currency.code.label("name"),
+               Currency.last_used_at.label("last_used_at"), Currency.id.label("id"))
+        .where(Currency.user_id == user_id),
+        select(Category.mode.label("kind"), Category.name.label("name"),
+               Category.last_used_at.label("last_used_at"), Category.id.label("id"))
+        .where(Category.user_id == user_id),
+    ).subquery()
+    rows = (await session.execute(
+        select(prefs.c.kind, prefs.c.name, prefs.c.id)
+        .order_by(prefs.c.last_used_at.desc().nulls_last(), prefs.c.id.desc())
+    )).all()
+
+    snapshot = {"currencies": [], "categories": {"income": [], "expense": [], "asset": []}}
+    for kind, name, row_id in rows:
+        if kind == "currency":
+            snapshot["currencies"].append((name, row_id))
+        else:
+            snapshot["categories"].setdefault(kind, []).append((name, row_id))
+    return snapshot
@@ -1,22 +1,32 @@
 from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
 import logging
-from datetime import datetime, timedelta, timezone
-from sqlalchemy import text
+from datetime import date, datetime, timedelta, timezone
 
-from app.db import get_session
+from app.db import get_read_session, run_write
 from app.utils.reports import (
     report_for_assets,
     report_asset_growth,
     report_asset_snapshot_created,
     report_assets_detailed_list,
     report_asset_no_history,
+    report_capital_history,
 )
 from app.utils.formatting import fmt_money_str
 from app.services.asset_service import AssetService
-from app.services.analytics.asset.asset_analytics import get_growth_data, compute_totals_usd_rub
+from app.services.snapshot_service import SnapshotService
+from app.services.report_cache import report_cache
+from app.services.analytics.asset.asset_analytics import get_growth_data, get_assets_overview
+from app.services.analytics.asset.capital_series import CapitalSeriesService, build_date_grid
 
-asset_router = Router()
+asset_router = Router(name="asset_router")
+
+CAPITAL_HISTORY_DEFAULT_MONTHS = 12
+CAPITAL_HISTORY_MAX_MONTHS = 24
+
+# Обработчики, которые ходят за котировками (MOEX, криптобиржи): бюджет больше обычного
+SLOW_HANDLER = {"timeout": 60}
 
 
 @asset_router.message(F.text == "/get_asset")
@@ -25,12 +35,8 @@ async def get_asset(message: Message):
 
     user_id = message.from_user.id
     
-    async with await get_session() as session:
+    async with await get_read_session() as session:
         try:
-            # Принудительно синхронизируемся с БД для SQLite WAL режима
-            if hasattr(session.bind, 'sync_engine') and 'sqlite' in str(session.bind.url):
-                await session.execute(text("SELECT 1"))  # Принудительная синхронизация с WAL
-            
             service = AssetService(session)
             capital = await service.get_current_capital(user_id, ["RUB", "USD"])
             
@@ -54,7 +60,7 @@ async def grow_asset(message: Message):
     """Обработчик команды /grow_asset: выводит рост капитала по сравнению с предыдущим месяцем."""
 
     user_id = message.from_user.id
-    async with await get_session() as session:
+    async with await get_read_session() as session:
         service = AssetService(session)
         
         try:
@@ -76,59 +82,88 @@ async def grow_asset(message: Message):
             await message.answer(f"❌ Ошибка при расчёте роста капитала")
 
 
-@asset_router.message(F.text == "/snapshot_asset")
+@asset_router.message(F.text == "/snapshot_asset", flags=SLOW_HANDLER)
 async def create_snapshot(message: Message):
     """Обработчик команды /snapshot_asset: создаёт снэпшот текущего капитала."""
     
     user_id = message.from_user.id
-    async with await get_session() as session:
-        service = AssetService(session)
-        
-        try:
-            success = await service.create_monthly_snapshot(user_id)
+    today = date.today()
 
-            if not success:
+    try:
+        # Капитал и котировки считаем на сессии чтения, в очередь писателя уходит только вставка
+        async with await get_read_session() as session:
+            service = AssetService(session)
+            if await service.has_snapshot(user_id, today):
                 await message.answer("📸 Снэпшот уже существует для этой даты.")
                 return
+            capital = await service.get_capital_for_date(user_id, today, ["USD", "RUB"])
 
-            capital = await service.get_current_capital(user_id, ["RUB", "USD"])
-            text = report_asset_snapshot_created(capital)
-            await message.answer(text)
+        created = await run_write(lambda session: SnapshotService.save_snapshots(
+            session, {user_id: (capital["USD"], capital["RUB"])}, today
+        ))
+        if not created:
+            await message.answer("📸 Снэпшот уже существует для этой даты.")
+            return
 
-        except Exception:
-            logging.exception("ERROR in create_snapshot")
-            await message.answer(f"❌ Ошибка при создании снэпшота")
+        async with await get_read_session() as session:
+            capital = await AssetService(session).get_current_capital(user_id, ["RUB", "USD"])
+        text = report_asset_snapshot_created(capital)
+        await message.answer(text)
+
+    except Exception:
+        logging.exception("ERROR in create_snapshot")
+        await message.answer(f"❌ Ошибка при создании снэпшота")
 
 
-@asset_router.message(F.text == "/list_assets")
+@asset_router.message(F.text == "/list_assets", flags=SLOW_HANDLER)
 async def list_assets(message: Message):
     """Обработчик команды /list_assets: показывает детальный список всех активов."""
     
     user_id = message.from_user.id
-    async with await get_session() as session:
+
+    async def render() -> str:
+        async with await get_read_session() as session:
+            overview = await get_assets_overview(AssetService(session), user_id)
+
+        if overview is None:
+            return "📊 У вас пока нет активов."
+
+        assets_by_currency, total_usd, total_rub, updated_at, unknown_currencies = overview
+        return report_assets_detailed_list(assets_by_currency, total_usd, total_rub, updated_at, unknown_currencies)
+
+    try:
+        text = await report_cache.get_or_render(user_id, "assets_list", None, "assets", render)
+        await message.answer(text, parse_mode="HTML")
+    except Exception:
+        logging.exception("ERROR in list_assets")
+        await message.answer(f"❌ Ошибка при получении списка активов")
+
+
+@asset_router.message(Command("capital_history"), flags=SLOW_HANDLER)
+async def capital_history(message: Message, command: CommandObject):
+    """Обработчик команды /capital_history [N]: капитал на конец каждого из последних N месяцев."""
+
+    user_id = message.from_user.id
+    arg = (command.args or "").split(maxsplit=1)
+    months = CAPITAL_HISTORY_DEFAULT_MONTHS
+    if arg and arg[0].isdigit():
+        months = min(max(int(arg[0]), 2), CAPITAL_HISTORY_MAX_MONTHS)
+
+    async with await get_read_session() as session:
         try:
-            service = AssetService(session)
-            assets_by_currency = await service.get_detailed_assets_list(user_id)
+            dates = build_date_grid(datetime.now(timezone.utc).date(), months, "month")
+            series = await CapitalSeriesService(session).get_series(user_id, dates, ["RUB", "USD"])
 
-            if not assets_by_currency:
+            if all(value == 0 for _, capital in series for value in capital.values()):
                 await message.answer("📊 У вас пока нет активов.")
                 return
 
-            # Определяем нераспознанные валюты: пробуем сконвертировать 1 ед. в USD
-            unknown_currencies: set[str] = set()
-            converter = AssetService(session).converter
-            await converter.update_fiat_rates()
-            await converter.update_crypto_rates()
-            for cur in assets_by_currency.keys():
-                try:
-                    _ = await converter.convert(1.0, cur, "USD")
-                except Exception:
-                    unknown_currencies.add(cur)
-
-            total_usd, total_rub, updated_at = await compute_totals_usd_rub(assets_by_currency)
-            text = report_assets_detailed_list(assets_by_currency, total_usd, total_rub, updated_at, unknown_currencies)
-            await message.answer(text, parse_mode="HTML")
-            
+            # Пропускаем месяцы до появления первых активов
+            while series and all(value == 0 for value in series[0][1].values()):
+                series.pop(0)
+
+            await message.answer(report_capital_history(series))
+
         except Exception:
-            logging.exception("ERROR in list_assets")
-            await message.answer(f"❌ Ошибка при получении списка активов")
+            logging.exception("ERROR in capital_history")
+            await message.answer(f"❌ Ошибка при построении истории капитала")
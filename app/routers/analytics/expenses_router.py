@@ -2,13 +2,14 @@ from aiogram import Router, F
 from aiogram.types import Message
 from datetime import datetime
 
-from app.db import get_session
+from app.db import get_read_session
 from app.utils.reports import report_for_expense
 from app.utils.date_ranges import get_today_range, get_this_week_range, get_this_month_range
 from app.services.report_service import ReportService
+from app.services.report_cache import report_cache
 
 
-expenses_router = Router()
+expenses_router = Router(name="expenses_router")
 
 
 async def _send_expense_report(message: Message, label: str, date_range: tuple[datetime, datetime]):
@@ -20,19 +21,24 @@ async def _send_expense_report(message: Message, label: str, date_range: tuple[d
     :param date_range: Диапазон дат (start, end).
     """
     user_id = message.from_user.id
-    async with await get_session() as session:
-        service = ReportService(session)
 
-        # Получаем итоги за период
-        totals = await service.get_period_totals(user_id, date_range, "expense", ["RUB", "USD", "VND"])
+    async def render() -> str:
+        async with await get_read_session() as session:
+            service = ReportService(session)
+
+            # Получаем итоги за период
+            totals = await service.get_period_totals(user_id, date_range, "expense", ["RUB", "USD", "VND"])
 
         if not totals or all(value == 0 for value in totals.values()):
-            await message.answer(f"📊 {label}: у вас не было расходов.")
-            return
+            return f"📊 {label}: у вас не было расходов."
+
+        # Формируем отчёт
+        return report_for_expense(label, totals)
 
-        # Формируем и отправляем отчёт
-        text = report_for_expense(label, totals)
-        await message.answer(text)
+    # Повторные запросы между записями и обновлениями курсов отдаются из кэша
+    period = (label, date_range[0].isoformat())
+    text = await report_cache.get_or_render(user_id, "expense", period, "entries", render)
+    await message.answer(text)
 
 
 @expenses_router.message(F.text == "/expenses_today")
@@ -48,3 +54,4 @@ async def handle_expenses_this_week(message: Message):
 @expenses_router.message(F.text == "/expenses_month")
 async def handle_expenses_month(message: Message):
     await _send_expense_report(message, "Расходы за текущий месяц", get_this_month_range())
+
@@ -2,13 +2,14 @@ from aiogram import Router, F
 from aiogram.types import Message
 from datetime import datetime
 
-from app.db import get_session
+from app.db import get_read_session
 from app.utils.reports import report_for_income
 from app.utils.date_ranges import get_this_month_range
 from app.services.report_service import ReportService
+from app.services.report_cache import report_cache
 
 
-incomes_router = Router()
+incomes_router = Router(name="incomes_router")
 
 
 async def _send_income_report(message: Message, label: str, date_range: tuple[datetime, datetime]):
@@ -20,19 +21,24 @@ async def _send_income_report(message: Message, label: str, date_range: tuple[da
     :param date_range: Диапазон дат (start, end).
     """
     user_id = message.from_user.id
-    async with await get_session() as session:
-        service = ReportService(session)
 
-        # Получаем итоги за период
-        totals = await service.get_period_totals(user_id, date_range, "income", ["RUB", "USD", "VND"])
+    async def render() -> str:
+        async with await get_read_session() as session:
+            service = ReportService(session)
+
+            # Получаем итоги за период
+            totals = await service.get_period_totals(user_id, date_range, "income", ["RUB", "USD", "VND"])
 
         if not totals or all(value == 0 for value in totals.values()):
-            await message.answer(f"💰 {label}: у вас не было доходов.")
-            return
+            return f"💰 {label}: у вас не было доходов."
+
+        # Формируем отчёт
+        return report_for_income(label, totals)
 
-        # Формируем и отправляем отчёт
-        text = report_for_income(label, totals)
-        await message.answer(text)
+    # Повторные запросы между записями и обновлениями курсов отдаются из кэша
+    period = (label, date_range[0].isoformat())
+    text = await report_cache.get_or_render(user_id, "income", period, "entries", render)
+    await message.answer(text)
 
 
 @incomes_router.message(F.text == "/get_incomes")
@@ -6,36 +6,39 @@ from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
-from app.db import get_session
+from app.db import get_read_session, run_write
 from app.db.models import Currency, Category, Entry
 from app.states.form import FormState, Flow
 from app.keyboards.form import render_card, kb_amount_tab, kb_currency_tab, kb_category_tab, kb_manage_list, \
     build_entry_actions_kb
-from app.constants.constants import USER_PREFS, MODE_META, BASE_CURRENCIES, DEFAULT_CATEGORIES
-from app.repo.repo import (
-    ensure_user, get_user_prefs_snapshot, add_custom_currency,
-    add_custom_category, add_entry, list_user_currencies, list_user_categories,
-    update_currency_last_used, update_category_last_used
-)
-from app.utils.formatting import safe_delete, parse_amount, fmt_money_str, normalize_amount_input, uniq_push_front
-
-r = Router()
+from app.constants.constants import MODE_META, BASE_CURRENCIES, DEFAULT_CATEGORIES
+from app.repo.repo import ensure_user, add_custom_currency, add_custom_category, add_entry
+from app.services.asset_service import AssetService
+from app.services.asset_positions import AssetPositionService
+from app.services.prefs import prefs_cache
+from app.middlewares.prefs import PrefsMiddleware
+from app.utils.formatting import safe_delete, parse_amount, fmt_money_str, normalize_amount_input
+from app.utils.edits import editor
+
+r = Router(name="entries")
+# Списки валют/категорий пользователя загружаются до обработчика (клавиатуры их читают)
+r.message.middleware(PrefsMiddleware())
+r.callback_query.middleware(PrefsMiddleware())
 
 # ================== Хендлеры ==================
 @r.message(CommandStart())
 async def start(m: Message, state: FSMContext):
     await state.clear()
 
-    # >>> NEW: DB user + прогрев кастомов в кэш
-    async with await get_session() as session:
-        await ensure_user(session, m.from_user.id, m.from_user.username)
-        snap = await get_user_prefs_snapshot(session, m.from_user.id)
-    USER_PREFS[m.from_user.id]["currencies"] = snap["currencies"]
-    USER_PREFS[m.from_user.id]["categories"] = snap["categories"]
+    # >>> NEW: DB user + свежие кастомы в кэш
+    await run_write(lambda session: ensure_user(session, m.from_user.id, m.from_user.username))
+    await prefs_cache.reload(m.from_user.id)
 
     st = FormState()
     await state.set_state(Flow.form)
-    msg = await m.answer(render_card(st), reply_markup=kb_amount_tab(st), parse_mode="HTML")
+    text, markup = render_card(st), kb_amount_tab(st)
+    msg = await m.answer(text, reply_markup=markup, parse_mode="HTML")
+    editor.remember(m.chat.id, msg.message_id, text, markup, parse_mode="HTML")
     st.main_msg_id = msg.message_id
     await state.update_data(st=st.__dict__)
 
@@ -51,7 +54,7 @@ async def mode_set(cb: CallbackQuery, state: FSMContext):
     st.mode = mode
     st.category = None
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_amount_tab(st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_amount_tab(st))
     await cb.answer(MODE_META[mode]["title"])
 
 # --- Сумма ---
@@ -65,7 +68,8 @@ async def on_num(cb: CallbackQuery, state: FSMContext):
         await cb.answer("Слишком длинно"); return
     st.amount_str += digit; st.tab = "amount"
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_amount_tab(st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_amount_tab(st),
+                           debounce=True)
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data == "backspace")
@@ -73,7 +77,8 @@ async def on_backspace(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
     st.amount_str = st.amount_str[:-1]; st.tab = "amount"
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_amount_tab(st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_amount_tab(st),
+                           debounce=True)
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data == "clear")
@@ -81,7 +86,8 @@ async def on_clear(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
     st.amount_str = ""; st.tab = "amount"
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_amount_tab(st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_amount_tab(st),
+                           debounce=True)
     await cb.answer("Очищено")
 
 # --- Переходы вкладок ---
@@ -90,7 +96,7 @@ async def go_currency(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
     st.tab = "currency"
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_currency_tab(cb.from_user.id, st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_currency_tab(cb.from_user.id, st))
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data == "go:amount")
@@ -98,7 +104,7 @@ async def go_amount(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
     st.tab = "amount"
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_amount_tab(st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_amount_tab(st))
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data == "go:category")
@@ -106,7 +112,7 @@ async def go_category(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
     st.tab = "category"
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_category_tab(cb.from_user.id, st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_category_tab(cb.from_user.id, st))
     await cb.answer()
 
 # --- Валюта ---
@@ -116,27 +122,27 @@ async def cur_page(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
     st.cur_page = page; st.tab = "currency"
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_reply_markup(reply_markup=kb_currency_tab(cb.from_user.id, st))
+    await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_currency_tab(cb.from_user.id, st))
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data.startswith("cur:set:"))
 async def cur_set(cb: CallbackQuery, state: FSMContext):
-    cur = cb.data.split(":",2)[2]
+    resolved = await prefs_cache.resolve(cb.from_user.id, cb.data.split(":",2)[2])
+    if resolved is None:
+        await cb.answer("Валюта не найдена"); return
+    cur, row_id = resolved
     data = await state.get_data(); st = FormState(**data["st"])
     st.currency = cur
-    
-    # >>> Переместить выбранную валюту в начало списка в памяти (быстро, без БД)
-    prefs = USER_PREFS[cb.from_user.id]["currencies"]
-    uniq_push_front(prefs, cur)
-    
-    # >>> Обновить last_used_at в БД асинхронно (не блокируем UI)
-    # Используем один запрос вместо множественных
-    async with await get_session() as session:
-        # Получаем объект и обновляем за один раз
-        currency_obj = (await session.execute(
-            select(Currency).where(Currency.user_id == cb.from_user.id, Currency.code.ilike(cur))
-        )).scalar_one_or_none()
-        
+
+    # >>> Обновить last_used_at в БД через очередь записей
+    async def touch_currency(session) -> int:
+        # Своя валюта известна по id — берём по первичному ключу
+        currency_obj = await session.get(Currency, row_id) if row_id else None
+        if currency_obj is None or currency_obj.user_id != cb.from_user.id:
+            currency_obj = (await session.execute(
+                select(Currency).where(Currency.user_id == cb.from_user.id, Currency.code.ilike(cur))
+            )).scalar_one_or_none()
+
         if currency_obj is None:
             # Создаем новую валюту
             currency_obj = Currency(user_id=cb.from_user.id, code=cur, last_used_at=datetime.now(timezone.utc))
@@ -144,12 +150,15 @@ async def cur_set(cb: CallbackQuery, state: FSMContext):
         else:
             # Обновляем время последнего использования
             currency_obj.last_used_at = datetime.now(timezone.utc)
-        await session.commit()
-    
-    await state.update_data(st=st.__dict__)
+        await session.flush()
+        return currency_obj.id
+
+    # >>> Переместить выбранную валюту в начало списка в памяти
+    prefs_cache.push_front(cb.from_user.id, cur, row_id=await run_write(touch_currency))
+
     st.tab = "category"; st.cat_page = 0
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_category_tab(cb.from_user.id, st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_category_tab(cb.from_user.id, st))
     await cb.answer(f"Валюта: {cur}")
 
 @r.callback_query(Flow.form, F.data == "cur:add")
@@ -176,13 +185,7 @@ async def cur_add_cancel(cb: CallbackQuery, state: FSMContext):
     await state.set_state(Flow.form)
     await safe_delete(cb.bot, cb.message.chat.id, cb.message.message_id)
     st.tab = "currency"
-    await cb.bot.edit_message_text(
-        chat_id=cb.message.chat.id,
-        message_id=st.main_msg_id,
-        text=render_card(st),
-        reply_markup=kb_currency_tab(cb.from_user.id, st),
-        parse_mode="HTML"
-    )
+    await editor.edit_text(cb.bot, cb.message.chat.id, st.main_msg_id, render_card(st), kb_currency_tab(cb.from_user.id, st))
     await cb.answer("Отменено")
 
 # ----- Блокирующий alert во время ожидания кастома -----
@@ -195,10 +198,12 @@ async def cur_add_save(m: Message, state: FSMContext):
     text = m.text.strip()
 
     # >>> NEW: сохранить кастом в БД и обновить кэш
-    async with await get_session() as session:
+    async def save_currency(session):
         await ensure_user(session, m.from_user.id, m.from_user.username)
         await add_custom_currency(session, m.from_user.id, text)
-        USER_PREFS[m.from_user.id]["currencies"] = await list_user_currencies(session, m.from_user.id)
+
+    await run_write(save_currency)
+    await prefs_cache.reload(m.from_user.id)
 
     data = await state.get_data(); st = FormState(**data["st"])
     st.pending_kind = None
@@ -207,48 +212,46 @@ async def cur_add_save(m: Message, state: FSMContext):
     # обновляем ВЕРХНЕЕ окно на вкладке валют
     bot: Bot = m.bot
     st.tab = "currency"
-    await bot.edit_message_text(
-        chat_id=m.chat.id,
-        message_id=st.main_msg_id,
-        text=render_card(st),
-        reply_markup=kb_currency_tab(m.from_user.id, st),
-        parse_mode="HTML"
-    )
+    await editor.edit_text(bot, m.chat.id, st.main_msg_id, render_card(st), kb_currency_tab(m.from_user.id, st))
     # удалить подсказку и сообщение пользователя
     await safe_delete(bot, m.chat.id, st.prompt_msg_id)
     await safe_delete(bot, m.chat.id, m.message_id)
 
 @r.callback_query(Flow.form, F.data == "cur:manage")
 async def cur_manage(cb: CallbackQuery, state: FSMContext):
-    items = USER_PREFS[cb.from_user.id]["currencies"]
-    await cb.message.edit_reply_markup(reply_markup=kb_manage_list(items, "cur"))
+    items = prefs_cache.get(cb.from_user.id).currencies.user_items()
+    await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_manage_list(items, "cur"))
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data.startswith("mg:cur:del:"))
 async def cur_del(cb: CallbackQuery, state: FSMContext):
-    name = cb.data.split(":",3)[3]
-    arr = USER_PREFS[cb.from_user.id]["currencies"]
-    arr[:] = [x for x in arr if x.lower()!=name.lower()]
+    resolved = await prefs_cache.resolve(cb.from_user.id, cb.data.split(":",3)[3])
+    if resolved is None:
+        await cb.answer(); return
+    name, row_id = resolved
+    prefs_cache.remove(cb.from_user.id, name)
+    arr = prefs_cache.get(cb.from_user.id).currencies.user_items()
 
     # >>> NEW: удалить из БД тоже
-    async with await get_session() as session:
-        await session.execute(delete(Currency).where(Currency.user_id == cb.from_user.id, Currency.code.ilike(name)))
-        await session.commit()
+    match = Currency.id == row_id if row_id else Currency.code.ilike(name)
+    await run_write(lambda session: session.execute(
+        delete(Currency).where(Currency.user_id == cb.from_user.id, match)
+    ))
 
-    await cb.message.edit_reply_markup(reply_markup=kb_manage_list(arr, "cur"))
+    await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_manage_list(arr, "cur"))
     await cb.answer(f"Удалено: {name}")
 
 @r.callback_query(Flow.form, F.data.startswith("mg:cur:page:"))
 async def cur_mg_page(cb: CallbackQuery, state: FSMContext):
     page = int(cb.data.split(":")[3])
-    items = USER_PREFS[cb.from_user.id]["currencies"]
-    await cb.message.edit_reply_markup(reply_markup=kb_manage_list(items, "cur", page=page))
+    items = prefs_cache.get(cb.from_user.id).currencies.user_items()
+    await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_manage_list(items, "cur", page=page))
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data == "mg:cur:done")
 async def cur_mg_done(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
-    await cb.message.edit_reply_markup(reply_markup=kb_currency_tab(cb.from_user.id, st))
+    await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_currency_tab(cb.from_user.id, st))
     await cb.answer()
 
 # --- Категория ---
@@ -261,29 +264,30 @@ async def cat_page(cb: CallbackQuery, state: FSMContext):
         await cb.answer(); return
     st.cat_page = page; st.tab = "category"
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_reply_markup(reply_markup=kb_category_tab(cb.from_user.id, st))
+    await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_category_tab(cb.from_user.id, st))
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data.startswith("cat:set:"))
 async def cat_set(cb: CallbackQuery, state: FSMContext):
-    _, _, mode, cat = cb.data.split(":", 3)
+    _, _, mode, token = cb.data.split(":", 3)
     data = await state.get_data(); st = FormState(**data["st"])
     if mode != st.mode:
         await cb.answer(); return
+    resolved = await prefs_cache.resolve(cb.from_user.id, token, mode)
+    if resolved is None:
+        await cb.answer("Категория не найдена"); return
+    cat, row_id = resolved
     st.category = cat
-    
-    # >>> переместить выбранную категорию в начало списка в памяти (быстро, без БД)
-    prefs = USER_PREFS[cb.from_user.id]["categories"][mode]
-    uniq_push_front(prefs, cat)
-    
-    # >>> обновить last_used_at в БД асинхронно (не блокируем UI)
-    # Используем один запрос вместо множественных
-    async with await get_session() as session:
-        # Получаем объект и обновляем за один раз
-        category_obj = (await session.execute(
-            select(Category).where(Category.user_id == cb.from_user.id, Category.mode == mode, Category.name.ilike(cat))
-        )).scalar_one_or_none()
-        
+
+    # >>> обновить last_used_at в БД через очередь записей
+    async def touch_category(session) -> int:
+        # Своя категория известна по id — берём по первичному ключу
+        category_obj = await session.get(Category, row_id) if row_id else None
+        if category_obj is None or category_obj.user_id != cb.from_user.id:
+            category_obj = (await session.execute(
+                select(Category).where(Category.user_id == cb.from_user.id, Category.mode == mode, Category.name.ilike(cat))
+            )).scalar_one_or_none()
+
         if category_obj is None:
             # Создаем новую категорию
             category_obj = Category(user_id=cb.from_user.id, mode=mode, name=cat, last_used_at=datetime.now(timezone.utc))
@@ -291,10 +295,14 @@ async def cat_set(cb: CallbackQuery, state: FSMContext):
         else:
             # Обновляем время последнего использования
             category_obj.last_used_at = datetime.now(timezone.utc)
-        await session.commit()
-    
+        await session.flush()
+        return category_obj.id
+
+    # >>> переместить выбранную категорию в начало списка в памяти
+    prefs_cache.push_front(cb.from_user.id, cat, mode, row_id=await run_write(touch_category))
+
     await state.update_data(st=st.__dict__)
-    await cb.message.edit_text(render_card(st), reply_markup=kb_category_tab(cb.from_user.id, st), parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_category_tab(cb.from_user.id, st))
     await cb.answer(f"Категория: {cat}")
 
 @r.callback_query(Flow.form, F.data.startswith("cat:add:"))
@@ -324,13 +332,7 @@ async def cat_add_cancel(cb: CallbackQuery, state: FSMContext):
     await state.set_state(Flow.form)
     await safe_delete(cb.bot, cb.message.chat.id, cb.message.message_id)
     st.tab = "category"
-    await cb.bot.edit_message_text(
-        chat_id=cb.message.chat.id,
-        message_id=st.main_msg_id,
-        text=render_card(st),
-        reply_markup=kb_category_tab(cb.from_user.id, st),
-        parse_mode="HTML"
-    )
+    await editor.edit_text(cb.bot, cb.message.chat.id, st.main_msg_id, render_card(st), kb_category_tab(cb.from_user.id, st))
     await cb.answer("Отменено")
 
 # Блокирующий alert — после обработчика отмены
@@ -344,23 +346,19 @@ async def cat_add_save(m: Message, state: FSMContext):
 
     # >>> NEW: сохранить в БД и обновить кэш
     data = await state.get_data(); st = FormState(**data["st"])
-    async with await get_session() as session:
+    async def save_category(session):
         await ensure_user(session, m.from_user.id, m.from_user.username)
         await add_custom_category(session, m.from_user.id, st.mode, text)
-        USER_PREFS[m.from_user.id]["categories"][st.mode] = await list_user_categories(session, m.from_user.id, st.mode)
+
+    await run_write(save_category)
+    await prefs_cache.reload(m.from_user.id)
 
     st.pending_kind = None
     await state.update_data(st=st.__dict__)
     await state.set_state(Flow.form)
     bot: Bot = m.bot
     st.tab = "category"
-    await bot.edit_message_text(
-        chat_id=m.chat.id,
-        message_id=st.main_msg_id,
-        text=render_card(st),
-        reply_markup=kb_category_tab(m.from_user.id, st),
-        parse_mode="HTML"
-    )
+    await editor.edit_text(bot, m.chat.id, st.main_msg_id, render_card(st), kb_category_tab(m.from_user.id, st))
     await safe_delete(bot, m.chat.id, st.prompt_msg_id)
     await safe_delete(bot, m.chat.id, m.message_id)
 
@@ -370,8 +368,8 @@ async def cat_manage(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
     if mode != st.mode:
         await cb.answer(); return
-    items = USER_PREFS[cb.from_user.id]["categories"][mode]
-    await cb.message.edit_reply_markup(reply_markup=kb_manage_list(items, "cat", mode=mode))
+    items = prefs_cache.get(cb.from_user.id).items(mode).user_items()
+    await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_manage_list(items, "cat", mode=mode))
     await cb.answer()
 
 @r.callback_query(Flow.form, F.data.startswith("mg:cat:"))
@@ -381,26 +379,29 @@ async def cat_manage_ops(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data(); st = FormState(**data["st"])
     if mode != st.mode:
         await cb.answer(); return
-    arr = USER_PREFS[cb.from_user.id]["categories"][mode]
     if op == "del":
-        name = rest[0]
-        arr[:] = [x for x in arr if x.lower()!=name.lower()]
+        resolved = await prefs_cache.resolve(cb.from_user.id, rest[0], mode)
+        if resolved is None:
+            await cb.answer(); return
+        name, row_id = resolved
+        prefs_cache.remove(cb.from_user.id, name, mode)
 
         # >>> NEW: удалить из БД тоже
-        async with await get_session() as session:
-            await session.execute(delete(Category).where(
-                Category.user_id == cb.from_user.id, Category.mode == mode, Category.name.ilike(name)
-            ))
-            await session.commit()
+        match = Category.id == row_id if row_id else Category.name.ilike(name)
+        await run_write(lambda session: session.execute(delete(Category).where(
+            Category.user_id == cb.from_user.id, Category.mode == mode, match
+        )))
 
-        await cb.message.edit_reply_markup(reply_markup=kb_manage_list(arr, "cat", mode=mode))
+        arr = prefs_cache.get(cb.from_user.id).items(mode).user_items()
+        await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_manage_list(arr, "cat", mode=mode))
         await cb.answer(f"Удалено: {name}")
     elif op == "page":
         page = int(rest[0])
-        await cb.message.edit_reply_markup(reply_markup=kb_manage_list(arr, "cat", mode=mode, page=page))
+        arr = prefs_cache.get(cb.from_user.id).items(mode).user_items()
+        await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_manage_list(arr, "cat", mode=mode, page=page))
         await cb.answer()
     elif op == "done":
-        await cb.message.edit_reply_markup(reply_markup=kb_category_tab(cb.from_user.id, st))
+        await editor.edit_markup(cb.bot, cb.message.chat.id, cb.message.message_id, kb_category_tab(cb.from_user.id, st))
         await cb.answer()
 
 # --- Описание ---
@@ -423,7 +424,7 @@ async def note_add_prompt(cb: CallbackQuery, state: FSMContext):
         else:
             reply_markup = kb_amount_tab(st)
         
-        await cb.message.edit_text(render_card(st), reply_markup=reply_markup, parse_mode="HTML")
+        await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), reply_markup)
         await cb.answer("Описание удалено")
         return
     
@@ -458,13 +459,7 @@ async def note_add_cancel(cb: CallbackQuery, state: FSMContext):
     else:
         reply_markup = kb_amount_tab(st)
     
-    await cb.bot.edit_message_text(
-        chat_id=cb.message.chat.id,
-        message_id=st.main_msg_id,
-        text=render_card(st),
-        reply_markup=reply_markup,
-        parse_mode="HTML"
-    )
+    await editor.edit_text(cb.bot, cb.message.chat.id, st.main_msg_id, render_card(st), reply_markup)
     await cb.answer("Отменено")
 
 # Блокирующий alert во время ожидания ввода описания
@@ -493,13 +488,7 @@ async def note_add_save(m: Message, state: FSMContext):
         reply_markup = kb_amount_tab(st)
     
     bot: Bot = m.bot
-    await bot.edit_message_text(
-        chat_id=m.chat.id,
-        message_id=st.main_msg_id,
-        text=render_card(st),
-        reply_markup=reply_markup,
-        parse_mode="HTML"
-    )
+    await editor.edit_text(bot, m.chat.id, st.main_msg_id, render_card(st), reply_markup)
     # удалить подсказку и сообщение пользователя
     await safe_delete(bot, m.chat.id, st.prompt_msg_id)
     await safe_delete(bot, m.chat.id, m.message_id)
@@ -516,19 +505,27 @@ async def submit(cb: CallbackQuery, state: FSMContext):
     if not st.category:
         await cb.answer("Выбери категорию", show_alert=True); return
 
-    # >>> NEW: записать в БД
-    async with await get_session() as session:
+    # Курс для истории активов получаем заранее: в транзакции записи сеть не трогаем
+    rate_to_usd = None
+    if st.mode == "asset":
+        async with await get_read_session() as session:
+            rate_to_usd = await AssetService(session).fetch_rate_to_usd(st.currency)
+
+    # >>> NEW: записать в БД; при редактировании старая запись заменяется в той же транзакции
+    async def save_entry(session):
         await ensure_user(session, cb.from_user.id, cb.from_user.username)
-        await add_entry(session, cb.from_user.id, st.mode, Decimal(st.amount_str.replace(",", ".")), st.currency, st.category, note=st.note)
-
-        # Определим id только что сохранённой записи (последняя по времени для пользователя)
-        entry_id = await session.scalar(
-            select(Entry.id)
-            .where(Entry.user_id == cb.from_user.id)
-            .order_by(Entry.created_at.desc())
-            .limit(1)
+        if st.edit_entry_id is not None:
+            old = await session.get(Entry, st.edit_entry_id)
+            if old is not None and old.user_id == cb.from_user.id:
+                # для актива последнее значение позиции откатывается на предыдущее
+                await AssetPositionService(session).remove_entry(old)
+        return await add_entry(
+            session, cb.from_user.id, st.mode, Decimal(st.amount_str.replace(",", ".")),
+            st.currency, st.category, note=st.note, rate_to_usd=rate_to_usd,
         )
 
+    entry_id = await run_write(save_entry)
+
     # Сформируем клавиатуру действий (только если запись в последних 10)
     actions_kb = await build_entry_actions_kb(cb.from_user.id, entry_id) if entry_id else None
 
@@ -541,7 +538,7 @@ async def submit(cb: CallbackQuery, state: FSMContext):
         "Начать заново: /start"
     )
     await state.clear()
-    await cb.message.edit_text(msg, reply_markup=actions_kb, parse_mode="HTML")
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, msg, actions_kb)
     await cb.answer()
 
 # ====== Обработчики действий записи (Удалить / Изменить) ======
@@ -554,70 +551,25 @@ async def entry_delete(cb: CallbackQuery):
         await cb.answer("Некорректный идентификатор", show_alert=True)
         return
 
-    async with await get_session() as session:
+    async def delete_entry(session) -> bool:
         entry = await session.get(Entry, entry_id)
         if not entry or entry.user_id != cb.from_user.id:
-            await cb.answer("Запись не найдена или нет доступа", show_alert=True)
-            return
-        
-        # Если удаляем актив, нужно обновить последние значения
-        if entry.mode == "asset":
-            from app.services.asset_service import AssetService
-            analytics_service = AssetService(session)
-            
-            # Получаем информацию о валюте и категории перед удалением
-            currency_result = await session.execute(
-                select(Currency.code).where(Currency.id == entry.currency_id)
-            )
-            currency_code = currency_result.scalar()
-            
-            category_result = await session.execute(
-                select(Category.name).where(Category.id == entry.category_id)
-            )
-            category_name = category_result.scalar()
-            
-            # Удаляем запись из AssetLatestValues если это была последняя запись по этой комбинации
-            if currency_code and category_name:
-                # Проверяем, есть ли другие записи по этой валюте + категории
-                other_entries_result = await session.execute(
-                    select(Entry)
-                    .where(Entry.user_id == entry.user_id)
-                    .where(Entry.mode == "asset")
-                    .where(Entry.currency_id == entry.currency_id)
-                    .where(Entry.category_id == entry.category_id)
-                    .where(Entry.id != entry_id)
-                    .order_by(Entry.created_at.desc())
-                )
-                other_entries = other_entries_result.scalars().all()
-                
-                if other_entries:
-                    # Если есть другие записи, обновляем на последнюю
-                    latest_entry = other_entries[0]
-                    await analytics_service.update_latest_asset_value(
-                        entry.user_id, currency_code, category_name, 
-                        latest_entry.amount, latest_entry.id
-                    )
-                else:
-                    # Если это была последняя запись, удаляем из AssetLatestValues
-                    from app.db.models import AssetLatestValues
-                    asset_value_result = await session.execute(
-                        select(AssetLatestValues)
-                        .where(AssetLatestValues.user_id == entry.user_id)
-                        .where(AssetLatestValues.currency_code == currency_code)
-                        .where(AssetLatestValues.category_name == category_name)
-                    )
-                    asset_value = asset_value_result.scalar_one_or_none()
-                    if asset_value:
-                        await session.delete(asset_value)
-        
-        await session.delete(entry)
-        await session.commit()
+            return False
+
+        # Для актива удаление сразу чинит последнее значение позиции
+        await AssetPositionService(session).remove_entry(entry)
+        return True
+
+    if not await run_write(delete_entry):
+        await cb.answer("Запись не найдена или нет доступа", show_alert=True)
+        return
 
     # удаляем сообщение с записью
     try:
         await cb.message.delete()
+        editor.forget(cb.message.chat.id, cb.message.message_id)
     except Exception:
-        await cb.message.edit_text("❌ Запись удалена", reply_markup=None)
+        await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, "❌ Запись удалена", parse_mode=None)
     await cb.answer("Удалено")
 
 @r.callback_query(F.data.startswith("entry:edit:"))
@@ -628,17 +580,11 @@ async def entry_edit(cb: CallbackQuery, state: FSMContext):
         await cb.answer("Некорректный идентификатор", show_alert=True)
         return
 
-    async with await get_session() as session:
-        # заберём запись
+    async def read_entry(session) -> dict | None:
         entry = await session.get(Entry, entry_id)
         if not entry or entry.user_id != cb.from_user.id:
-            await cb.answer("Запись не найдена или нет доступа", show_alert=True)
-            return
+            return None
 
-        # подготовим данные для формы ДО удаления
-        mode = entry.mode
-        amount_str = normalize_amount_input(entry.amount)  # <<< ВАЖНО: нормализуем для продолжения ввода
-        note = entry.note
         # подстрахуемся с валютой/категорией
         currency_code = None
         category_name = None
@@ -650,24 +596,27 @@ async def entry_edit(cb: CallbackQuery, state: FSMContext):
             category_name = await session.scalar(
                 select(Category.name).where(Category.id == entry.category_id)
             )
+        return dict(
+            mode=entry.mode,
+            amount_str=normalize_amount_input(entry.amount),  # <<< ВАЖНО: нормализуем для продолжения ввода
+            currency=currency_code,
+            category=category_name,
+            note=entry.note,
+        )
 
-        # удалим старую запись (как и задумано — заменяем на новую)
-        await session.delete(entry)
-        await session.commit()
+    # Запись пока не трогаем: её заменит `submit`, а брошенная форма оставит её как есть
+    async with await get_read_session() as session:
+        form = await read_entry(session)
+    if form is None:
+        await cb.answer("Запись не найдена или нет доступа", show_alert=True)
+        return
 
     # восстановим редактор в том же сообщении
-    st = FormState(
-        mode=mode,
-        amount_str=amount_str,
-        currency=currency_code,
-        category=category_name,
-        note=note,
-        tab="amount",
-    )
+    st = FormState(**form, tab="amount", edit_entry_id=entry_id)
     await state.set_state(Flow.form)
     await state.update_data(st=st.__dict__)
 
-    msg = await cb.message.edit_text(render_card(st), reply_markup=kb_amount_tab(st), parse_mode="HTML")
-    st.main_msg_id = msg.message_id
+    await editor.edit_text(cb.bot, cb.message.chat.id, cb.message.message_id, render_card(st), kb_amount_tab(st))
+    st.main_msg_id = cb.message.message_id
     await state.update_data(st=st.__dict__)
     await cb.answer("Редактирование")
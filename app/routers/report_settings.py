@@ -0,0 +1,48 @@
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from app.db import run_write
+from app.repo.repo import ensure_user, set_report_time
+from app.scheduler.staggered import parse_report_time
+
+
+report_settings_router = Router(name="report_settings_router")
+
+
+@report_settings_router.message(Command("report_time"))
+async def handle_report_time(message: Message, command: CommandObject):
+    """
+    /report_time ЧЧ:ММ [UTC±Ч] — время получения еженедельного отчёта по местному времени.
+    /report_time off — вернуть время по умолчанию.
+    """
+    user_id = message.from_user.id
+    username = message.from_user.username
+    arg = (command.args or "").strip()
+
+    if not arg:
+        await message.answer("Укажите время: /report_time 09:30 UTC+3 (или /report_time off)")
+        return
+
+    if arg.lower() == "off":
+        local_minutes, utc_offset = None, 0
+    else:
+        try:
+            local_minutes, utc_offset = parse_report_time(arg)
+        except ValueError:
+            await message.answer("❌ Не понял время. Пример: /report_time 09:30 UTC+3")
+            return
+
+    async def save(session):
+        await ensure_user(session, user_id, username)
+        await set_report_time(session, user_id, local_minutes, utc_offset)
+
+    await run_write(save)
+    if local_minutes is None:
+        await message.answer("⏰ Еженедельный отчёт придёт в обычное время.")
+    else:
+        sign = "+" if utc_offset >= 0 else "-"
+        await message.answer(
+            f"⏰ Еженедельный отчёт будет приходить в {local_minutes // 60:02d}:{local_minutes % 60:02d} "
+            f"(UTC{sign}{abs(utc_offset) // 60}:{abs(utc_offset) % 60:02d})."
+        )
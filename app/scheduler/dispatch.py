@@ -0,0 +1,183 @@
+"""
+Параллельная рассылка отчётов с ограничением скорости отправки.
+
+Отчёты строятся пулом из `concurrency` воркеров, у каждого пользователя — своя
+read-сессия, поэтому медленный отчёт или отправка не задерживают остальных.
+Лимиты Telegram и повторы после `RetryAfter` обеспечивает `RateLimitMiddleware`
+сессии бота; рассылка идёт внутри `bulk_sends()` и уступает ответам пользователям.
+
+Если задан `batch_fn`, тексты для всех пользователей готовятся заранее одним
+пакетным расчётом, а `report_fn` используется только как запасной путь.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import get_read_session
+from app.utils.rate_limit import bulk_sends
+
+logger = logging.getLogger(__name__)
+
+ReportFn = Callable[[int, AsyncSession], Awaitable[str]]
+BatchReportFn = Callable[[AsyncSession, List[int]], Awaitable[Dict[int, str]]]
+OutcomeFn = Callable[[int, str], Awaitable[None]]
+
+# Как часто (в секундах) логировать прогресс рассылки
+PROGRESS_LOG_INTERVAL = 10.0
+
+
+@dataclass
+class DispatchStats:
+    """Счётчики одной рассылки."""
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.done}/{self.total} done: sent={self.sent} failed={self.failed} "
+            f"blocked={self.blocked} "
+            f"in {self.elapsed:.1f}s ({self.messages_per_second:.1f} msg/s)"
+        )
+
+
+class ReportDispatcher:
+    """Рассылает отчёт `report_fn` списку пользователей."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        report_fn: ReportFn,
+        report_name: str = "Unnamed report",
+        concurrency: Optional[int] = None,
+        session_factory: Callable[[], Awaitable[AsyncSession]] = get_read_session,
+        batch_fn: Optional[BatchReportFn] = None,
+        on_outcome: Optional[OutcomeFn] = None,
+    ):
+        self.bot = bot
+        self.report_fn = report_fn
+        self.batch_fn = batch_fn
+        self.on_outcome = on_outcome
+        self.report_name = report_name
+        self.concurrency = concurrency or settings.REPORT_DISPATCH_CONCURRENCY
+        self.session_factory = session_factory
+        self.stats = DispatchStats()
+        self._prepared: Dict[int, str] = {}
+        # Итог по каждому пользователю: "sent", "failed" или "blocked"
+        self.outcomes: Dict[int, str] = {}
+
+    async def run(self, user_ids: Iterable[int]) -> DispatchStats:
+        """Рассылает отчёты всем `user_ids` и возвращает статистику."""
+        user_ids = list(user_ids)
+        self._prepared = await self.prepare(user_ids)
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+        self.stats = DispatchStats(total=queue.qsize())
+        self.outcomes = {}
+        logger.info(f"Dispatch '{self.report_name}' started: {self.stats.total} users, concurrency={self.concurrency}")
+
+        # Задачи наследуют контекст: все их запросы к Bot API — массовые
+        with bulk_sends():
+            workers = [asyncio.create_task(self._worker(queue)) for _ in range(min(self.concurrency, self.stats.total))]
+        progress = asyncio.create_task(self._log_progress())
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            progress.cancel()
+            for w in workers:
+                w.cancel()
+            self.stats.finished_at = time.monotonic()
+
+        logger.info(f"Dispatch '{self.report_name}' finished: {self.stats.summary()}")
+        return self.stats
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            try:
+                user_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._dispatch_one(user_id)
+
+    async def _dispatch_one(self, user_id: int) -> None:
+        try:
+            text = await self.build(user_id)
+        except Exception:
+            self.stats.failed += 1
+            self.outcomes[user_id] = "failed"
+            logger.exception(f"Failed to build {self.report_name} for user {user_id}")
+        else:
+            await self.send(user_id, text)
+
+        if self.on_outcome is not None:
+            try:
+                await self.on_outcome(user_id, self.outcomes[user_id])
+            except Exception:
+                logger.exception(f"Failed to record {self.report_name} outcome for user {user_id}")
+
+    async def prepare(self, user_ids: List[int]) -> Dict[int, str]:
+        """Готовит тексты пакетно через `batch_fn` (пустой словарь, если его нет или он упал)."""
+        if self.batch_fn is None or not user_ids:
+            return {}
+        try:
+            async with await self.session_factory() as session:
+                return await self.batch_fn(session, user_ids)
+        except Exception:
+            logger.exception(f"Batch build of {self.report_name} failed, building per user")
+            return {}
+
+    async def build(self, user_id: int) -> str:
+        """Строит отчёт пользователю в отдельной read-сессии (или берёт готовый)."""
+        prepared = self._prepared.pop(user_id, None)
+        if prepared is not None:
+            return prepared
+        async with await self.session_factory() as session:
+            return await self.report_fn(user_id, session)
+
+    async def send(self, user_id: int, text: str) -> bool:
+        """Отправляет текст (лимиты и повторы — в middleware сессии бота)."""
+        try:
+            await self.bot.send_message(chat_id=user_id, text=text)
+            self.stats.sent += 1
+            self.outcomes[user_id] = "sent"
+            return True
+        except TelegramForbiddenError:
+            # Пользователь заблокировал бота — повторять бессмысленно
+            self.stats.blocked += 1
+            self.outcomes[user_id] = "blocked"
+            return False
+        except Exception:
+            logger.exception(f"Failed to send {self.report_name} to user {user_id}")
+        self.stats.failed += 1
+        self.outcomes[user_id] = "failed"
+        return False
+
+    async def _log_progress(self) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_LOG_INTERVAL)
+            logger.info(f"Dispatch '{self.report_name}' progress: {self.stats.summary()}")
@@ -0,0 +1,178 @@
+"""
+Аренда (lease) запусков фоновых задач в БД.
+
+Когда работают несколько реплик бота, aiocron в каждой из них запускает одни и те же
+задачи. Запуск задачи (`job_name`, `run_key`) выполняет та реплика, которая первой
+взяла его в аренду; пока аренда продлевается, остальные его пропускают. Если реплика
+упала, аренда истекает и запуск подхватывает следующая реплика (или эта же после
+рестарта) — повторно выполняется только то, что не успело сохранить результат.
+
+Задачи регистрируются через `register_job(job_name, fn)`, где `fn(run_key)` должна быть
+идемпотентной; `resume_pending_runs()` периодически доделывает брошенные запуски.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict
+
+from sqlalchemy import select, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import get_read_session, run_write
+from app.db.dialect import dialect_insert
+from app.db.models import JobRun
+from app.db.tracing import trace_queries
+from app.utils.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор этой реплики в полях lease_owner
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# После стольких неудачных попыток запуск больше не возобновляется автоматически
+MAX_RUN_ATTEMPTS = 3
+
+JobFn = Callable[[str], Awaitable[None]]
+
+_registry: Dict[str, JobFn] = {}
+
+JOB_SECONDS = histogram(
+    "scheduler_job_seconds", "Длительность запусков фоновых задач", ["job"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+JOB_RUNS = counter("scheduler_job_runs_total", "Запуски фоновых задач по итогу", ["job", "status"])
+
+
+def new_lease_token() -> str:
+    """Уникальный токен аренды: по нему реплика находит то, что взяла сама."""
+    return f"{INSTANCE_ID}:{uuid.uuid4().hex[:12]}"
+
+
+def lease_ttl() -> timedelta:
+    return timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+
+async def _claim_run(session: AsyncSession, job_name: str, run_key: str, token: str) -> bool:
+    now = datetime.now(timezone.utc)
+    stmt = dialect_insert(session, JobRun).on_conflict_do_nothing(index_elements=["job_name", "run_key"])
+    conn = await session.connection()
+    await conn.execute(stmt, [{"job_name": job_name, "run_key": run_key, "status": "pending", "attempts": 0}])
+
+    result = await session.execute(
+        update(JobRun)
+        .where(JobRun.job_name == job_name)
+        .where(JobRun.run_key == run_key)
+        .where(JobRun.status != "done")
+        .where(or_(JobRun.lease_until.is_(None), JobRun.lease_until < now))
+        .values(lease_owner=token, lease_until=now + lease_ttl(), attempts=JobRun.attempts + 1, started_at=now)
+    )
+    return result.rowcount == 1
+
+
+async def _update_run(session: AsyncSession, job_name: str, run_key: str, token: str, **values) -> None:
+    await session.execute(
+        update(JobRun)
+        .where(JobRun.job_name == job_name)
+        .where(JobRun.run_key == run_key)
+        .where(JobRun.lease_owner == token)
+        .values(**values)
+    )
+
+
+async def _heartbeat(job_name: str, run_key: str, token: str) -> None:
+    interval = max(lease_ttl().total_seconds() / 3, 1.0)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_write(lambda session: _update_run(
+                session, job_name, run_key, token, lease_until=datetime.now(timezone.utc) + lease_ttl()
+            ))
+        except Exception:
+            logger.exception(f"Failed to renew lease for job {job_name} [{run_key}]")
+
+
+async def run_exclusive(job_name: str, run_key: str, fn: Callable[[], Awaitable[None]]) -> bool:
+    """Выполняет запуск задачи, если он ещё не выполнен и не арендован другой репликой.
+
+    Пока `fn` работает, аренда продлевается. При ошибке аренда снимается, и запуск
+    может повторить любая реплика; поэтому `fn` должна быть идемпотентной.
+
+    Returns:
+        True, если запуск выполнила эта реплика.
+    """
+    token = new_lease_token()
+    claimed = await run_write(lambda session: _claim_run(session, job_name, run_key, token))
+    if not claimed:
+        logger.info(f"Job {job_name} [{run_key}] is done or leased by another replica, skipping")
+        JOB_RUNS.labels(job_name, "skipped").inc()
+        return False
+
+    heartbeat = asyncio.create_task(_heartbeat(job_name, run_key, token))
+    started = time.perf_counter()
+    try:
+        # У задач свой бюджет: бюджет апдейта (десятки запросов) им заведомо мал
+        budget = settings.SQL_JOB_QUERY_BUDGET if settings.SQL_TRACE else None
+        with trace_queries(f"job {job_name} [{run_key}]", budget=budget):
+            await fn()
+    except Exception:
+        JOB_RUNS.labels(job_name, "failed").inc()
+        await run_write(lambda session: _update_run(session, job_name, run_key, token, lease_owner=None, lease_until=None))
+        raise
+    finally:
+        heartbeat.cancel()
+        JOB_SECONDS.labels(job_name).observe(time.perf_counter() - started)
+    JOB_RUNS.labels(job_name, "done").inc()
+
+    await run_write(lambda session: _update_run(
+        session, job_name, run_key, token,
+        status="done", finished_at=datetime.now(timezone.utc), lease_until=None,
+    ))
+    return True
+
+
+def register_job(job_name: str, fn: JobFn) -> None:
+    """Регистрирует задачу: `fn(run_key)` выполняет один её запуск."""
+    _registry[job_name] = fn
+
+
+async def run_job(job_name: str, run_key: str) -> bool:
+    """Выполняет запуск зарегистрированной задачи под арендой (см. `run_exclusive`)."""
+    fn = _registry[job_name]
+    return await run_exclusive(job_name, run_key, lambda: fn(run_key))
+
+
+async def resume_pending_runs() -> int:
+    """Доделывает незавершённые запуски, чья аренда истекла (реплика упала посреди работы).
+
+    Returns:
+        Количество запусков, выполненных этой репликой.
+    """
+    if not _registry:
+        return 0
+    now = datetime.now(timezone.utc)
+    async with await get_read_session() as session:
+        result = await session.execute(
+            select(JobRun.job_name, JobRun.run_key)
+            .where(JobRun.job_name.in_(list(_registry)))
+            .where(JobRun.status != "done")
+            .where(JobRun.attempts < MAX_RUN_ATTEMPTS)
+            .where(or_(JobRun.lease_until.is_(None), JobRun.lease_until < now))
+        )
+        pending = result.all()
+
+    resumed = 0
+    for job_name, run_key in pending:
+        logger.warning(f"Resuming unfinished job {job_name} [{run_key}]")
+        try:
+            if await run_job(job_name, run_key):
+                resumed += 1
+        except Exception:
+            logger.exception(f"Resumed job {job_name} [{run_key}] failed")
+    return resumed
@@ -1,12 +1,18 @@
 import aiocron
 import logging
+from datetime import date
 from aiogram import Bot
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Callable, Awaitable
 
-from app.db import get_session
+from app.db import get_read_session, run_write
 from app.db.models import User
+from app.scheduler.dispatch import ReportDispatcher, BatchReportFn
+from app.scheduler.jobs import register_job, run_job, resume_pending_runs
+from app.scheduler.staggered import StaggeredReportScheduler
+
+MONTHLY_SNAPSHOTS_JOB = "monthly_snapshots"
 
 
 def schedule_report_dispatch(
@@ -14,7 +20,8 @@ def schedule_report_dispatch(
     bot: Bot,
     report_fn: Callable[[int, AsyncSession], Awaitable[str]],
     cron: str,
-    report_name: str = "Unnamed report"
+    report_name: str = "Unnamed report",
+    batch_fn: BatchReportFn | None = None,
 ) -> None:
     """
     Планировщик кастомной рассылки отчётов пользователям по расписанию.
@@ -23,74 +30,84 @@ def schedule_report_dispatch(
     :param report_fn: Функция, возвращающая текст отчёта по user_id и сессии
     :param cron: Cron-выражение (пример: '0 9 * * MON')
     :param report_name: Имя отчёта (для логов)
+    :param batch_fn: Пакетное построение отчётов для списка user_id (одним запросом)
     """
     @aiocron.crontab(cron)
     async def cron_task():
-        session = None
         try:
-            session = await get_session()
-            users_result = await session.execute(select(User.id))
-            user_ids = [row[0] for row in users_result.fetchall()]
-
-            for user_id in user_ids:
-                try:
-                    report = await report_fn(user_id, session)
-                    await bot.send_message(chat_id=user_id, text=report)
-                except Exception as e:
-                    logging.exception(f"Failed to send {report_name} to user {user_id}")
+            async with await get_read_session() as session:
+                users_result = await session.execute(select(User.id))
+                user_ids = [row[0] for row in users_result.fetchall()]
+
+            dispatcher = ReportDispatcher(bot=bot, report_fn=report_fn, report_name=report_name, batch_fn=batch_fn)
+            await dispatcher.run(user_ids)
         except Exception as e:
             logging.exception(f"Report dispatch '{report_name}' failed")
-        finally:
-            if session:
-                await session.close()
+
+
+def schedule_staggered_report_dispatch(
+    *,
+    bot: Bot,
+    report_fn: Callable[[int, AsyncSession], Awaitable[str]],
+    cron: str,
+    job_name: str,
+    report_name: str = "Unnamed report",
+    batch_fn: BatchReportFn | None = None,
+) -> StaggeredReportScheduler:
+    """
+    Рассылка отчётов, растянутая на окно после `cron` (см. `StaggeredReportScheduler`).
+
+    Каждому пользователю назначается свой слот (предпочтительное время или хэш user_id
+    внутри окна `REPORT_WINDOW_MINUTES`); наступившие слоты рассылаются пачками раз в минуту.
+
+    :param job_name: Имя задачи для таблицы слотов (должно быть стабильным между релизами)
+    """
+    scheduler = StaggeredReportScheduler(
+        bot=bot,
+        report_fn=report_fn,
+        batch_fn=batch_fn,
+        job_name=job_name,
+        report_name=report_name,
+    )
+    scheduler.start(cron)
+    return scheduler
+
+
+async def _create_snapshots_for(run_key: str) -> None:
+    """Один запуск снэпшотов; `run_key` — дата снэпшота. Идемпотентен: существующие не трогает."""
+    # Импортируем сервис снэпшотов
+    from app.services.snapshot_service import SnapshotService
+
+    snapshot_date = date.fromisoformat(run_key)
+    async with await get_read_session() as session:
+        capitals = await SnapshotService(session).compute_all_capitals()
+
+    if not capitals:
+        logging.info("No users with assets found for monthly snapshots")
+        return
+
+    created_count = await run_write(
+        lambda session: SnapshotService.save_snapshots(session, capitals, snapshot_date)
+    )
+    logging.info(f"Monthly snapshots completed: {created_count}/{len(capitals)} users")
+
+
+register_job(MONTHLY_SNAPSHOTS_JOB, _create_snapshots_for)
 
 
 async def create_monthly_snapshots():
     """
     Создаёт снэпшоты капитала для всех пользователей с активами.
     Вызывается 15-го числа каждого месяца.
+
+    Капитал всех пользователей считается одним запросом и одним снимком курсов,
+    а снэпшоты записываются одной пакетной вставкой. При нескольких репликах
+    запуск выполняет одна из них; если она упадёт, запуск доделает другая.
     """
-    session = None
     try:
-        session = await get_session()
-        
-        # Импортируем сервис аналитики капитала
-        from app.services.asset_service import AssetService
-        from app.db.models import AssetLatestValues
-        from sqlalchemy import select
-        
-        # Получаем всех пользователей с активами
-        users_result = await session.execute(
-            select(AssetLatestValues.user_id).distinct()
-        )
-        user_ids = [row[0] for row in users_result.fetchall()]
-        
-        if not user_ids:
-            logging.info("No users with assets found for monthly snapshots")
-            return
-        
-        analytics_service = AssetService(session)
-        created_count = 0
-        
-        for user_id in user_ids:
-            try:
-                # Создаём снэпшот на сегодняшнюю дату
-                success = await analytics_service.create_monthly_snapshot(user_id)
-                if success:
-                    created_count += 1
-                    logging.info(f"Created monthly snapshot for user {user_id}")
-                else:
-                    logging.warning(f"Failed to create snapshot for user {user_id}")
-            except Exception as e:
-                logging.exception(f"Failed to create snapshot for user {user_id}")
-        
-        logging.info(f"Monthly snapshots completed: {created_count}/{len(user_ids)} users")
-        
+        await run_job(MONTHLY_SNAPSHOTS_JOB, date.today().isoformat())
     except Exception as e:
         logging.exception("Monthly snapshots task failed")
-    finally:
-        if session:
-            await session.close()
 
 
 def schedule_monthly_snapshots():
@@ -102,3 +119,19 @@ def schedule_monthly_snapshots():
         await create_monthly_snapshots()
     
     logging.info("Monthly snapshots scheduled for 15th of each month at 10:00")
+
+
+
+def schedule_job_recovery(cron: str = "*/5 * * * *"):
+    """
+    Планирует проверку брошенных запусков задач (реплика упала посреди работы)
+    и доделывает их (см. `app.scheduler.jobs.resume_pending_runs`).
+    """
+    @aiocron.crontab(cron)
+    async def job_recovery_task():
+        try:
+            await resume_pending_runs()
+        except Exception:
+            logging.exception("Job recovery failed")
+
+    logging.info(f"Job recovery scheduled at '{cron}'")
@@ -0,0 +1,346 @@
+"""
+Растянутая во времени рассылка регулярных отчётов.
+
+Вместо рассылки всем пользователям в одну минуту каждому назначается слот доставки:
+его предпочтительное время (`ReportPreference`) или смещение внутри окна рассылки
+по хэшу user_id. Слоты хранятся в таблице `scheduled_deliveries`, поэтому после
+рестарта бот продолжает с того места, где остановился. Раз в минуту наступившие
+слоты обрабатываются небольшими пачками.
+
+При нескольких репликах планирование запуска выполняет одна из них (аренда
+`JobRun`, см. `app.scheduler.jobs`), а наступившие слоты реплики забирают в аренду
+пачками (`lease_owner`/`lease_until`), так что рассылка делится между ними и каждый
+слот отправляется один раз. Пока пачка рассылается, аренда продлевается; слоты
+упавшей реплики после истечения аренды забирают остальные, а реплика, потерявшая
+аренду, прекращает рассылку своей пачки.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import zlib
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import aiocron
+from aiogram import Bot
+from sqlalchemy import select, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import get_read_session, run_write
+from app.db.dialect import dialect_insert
+from app.db.models import User, ReportPreference, ScheduledDelivery
+from app.scheduler.dispatch import ReportDispatcher, ReportFn, BatchReportFn
+from app.scheduler.jobs import register_job, run_job, new_lease_token, lease_ttl
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять наступившие слоты
+TICK_CRON = "* * * * *"
+
+# Слоты, просроченные больше чем на это время (бот долго лежал), не отправляются
+MAX_DELIVERY_DELAY = timedelta(hours=12)
+
+# Сколько раз слот может быть взят в аренду, прежде чем считается неудачным
+MAX_DELIVERY_ATTEMPTS = 3
+
+# Формат run_key запуска: время начала рассылки в UTC
+RUN_KEY_FORMAT = "%Y-%m-%dT%H:%M"
+
+_REPORT_TIME_RE = re.compile(
+    r"^(\d{1,2}):(\d{2})(?:\s*(?:UTC|GMT)?\s*([+-])(\d{1,2})(?::?(\d{2}))?)?$",
+    re.IGNORECASE,
+)
+
+
+def slot_offset(user_id: int, window_seconds: int) -> int:
+    """Смещение слота пользователя от начала окна (стабильно между запусками)."""
+    return zlib.crc32(str(user_id).encode()) % max(window_seconds, 1)
+
+
+def preferred_due_at(run_start: datetime, local_minutes: int, utc_offset_minutes: int) -> datetime:
+    """Ближайшее начиная с `run_start` наступление местного времени пользователя, в UTC."""
+    local_start = run_start + timedelta(minutes=utc_offset_minutes)
+    due_local = datetime.combine(local_start.date(), time(), tzinfo=run_start.tzinfo) + timedelta(minutes=local_minutes)
+    if due_local < local_start:
+        due_local += timedelta(days=1)
+    return due_local - timedelta(minutes=utc_offset_minutes)
+
+
+def parse_report_time(text: str) -> Tuple[int, int]:
+    """Разбирает «ЧЧ:ММ [UTC±Ч[:ММ]]» в (минуты от полуночи, смещение от UTC в минутах)."""
+    m = _REPORT_TIME_RE.match(text.strip())
+    if not m:
+        raise ValueError(f"Invalid report time: {text!r}")
+    hours, minutes = int(m.group(1)), int(m.group(2))
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Invalid report time: {text!r}")
+    offset = 0
+    if m.group(3):
+        offset = int(m.group(4)) * 60 + int(m.group(5) or 0)
+        if offset > 14 * 60:
+            raise ValueError(f"Invalid UTC offset: {text!r}")
+        if m.group(3) == "-":
+            offset = -offset
+    return hours * 60 + minutes, offset
+
+
+class StaggeredReportScheduler:
+    """Планирует слоты доставки отчёта и рассылает наступившие слоты пачками."""
+
+    def __init__(
+        self,
+        *,
+        bot: Bot,
+        report_fn: ReportFn,
+        job_name: str,
+        report_name: str = "Unnamed report",
+        batch_fn: Optional[BatchReportFn] = None,
+        window_minutes: Optional[int] = None,
+        batch_size: Optional[int] = None,
+    ):
+        self.bot = bot
+        self.report_fn = report_fn
+        self.batch_fn = batch_fn
+        self.job_name = job_name
+        self.report_name = report_name
+        self.window = timedelta(minutes=window_minutes or settings.REPORT_WINDOW_MINUTES)
+        self.batch_size = batch_size or settings.REPORT_BATCH_SIZE
+        self._lock = asyncio.Lock()
+        self.plan_job_name = f"{job_name}.plan"
+        register_job(self.plan_job_name, self._plan_run)
+
+    async def plan(self, run_start: Optional[datetime] = None) -> bool:
+        """Планирует запуск, начинающийся в `run_start`, если его ещё не спланировала другая реплика.
+
+        Returns:
+            True, если планирование выполнила эта реплика.
+        """
+        run_start = (run_start or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+        return await run_job(self.plan_job_name, run_start.strftime(RUN_KEY_FORMAT))
+
+    async def _plan_run(self, run_key: str) -> None:
+        run_start = datetime.strptime(run_key, RUN_KEY_FORMAT).replace(tzinfo=timezone.utc)
+        await self.plan_slots(run_start, run_key)
+
+    async def plan_slots(self, run_start: datetime, run_key: str) -> int:
+        """Назначает слоты всем пользователям на запуск `run_key`.
+
+        Повторный вызов для того же запуска ничего не меняет.
+
+        Returns:
+            Количество новых слотов.
+        """
+        window_seconds = int(self.window.total_seconds())
+
+        async with await get_read_session() as session:
+            result = await session.execute(
+                select(User.id, ReportPreference.local_minutes, ReportPreference.utc_offset_minutes)
+                .outerjoin(ReportPreference, ReportPreference.user_id == User.id)
+            )
+            users = result.all()
+
+        rows = []
+        for user_id, local_minutes, utc_offset in users:
+            if local_minutes is not None:
+                due_at = preferred_due_at(run_start, local_minutes, utc_offset or 0)
+            else:
+                due_at = run_start + timedelta(seconds=slot_offset(user_id, window_seconds))
+            rows.append({
+                "job_name": self.job_name,
+                "run_key": run_key,
+                "user_id": user_id,
+                "due_at": due_at,
+                "status": "pending",
+            })
+
+        created = await run_write(lambda session: self._insert_slots(session, rows))
+        logger.info(f"Planned '{self.report_name}' run {run_key}: {created} new slots over {self.window}")
+        return created
+
+    @staticmethod
+    async def _insert_slots(session: AsyncSession, rows: List[Dict]) -> int:
+        if not rows:
+            return 0
+        stmt = dialect_insert(session, ScheduledDelivery).on_conflict_do_nothing(
+            index_elements=["job_name", "run_key", "user_id"]
+        )
+        conn = await session.connection()
+        result = await conn.execute(stmt, rows)
+        return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+
+    async def process_due(self, now: Optional[datetime] = None) -> int:
+        """Рассылает все наступившие слоты пачками по `batch_size`.
+
+        Returns:
+            Количество обработанных слотов.
+        """
+        if self._lock.locked():
+            # Предыдущий тик ещё рассылает — он заберёт и эти слоты
+            return 0
+        async with self._lock:
+            now = now or datetime.now(timezone.utc)
+            await run_write(lambda session: self._expire_slots(session, now))
+
+            processed = 0
+            while True:
+                token = new_lease_token()
+                due = await run_write(lambda session: self._claim_due(session, now, token))
+                if not due:
+                    break
+                await self._dispatch_batch(due, token)
+                processed += len(due)
+            return processed
+
+    async def _expire_slots(self, session: AsyncSession, now: datetime) -> None:
+        """Снимает с рассылки сильно просроченные слоты и слоты, исчерпавшие попытки."""
+        pending = (
+            update(ScheduledDelivery)
+            .where(ScheduledDelivery.job_name == self.job_name)
+            .where(ScheduledDelivery.status == "pending")
+            .where(or_(ScheduledDelivery.lease_until.is_(None), ScheduledDelivery.lease_until < now))
+        )
+        expired = await session.execute(
+            pending.where(ScheduledDelivery.due_at < now - MAX_DELIVERY_DELAY)
+            .values(status="expired", done_at=now, lease_owner=None, lease_until=None)
+        )
+        exhausted = await session.execute(
+            pending.where(ScheduledDelivery.attempts >= MAX_DELIVERY_ATTEMPTS)
+            .values(status="failed", done_at=now, lease_owner=None, lease_until=None)
+        )
+        if expired.rowcount or exhausted.rowcount:
+            logger.warning(
+                f"'{self.report_name}': expired {expired.rowcount} overdue slots, "
+                f"gave up on {exhausted.rowcount} slots after {MAX_DELIVERY_ATTEMPTS} attempts"
+            )
+
+    async def _claim_due(self, session: AsyncSession, now: datetime, token: str) -> List[Tuple[int, int]]:
+        """Берёт в аренду до `batch_size` наступивших слотов и возвращает их (id, user_id)."""
+        claimable = (
+            (ScheduledDelivery.job_name == self.job_name)
+            & (ScheduledDelivery.status == "pending")
+            & (ScheduledDelivery.due_at <= now)
+            & (ScheduledDelivery.attempts < MAX_DELIVERY_ATTEMPTS)
+            & or_(ScheduledDelivery.lease_until.is_(None), ScheduledDelivery.lease_until < now)
+        )
+        batch = (
+            select(ScheduledDelivery.id)
+            .where(claimable)
+            .order_by(ScheduledDelivery.due_at)
+            .limit(self.batch_size)
+            .scalar_subquery()
+        )
+        # Условия повторяются во внешнем WHERE: в PostgreSQL при гонке двух реплик
+        # они перепроверяются по закоммиченной строке, и слот достаётся одной из них
+        await session.execute(
+            update(ScheduledDelivery)
+            .where(ScheduledDelivery.id.in_(batch))
+            .where(claimable)
+            .values(
+                lease_owner=token,
+                lease_until=datetime.now(timezone.utc) + lease_ttl(),
+                attempts=ScheduledDelivery.attempts + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(
+            select(ScheduledDelivery.id, ScheduledDelivery.user_id)
+            .where(ScheduledDelivery.lease_owner == token)
+            .where(ScheduledDelivery.status == "pending")
+        )
+        return [tuple(row) for row in result.all()]
+
+    async def _dispatch_batch(self, due: List[Tuple[int, int]], token: str) -> None:
+        slots_by_user: Dict[int, List[int]] = {}
+        for slot_id, user_id in due:
+            slots_by_user.setdefault(user_id, []).append(slot_id)
+        outstanding = set(slots_by_user)
+
+        async def record(user_id: int, status: str) -> None:
+            # Итог пишем сразу после отправки: после сбоя повторно уйдут только неотмеченные
+            slot_ids = slots_by_user[user_id]
+            marked = await run_write(lambda session: self._mark_done(session, slot_ids, status, token))
+            outstanding.discard(user_id)
+            if not marked:
+                logger.warning(f"'{self.report_name}': slots of user {user_id} were re-leased by another replica")
+
+        dispatcher = ReportDispatcher(
+            bot=self.bot,
+            report_fn=self.report_fn,
+            report_name=self.report_name,
+            batch_fn=self.batch_fn,
+            on_outcome=record,
+        )
+        dispatch = asyncio.create_task(dispatcher.run(slots_by_user.keys()))
+        keeper = asyncio.create_task(self._keep_lease(token, outstanding))
+        try:
+            await asyncio.wait({dispatch, keeper}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            keeper.cancel()
+        if not dispatch.done():
+            # Аренду перехватила другая реплика: оставшиеся слоты рассылает теперь она
+            dispatch.cancel()
+            await asyncio.gather(dispatch, return_exceptions=True)
+            logger.warning(
+                f"'{self.report_name}': lease {token} was lost, stopped before {len(outstanding)} users"
+            )
+            return
+        dispatch.result()
+
+    async def _keep_lease(self, token: str, outstanding: set) -> None:
+        """Продлевает аренду пачки, пока она рассылается; возвращается, если аренду потеряли.
+
+        Без продления пачка, которая рассылается дольше `JOB_LEASE_SECONDS` (например,
+        из-за долгих `RetryAfter`), досталась бы другой реплике и ушла бы повторно.
+        """
+        interval = max(lease_ttl().total_seconds() / 3, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await run_write(lambda session: self._renew_slots(session, token))
+            except Exception:
+                logger.exception(f"Failed to renew lease {token} of '{self.report_name}' slots")
+                continue
+            # 0 строк при неотмеченных пользователях — слоты забрала другая реплика
+            if not renewed and outstanding:
+                return
+
+    @staticmethod
+    async def _renew_slots(session: AsyncSession, token: str) -> int:
+        result = await session.execute(
+            update(ScheduledDelivery)
+            .where(ScheduledDelivery.lease_owner == token)
+            .where(ScheduledDelivery.status == "pending")
+            .values(lease_until=datetime.now(timezone.utc) + lease_ttl())
+        )
+        return result.rowcount
+
+    @staticmethod
+    async def _mark_done(session: AsyncSession, slot_ids: List[int], status: str, token: str) -> int:
+        result = await session.execute(
+            update(ScheduledDelivery)
+            .where(ScheduledDelivery.id.in_(slot_ids))
+            .where(ScheduledDelivery.lease_owner == token)
+            .values(status=status, done_at=datetime.now(timezone.utc), lease_owner=None, lease_until=None)
+        )
+        return result.rowcount
+
+    def start(self, cron: str) -> None:
+        """Планирует запуски по `cron` и ежеминутную обработку наступивших слотов."""
+        @aiocron.crontab(cron)
+        async def plan_task():
+            try:
+                await self.plan()
+            except Exception:
+                logging.exception(f"Planning '{self.report_name}' failed")
+
+        @aiocron.crontab(TICK_CRON)
+        async def tick_task():
+            try:
+                await self.process_due()
+            except Exception:
+                logging.exception(f"Processing due '{self.report_name}' slots failed")
+
+        logger.info(f"'{self.report_name}' scheduled at '{cron}', spread over {self.window}")
@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 import logging
 
 from app.services.asset_service import AssetService
+from app.services.capital_cache import capital_cache
 from app.services.rates.converter import CurrencyConverter
 
 
@@ -17,11 +18,15 @@ async def get_growth_data(service: AssetService, user_id: int) -> Tuple[datetime
     return prev_month_last_day, now, prev_capital, current_capital
 
 
-async def compute_totals_usd_rub(assets_by_currency: dict) -> Tuple[float, float, datetime | None]:
+async def compute_totals_usd_rub(
+    assets_by_currency: dict,
+    converter: Optional[CurrencyConverter] = None,
+) -> Tuple[float, float, datetime | None]:
     """Считает общие итоги по всем активам в USD и RUB, возвращает также последний updated_at."""
-    converter = CurrencyConverter()
-    await converter.update_fiat_rates()
-    await converter.update_crypto_rates()
+    if converter is None:
+        converter = CurrencyConverter()
+        await converter.update_fiat_rates()
+        await converter.update_crypto_rates()
 
     total_usd = 0.0
     total_rub = 0.0
@@ -44,3 +49,37 @@ async def compute_totals_usd_rub(assets_by_currency: dict) -> Tuple[float, float
             logging.exception(f"Ошибка конвертации {currency}")
 
     return total_usd, total_rub, last_updated
+
+
+async def get_assets_overview(service: AssetService, user_id: int) -> Optional[Tuple[dict, float, float, datetime | None, set[str]]]:
+    """Данные для /list_assets: активы по валютам, итоги в USD/RUB, updated_at и нераспознанные валюты.
+
+    Результат кэшируется до следующей записи активов пользователя или обновления курсов.
+    Возвращает None, если активов нет.
+    """
+    positions_version = capital_cache.positions_version(user_id)
+    cached = capital_cache.get(user_id, "overview")
+    if cached is not None:
+        return cached
+
+    assets_by_currency = await service.get_detailed_assets_list(user_id)
+    if not assets_by_currency:
+        return None
+
+    # Один конвертер на весь расчёт: и проверка валют, и итоги
+    converter = service.converter
+    await converter.update_fiat_rates()
+    await converter.update_crypto_rates()
+
+    # Нераспознанные валюты: пробуем сконвертировать 1 ед. в USD
+    unknown_currencies: set[str] = set()
+    for cur in assets_by_currency.keys():
+        try:
+            _ = await converter.convert(1.0, cur, "USD")
+        except Exception:
+            unknown_currencies.add(cur)
+
+    total_usd, total_rub, updated_at = await compute_totals_usd_rub(assets_by_currency, converter)
+    overview = (assets_by_currency, total_usd, total_rub, updated_at, unknown_currencies)
+    capital_cache.put(user_id, "overview", overview, positions_version)
+    return overview
@@ -1,10 +1,18 @@
-from sqlalchemy import select
+from sqlalchemy import select, func
 from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
 import logging
 
 from app.db.models import User, Entry, Currency
 from app.services.rates.converter import CurrencyConverter
 
+# Валюты, в которых показываются итоги еженедельного отчёта
+WEEKLY_REPORT_CURRENCIES = ("RUB", "USD", "VND")
+
+# До скольких пользователей фильтруем агрегат через IN; для больших пачек дешевле
+# посчитать всех и отфильтровать в памяти
+_USER_FILTER_LIMIT = 500
+
 
 async def get_last_week_range() -> tuple[datetime, datetime]:
     """
@@ -33,7 +41,7 @@ async def get_weekly_expenses(session, user_id: int) -> list[Entry]:
 async def build_report(user_id: int, session) -> str:
     entries = await get_weekly_expenses(session, user_id)
     if not entries:
-        return "📊 За прошлую неделю у вас не было расходов."
+        return render_weekly_report(None)
 
     currency_ids = list(set(e.currency_id for e in entries if e.currency_id))
     currency_map = {}
@@ -45,7 +53,7 @@ async def build_report(user_id: int, session) -> str:
     await converter.update_fiat_rates()
     await converter.update_crypto_rates()
 
-    totals = {"RUB": 0, "USD": 0, "VND": 0}
+    totals = {target: 0 for target in WEEKLY_REPORT_CURRENCIES}
     for entry in entries:
         currency = currency_map.get(entry.currency_id, "USD")
         for target in totals:
@@ -56,9 +64,74 @@ async def build_report(user_id: int, session) -> str:
                 logging.exception(f"Failed to convert {entry.amount} {currency} to {target}")
                 continue
 
+    return render_weekly_report(totals)
+
+
+def render_weekly_report(totals: Optional[Dict[str, float]]) -> str:
+    """Текст еженедельного отчёта по уже посчитанным итогам (None — расходов не было)."""
+    if not totals:
+        return "📊 За прошлую неделю у вас не было расходов."
     return "\n".join([
         "📅 Расходы за прошлую неделю:",
         f"• 🇷🇺 {totals['RUB']:.2f} RUB",
         f"• 🇺🇸 {totals['USD']:.2f} USD",
         f"• 🇻🇳 {totals['VND']:.2f} VND"
     ])
+
+
+async def compute_weekly_totals(
+    session,
+    user_ids: Optional[Iterable[int]] = None,
+    converter: Optional[CurrencyConverter] = None,
+) -> Dict[int, Dict[str, float]]:
+    """
+    Итоги расходов за прошлую неделю сразу для многих пользователей.
+
+    Суммы считаются одним запросом `GROUP BY user_id, currency_id`, а затем
+    переводятся в валюты отчёта по одному снимку курсов: одна конвертация на
+    валюту, а не на запись. В результат попадают только пользователи с расходами.
+    """
+    start, end = await get_last_week_range()
+    query = (
+        select(Entry.user_id, Currency.code, func.sum(Entry.amount))
+        .outerjoin(Currency, Currency.id == Entry.currency_id)
+        .where(Entry.mode == "expense")
+        .where(Entry.created_at.between(start, end))
+        .group_by(Entry.user_id, Entry.currency_id, Currency.code)
+    )
+    if user_ids is not None:
+        query = query.where(Entry.user_id.in_(list(user_ids)))
+    rows = (await session.execute(query)).all()
+    if not rows:
+        return {}
+
+    if converter is None:
+        converter = CurrencyConverter()
+        await converter.update_fiat_rates()
+        await converter.update_crypto_rates()
+
+    # Курс каждой встретившейся валюты к каждой валюте отчёта (None — не конвертируется)
+    rates: Dict[str, Dict[str, Optional[float]]] = {}
+    for code in {code or "USD" for _, code, _ in rows}:
+        rates[code] = {}
+        for target in WEEKLY_REPORT_CURRENCIES:
+            try:
+                rates[code][target] = await converter.convert(1.0, code, target)
+            except Exception:
+                logging.exception(f"Failed to convert {code} to {target}")
+                rates[code][target] = None
+
+    totals: Dict[int, Dict[str, float]] = {}
+    for user_id, code, amount in rows:
+        user_totals = totals.setdefault(user_id, {target: 0 for target in WEEKLY_REPORT_CURRENCIES})
+        for target, rate in rates[code or "USD"].items():
+            if rate is not None:
+                user_totals[target] += float(amount) * rate
+    return totals
+
+
+async def build_reports_batch(session, user_ids: Iterable[int]) -> Dict[int, str]:
+    """Тексты еженедельного отчёта для всех `user_ids` по одному агрегирующему запросу."""
+    user_ids = list(user_ids)
+    totals = await compute_weekly_totals(session, user_ids if len(user_ids) <= _USER_FILTER_LIMIT else None)
+    return {user_id: render_weekly_report(totals.get(user_id)) for user_id in user_ids}
@@ -0,0 +1,219 @@
+"""
+Поддержка материализованной таблицы `AssetLatestValues`.
+
+Позиция актива — пара (валюта, категория) пользователя; в `AssetLatestValues` хранится
+её последнее значение. При удалении/редактировании записи предыдущее значение позиции
+ищется одним seek-ом по индексу `ix_entry_user_mode_position_created_at` (LIMIT 1),
+а не выборкой всей истории позиции.
+
+Проверка и перестроение таблицы из истории записей:
+    python -m app.services.asset_positions verify [--user-id N]
+    python -m app.services.asset_positions rebuild [--user-id N]
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import Entry, Currency, Category, AssetLatestValues
+from app.db.versions import mark_changed
+
+logger = logging.getLogger(__name__)
+
+PositionKey = Tuple[int, str, Optional[str]]  # (user_id, currency_code, category_name)
+
+
+class AssetPositionService:
+    """Поддерживает `AssetLatestValues` в согласии с историей записей активов."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def previous_value(self, entry: Entry) -> Optional[Entry]:
+        """Последняя запись той же позиции, не считая `entry` (LIMIT 1 по индексу)."""
+        result = await self.session.execute(
+            select(Entry)
+            .where(Entry.user_id == entry.user_id)
+            .where(Entry.mode == "asset")
+            .where(Entry.currency_id == entry.currency_id)
+            .where(Entry.category_id == entry.category_id)
+            .where(Entry.id != entry.id)
+            .order_by(Entry.created_at.desc(), Entry.id.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    async def _position_names(self, entry: Entry) -> Tuple[Optional[str], Optional[str]]:
+        currency = await self.session.get(Currency, entry.currency_id) if entry.currency_id else None
+        category = await self.session.get(Category, entry.category_id) if entry.category_id else None
+        return (currency.code if currency else None), (category.name if category else None)
+
+    async def remove_entry(self, entry: Entry) -> None:
+        """Удаляет запись и, если это актив, чинит последнее значение его позиции.
+
+        Всё выполняется в транзакции вызывающей стороны: удаление записи и правка
+        `AssetLatestValues` коммитятся вместе.
+        """
+        if entry.mode == "asset":
+            await self._repair_after_removal(entry)
+        mark_changed(self.session, "entries", entry.user_id)
+        await self.session.delete(entry)
+        await self.session.flush()
+
+    async def _repair_after_removal(self, entry: Entry) -> None:
+        currency_code, category_name = await self._position_names(entry)
+        if not currency_code:
+            return
+
+        latest = (await self.session.execute(
+            select(AssetLatestValues)
+            .where(AssetLatestValues.user_id == entry.user_id)
+            .where(AssetLatestValues.currency_code == currency_code)
+            .where(AssetLatestValues.category_name == category_name)
+        )).scalar_one_or_none()
+
+        # Последнее значение позиции ссылается на другую запись — чинить нечего
+        if latest is not None and latest.entry_id not in (None, entry.id):
+            return
+
+        previous = await self.previous_value(entry)
+        mark_changed(self.session, "assets", entry.user_id)
+        if previous is not None:
+            if latest is None:
+                latest = AssetLatestValues(
+                    user_id=entry.user_id,
+                    currency_code=currency_code,
+                    category_name=category_name,
+                )
+                self.session.add(latest)
+            latest.amount = previous.amount
+            latest.entry_id = previous.id
+            latest.last_updated = datetime.now(timezone.utc)
+        elif latest is not None:
+            await self.session.delete(latest)
+
+    def _expected_query(self, user_id: Optional[int]):
+        """Последние значения позиций по истории записей (одна строка на позицию)."""
+        ranked = select(
+            Entry.id,
+            Entry.user_id,
+            Entry.currency_id,
+            Entry.category_id,
+            Entry.amount,
+            func.row_number().over(
+                partition_by=(Entry.user_id, Entry.currency_id, Entry.category_id),
+                order_by=(Entry.created_at.desc(), Entry.id.desc()),
+            ).label("rn"),
+        ).where(Entry.mode == "asset").where(Entry.currency_id.is_not(None))
+        if user_id is not None:
+            ranked = ranked.where(Entry.user_id == user_id)
+        ranked = ranked.subquery()
+
+        return (
+            select(ranked.c.user_id, Currency.code, Category.name, ranked.c.amount, ranked.c.id)
+            .select_from(ranked)
+            .join(Currency, Currency.id == ranked.c.currency_id)
+            .outerjoin(Category, Category.id == ranked.c.category_id)
+            .where(ranked.c.rn == 1)
+        )
+
+    async def _expected(self, user_id: Optional[int]) -> Dict[PositionKey, Tuple[float, int]]:
+        result = await self.session.execute(self._expected_query(user_id))
+        return {
+            (uid, code, name): (amount, entry_id)
+            for uid, code, name, amount, entry_id in result.all()
+        }
+
+    async def verify(self, user_id: Optional[int] = None) -> List[Dict]:
+        """Сверяет `AssetLatestValues` с историей записей.
+
+        Returns:
+            Список расхождений: `{"key": (user_id, code, category), "problem": ..., ...}`,
+            где problem — "missing" (нет строки), "stale" (другое значение/запись)
+            или "orphan" (строка есть, а записей по позиции нет).
+        """
+        expected = await self._expected(user_id)
+
+        query = select(AssetLatestValues)
+        if user_id is not None:
+            query = query.where(AssetLatestValues.user_id == user_id)
+        actual = {
+            (row.user_id, row.currency_code, row.category_name): row
+            for row in (await self.session.execute(query)).scalars().all()
+        }
+
+        problems: List[Dict] = []
+        for key, (amount, entry_id) in expected.items():
+            row = actual.get(key)
+            if row is None:
+                problems.append({"key": key, "problem": "missing", "expected": amount})
+            elif row.amount != amount or row.entry_id != entry_id:
+                problems.append({
+                    "key": key, "problem": "stale",
+                    "expected": amount, "actual": row.amount,
+                    "expected_entry_id": entry_id, "actual_entry_id": row.entry_id,
+                })
+        for key, row in actual.items():
+            if key not in expected:
+                problems.append({"key": key, "problem": "orphan", "actual": row.amount})
+        return problems
+
+    async def rebuild(self, user_id: Optional[int] = None) -> int:
+        """Перестраивает `AssetLatestValues` из истории записей. Коммит — на вызывающей стороне.
+
+        Returns:
+            Количество записанных позиций.
+        """
+        expected = await self._expected(user_id)
+
+        stmt = delete(AssetLatestValues)
+        if user_id is not None:
+            stmt = stmt.where(AssetLatestValues.user_id == user_id)
+        await self.session.execute(stmt)
+
+        for uid in {key[0] for key in expected} | ({user_id} if user_id is not None else set()):
+            mark_changed(self.session, "assets", uid)
+
+        now = datetime.now(timezone.utc)
+        self.session.add_all([
+            AssetLatestValues(
+                user_id=uid,
+                currency_code=code,
+                category_name=name,
+                amount=amount,
+                entry_id=entry_id,
+                last_updated=now,
+            )
+            for (uid, code, name), (amount, entry_id) in expected.items()
+        ])
+        await self.session.flush()
+        return len(expected)
+
+
+async def _cli(command: str, user_id: Optional[int]) -> None:
+    from app.db import get_read_session, run_write, close_db
+
+    try:
+        if command == "verify":
+            async with await get_read_session() as session:
+                problems = await AssetPositionService(session).verify(user_id)
+            for p in problems:
+                print(p)
+            print(f"{len(problems)} problem(s) found")
+        else:
+            count = await run_write(lambda session: AssetPositionService(session).rebuild(user_id))
+            print(f"Rebuilt {count} asset position(s)")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка и перестроение AssetLatestValues")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(_cli(args.command, args.user_id))
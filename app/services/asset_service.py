@@ -8,12 +8,13 @@ from decimal import Decimal
 from typing import Dict, List, Optional, Tuple
 
 from sqlalchemy import select, func, and_, or_
-from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models import (
     Entry, Currency, Category, CapitalSnapshot, CurrencyRate, AssetLatestValues, User
 )
+from app.db.versions import mark_changed
+from app.services.capital_cache import capital_cache
 from app.services.rates.converter import CurrencyConverter
 
 logger = logging.getLogger(__name__)
@@ -39,16 +40,14 @@ class AssetService:
         """
         if target_currencies is None:
             target_currencies = ["RUB", "USD"]
-        
-        # Для SQLite в WAL режиме принудительно синхронизируемся с БД
-        # Это гарантирует, что мы видим все закоммиченные изменения из других транзакций
-        if hasattr(self.session.bind, 'sync_engine') and 'sqlite' in str(self.session.bind.url):
-            # Выполняем простой запрос для синхронизации с WAL
-            try:
-                await self.session.execute(text("SELECT 1"))
-            except Exception:
-                pass  # Игнорируем ошибки
-        
+
+        # Между записями активов и обновлениями курсов отвечаем из кэша
+        cache_kind = ("current", tuple(target_currencies))
+        positions_version = capital_cache.positions_version(user_id)
+        cached = capital_cache.get(user_id, cache_kind)
+        if cached is not None:
+            return dict(cached)
+
         # Получаем последние значения по каждому активу
         latest_assets = await self.session.execute(
             select(AssetLatestValues)
@@ -71,7 +70,9 @@ class AssetService:
             )
             entry_count = entry_check.scalar()
             logger.warning(f"No assets in AssetLatestValues for user {user_id}, but found {entry_count} entries in Entry table")
-            return {currency: 0.0 for currency in target_currencies}
+            totals = {currency: 0.0 for currency in target_currencies}
+            capital_cache.put(user_id, cache_kind, dict(totals), positions_version)
+            return totals
         
         # Получаем текущие курсы
         await self.converter.update_fiat_rates()
@@ -79,6 +80,7 @@ class AssetService:
         
         # Инициализируем итоги
         totals = {currency: 0.0 for currency in target_currencies}
+        failed = False
         
         # Конвертируем каждый актив в целевые валюты
         for asset in assets:
@@ -91,8 +93,12 @@ class AssetService:
                     )
                     totals[target_currency] += converted
                 except Exception as e:
+                    failed = True
                     logger.error(f"Failed to convert {asset.amount} {asset.currency_code} to {target_currency}: {e}")
-                    
+
+        # Итог без части активов не кэшируем: следующий запрос посчитает капитал заново
+        if not failed:
+            capital_cache.put(user_id, cache_kind, dict(totals), positions_version)
         return totals
     
     async def get_capital_for_date(self, user_id: int, target_date: date, target_currencies: List[str] = None) -> Dict[str, float]:
@@ -132,68 +138,90 @@ class AssetService:
     async def _recalculate_capital_for_date(self, user_id: int, target_date: date, target_currencies: List[str]) -> Dict[str, float]:
         """
         Пересчитывает капитал на определённую дату по историческим данным.
+
+        Последнее значение каждой позиции (валюта + категория) на дату выбирается
+        в БД оконной функцией, поэтому в Python приходит по одной строке на позицию.
         """
-        # Получаем все активы пользователя на указанную дату
-        assets_query = await self.session.execute(
-            select(Entry.currency_id, Entry.category_id, Entry.amount, Entry.created_at)
+        cutoff = datetime.combine(target_date, datetime.max.time(), timezone.utc)
+        ranked = (
+            select(
+                Entry.currency_id,
+                Entry.amount,
+                func.row_number().over(
+                    partition_by=(Entry.currency_id, Entry.category_id),
+                    order_by=(Entry.created_at.desc(), Entry.id.desc()),
+                ).label("rn"),
+            )
             .where(Entry.user_id == user_id)
             .where(Entry.mode == "asset")
-            .where(Entry.created_at <= datetime.combine(target_date, datetime.max.time(), timezone.utc))
-            .order_by(Entry.currency_id, Entry.category_id, Entry.created_at.desc())
+            .where(Entry.created_at <= cutoff)
+            .subquery()
         )
-        
-        entries = assets_query.all()
-        if not entries:
+        positions_query = await self.session.execute(
+            select(Currency.code, ranked.c.amount)
+            .select_from(ranked)
+            .outerjoin(Currency, Currency.id == ranked.c.currency_id)
+            .where(ranked.c.rn == 1)
+        )
+
+        positions = [(code or "USD", amount) for code, amount in positions_query.all()]
+        if not positions:
             return {currency: 0.0 for currency in target_currencies}
-        
-        # Группируем по валюте + категории и берём последние значения на указанную дату
-        asset_latest = {}
-        for currency_id, category_id, amount, created_at in entries:
-            key = (currency_id, category_id)
-            if key not in asset_latest:
-                asset_latest[key] = (amount, created_at)
-        
-        # Получаем коды валют и категорий
-        currency_ids = list(set(key[0] for key in asset_latest.keys() if key[0] is not None))
-        category_ids = list(set(key[1] for key in asset_latest.keys() if key[1] is not None))
-        
-        currencies = {}
-        if currency_ids:
-            currency_result = await self.session.execute(
-                select(Currency).where(Currency.id.in_(currency_ids))
-            )
-            currencies = {c.id: c.code for c in currency_result.scalars().all()}
-        
-        categories = {}
-        if category_ids:
-            category_result = await self.session.execute(
-                select(Category).where(Category.id.in_(category_ids))
-            )
-            categories = {c.id: c.name for c in category_result.scalars().all()}
-        
+
+        rates = await self.get_historical_rates({code for code, _ in positions}, target_date)
+        await self.converter.update_fiat_rates()
+
         # Конвертируем по историческим курсам
         totals = {currency: 0.0 for currency in target_currencies}
-        for (currency_id, category_id), (amount, created_at) in asset_latest.items():
-            currency_code = currencies.get(currency_id, "USD")
+        for currency_code, amount in positions:
             try:
-                # Используем исторический курс
-                rate = await self.get_historical_rate(currency_code, target_date)
+                rate = rates.get(currency_code)
+                if rate is None:
+                    # Исторических данных нет — используем текущий курс
+                    logger.warning(f"No historical rate found for {currency_code} on {target_date}, using current rate")
+                    await self.converter.update_crypto_rates()
+                    rate = await self.converter.convert(1.0, currency_code, "USD")
                 amount_in_usd = float(amount) * rate
-                
+
                 for target_currency in target_currencies:
                     if target_currency == "USD":
                         totals[target_currency] += amount_in_usd
                     else:
                         # Конвертируем из USD в целевую валюту
-                        await self.converter.update_fiat_rates()
                         converted = await self.converter.convert(amount_in_usd, "USD", target_currency)
                         totals[target_currency] += converted
-                        
+
             except Exception as e:
                 logger.error(f"Failed to convert {amount} {currency_code} for date {target_date}: {e}")
-                
+
         return totals
-    
+
+    async def get_historical_rates(self, currency_codes: set[str], target_date: date) -> Dict[str, float]:
+        """
+        Получает исторические курсы сразу для нескольких валют одним запросом:
+        для каждой валюты — курс на дату или ближайший предыдущий.
+        Валюты без сохранённых курсов в результат не попадают.
+        """
+        if not currency_codes:
+            return {}
+        ranked = (
+            select(
+                CurrencyRate.currency_code,
+                CurrencyRate.rate_to_usd,
+                func.row_number().over(
+                    partition_by=CurrencyRate.currency_code,
+                    order_by=CurrencyRate.rate_date.desc(),
+                ).label("rn"),
+            )
+            .where(CurrencyRate.currency_code.in_(currency_codes))
+            .where(CurrencyRate.rate_date <= target_date)
+            .subquery()
+        )
+        result = await self.session.execute(
+            select(ranked.c.currency_code, ranked.c.rate_to_usd).where(ranked.c.rn == 1)
+        )
+        return {code: float(rate) for code, rate in result.all() if rate}
+
     async def get_historical_rate(self, currency_code: str, target_date: date) -> float:
         """
         Получает исторический курс валюты на определённую дату.
@@ -228,41 +256,16 @@ class AssetService:
         await self.converter.update_crypto_rates()
         return await self.converter.convert(1.0, currency_code, "USD")
     
-    async def create_monthly_snapshot(self, user_id: int, target_date: Optional[date] = None) -> bool:
+    async def has_snapshot(self, user_id: int, target_date: date) -> bool:
         """
-        Создаёт снэпшот капитала на определённую дату.
+        Проверяет, есть ли у пользователя снэпшот капитала на дату.
         """
-        if target_date is None:
-            target_date = date.today()
-        
-        # Проверяем, нет ли уже снэпшота
         existing = await self.session.execute(
             select(CapitalSnapshot.id)
             .where(CapitalSnapshot.user_id == user_id)
             .where(CapitalSnapshot.snapshot_date == target_date)
         )
-        
-        if existing.scalar_one_or_none():
-            return False  # Снэпшот уже существует
-        
-        try:
-            # Получаем капитал на указанную дату
-            capital = await self.get_capital_for_date(user_id, target_date, ["USD", "RUB"])
-            
-            # Сохраняем снэпшот
-            snapshot = CapitalSnapshot(
-                user_id=user_id,
-                snapshot_date=target_date,
-                total_usd=capital["USD"],
-                total_rub=capital["RUB"]
-            )
-            self.session.add(snapshot)
-            await self.session.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Failed to create snapshot: {e}")
-            await self.session.rollback()
-            return False
+        return existing.scalar_one_or_none() is not None
     
     async def update_latest_asset_value(self, user_id: int, currency_code: str, category_name: str, amount: Decimal, entry_id: int) -> None:
         """
@@ -292,8 +295,9 @@ class AssetService:
                 entry_id=entry_id
             )
             self.session.add(asset_value)
-        
-        await self.session.commit()
+
+        mark_changed(self.session, "assets", user_id)
+        await self.session.flush()
     
     async def get_detailed_assets_list(self, user_id: int) -> List[Dict]:
         """
@@ -319,9 +323,22 @@ class AssetService:
         
         return assets_by_currency
     
-    async def save_current_rates(self, currency_code: str) -> None:
+    async def fetch_rate_to_usd(self, currency_code: str) -> Optional[float]:
+        """
+        Получает текущий курс валюты к USD (сетевой вызов, вне транзакции записи).
+        """
+        await self.converter.update_fiat_rates()
+        await self.converter.update_crypto_rates()
+        try:
+            return await self.converter.convert(1.0, currency_code, "USD")
+        except Exception as e:
+            logger.error(f"Failed to fetch rate for {currency_code}: {e}")
+            return None
+
+    async def save_current_rates(self, currency_code: str, rate_to_usd: Optional[float] = None) -> None:
         """
         Сохраняет текущие курсы валют для исторических расчётов.
+        Если курс уже получен заранее (`rate_to_usd`), сеть не трогаем.
         """
         today = date.today()
         
@@ -335,20 +352,16 @@ class AssetService:
         if existing.scalar_one_or_none():
             return  # Курс уже сохранён
         
-        # Получаем текущий курс
-        await self.converter.update_fiat_rates()
-        await self.converter.update_crypto_rates()
-        
-        try:
-            rate_to_usd = await self.converter.convert(1.0, currency_code, "USD")
-            
-            rate = CurrencyRate(
-                currency_code=currency_code,
-                rate_date=today,
-                rate_to_usd=rate_to_usd,
-                source="api"
-            )
-            self.session.add(rate)
-            await self.session.commit()
-        except Exception as e:
-            logger.error(f"Failed to save rate for {currency_code}: {e}")
+        if rate_to_usd is None:
+            rate_to_usd = await self.fetch_rate_to_usd(currency_code)
+        if rate_to_usd is None:
+            return
+
+        rate = CurrencyRate(
+            currency_code=currency_code,
+            rate_date=today,
+            rate_to_usd=rate_to_usd,
+            source="api"
+        )
+        self.session.add(rate)
+        await self.session.flush()
@@ -0,0 +1,52 @@
+"""
+Кэш рассчитанного капитала пользователя.
+
+Значение действительно, пока не изменились позиции пользователя (версия "assets",
+см. `app.db.versions`) и снимок курсов (`rates_version`). Поэтому повторные
+`/get_asset`, `/list_assets`, `/snapshot_asset` и `/grow_asset` между записями и
+обновлениями курсов отвечают без обращения к БД и без повторной конвертации.
+"""
+from __future__ import annotations
+
+from typing import Any, Hashable, Optional
+
+from app.db.versions import get_version
+from app.services.rates.converter import rates_version
+from app.utils.cache import LRUCache
+
+CAPITAL_CACHE_MAX_ITEMS = 10_000
+
+
+class CapitalCache:
+    """Значения, посчитанные по позициям и курсам, с ключом (user_id, вид расчёта)."""
+
+    def __init__(self, max_items: int = CAPITAL_CACHE_MAX_ITEMS):
+        self._cache = LRUCache(max_items=max_items, name="capital")
+
+    def positions_version(self, user_id: int) -> int:
+        return get_version("assets", user_id)
+
+    def get(self, user_id: int, kind: Hashable) -> Optional[Any]:
+        """Возвращает закэшированное значение или None, если оно устарело."""
+        item = self._cache.get((user_id, kind))
+        if item is None:
+            return None
+        positions_version, rates_ver, value = item
+        current_rates = rates_version()
+        if current_rates is None or rates_ver != current_rates or positions_version != self.positions_version(user_id):
+            return None
+        return value
+
+    def put(self, user_id: int, kind: Hashable, value: Any, positions_version: int) -> None:
+        """Сохраняет значение, посчитанное по позициям версии `positions_version`.
+
+        Версию позиций нужно взять ДО чтения из БД: если во время расчёта закоммитится
+        запись, значение сохранится под старой версией и не будет отдано.
+        """
+        current_rates = rates_version()
+        if current_rates is None:
+            return
+        self._cache.put((user_id, kind), (positions_version, current_rates, value))
+
+
+capital_cache = CapitalCache()
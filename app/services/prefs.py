@@ -0,0 +1,257 @@
+"""
+Кэш списков валют и категорий пользователя (последние выбранные — первыми).
+
+Списки загружаются из БД одним запросом при первом обращении пользователя после
+старта (`load`, его вызывает `PrefsMiddleware` перед обработчиками формы), а дальше
+меняются в памяти вместе с записью в БД. Кэш ограничен по числу пользователей и по
+оценке занимаемой памяти, давно не заходившие пользователи вытесняются по LRU.
+
+Каждый список — `PrefList`: упорядоченный словарь по `casefold()` значения, слитый
+с валютами/категориями по умолчанию. Выбор и удаление значения стоят O(1), а готовый
+слитый список пересобирается один раз после изменения, а не на каждый рендер.
+
+Каждое изменение списков (и каждая загрузка) увеличивает версию "prefs"
+(`app.db.versions`) — по ней кэшируются страницы клавиатур.
+"""
+from __future__ import annotations
+
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.constants.constants import BASE_CURRENCIES, DEFAULT_CATEGORIES
+from app.db import get_read_session
+from app.db.models import Currency, Category
+from app.db.versions import bump, get_version
+from app.repo.repo import get_user_prefs_snapshot
+from app.utils.cache import LRUCache
+
+PREFS_CACHE_MAX_ITEMS = 100_000
+PREFS_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Сколько последних значений хранить в каждом списке
+PREFS_MAX_LEN = 50
+
+
+class PrefList:
+    """Значения пользователя (последние выбранные — первыми), слитые с дефолтными.
+
+    Для значений, у которых есть строка в БД, хранится её id: в callback_data кнопок
+    кладётся короткий токен `u{id}` (или `b{индекс}` для дефолтного значения), а не имя.
+    """
+
+    __slots__ = ("_items", "_ids", "_defaults", "_merged")
+
+    def __init__(self, items: Iterable[Tuple[str, Optional[int]]] = (), defaults: Sequence[str] = ()):
+        self._items: OrderedDict[str, str] = OrderedDict()
+        self._ids: Dict[str, int] = {}
+        for value, row_id in items:
+            key = value.casefold()
+            if key not in self._items:
+                self._items[key] = value
+                if row_id is not None:
+                    self._ids[key] = row_id
+        self._defaults = defaults
+        self._merged: Optional[List[Tuple[str, str]]] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def token(self, value: str) -> str:
+        """Короткий токен значения для callback_data."""
+        key = value.casefold()
+        row_id = self._ids.get(key)
+        if row_id is not None:
+            return f"u{row_id}"
+        index = _default_index(self._defaults).get(key)
+        if index is not None:
+            return f"b{index}"
+        return value
+
+    def user_items(self) -> List[Tuple[str, str]]:
+        """Только значения пользователя с токенами (для экрана удаления)."""
+        return [(value, self.token(value)) for value in self._items.values()]
+
+    def merged(self) -> List[Tuple[str, str]]:
+        """Значения пользователя, затем дефолтные, которых у пользователя нет; с токенами."""
+        if self._merged is None:
+            values = list(self._items.values()) + [
+                d for d in self._defaults if d.casefold() not in self._items
+            ]
+            self._merged = [(value, self.token(value)) for value in values]
+        return self._merged
+
+    def resolve(self, token: str) -> Optional[Tuple[str, Optional[int]]]:
+        """(значение, id строки) по токену; None — если в памяти такого нет."""
+        kind, ref = parse_token(token)
+        if kind == "u":
+            for key, row_id in self._ids.items():
+                if row_id == ref:
+                    return self._items[key], row_id
+            return None
+        if kind == "b":
+            if ref >= len(self._defaults):
+                return None
+            value = self._defaults[ref]
+        else:
+            value = ref
+        key = value.casefold()
+        return self._items.get(key, value), self._ids.get(key)
+
+    def push_front(self, value: str, row_id: Optional[int] = None) -> None:
+        key = value.casefold()
+        self._items.pop(key, None)
+        self._items[key] = value
+        self._items.move_to_end(key, last=False)
+        if row_id is not None:
+            self._ids[key] = row_id
+        while len(self._items) > PREFS_MAX_LEN:
+            dropped, _ = self._items.popitem(last=True)
+            self._ids.pop(dropped, None)
+        self._merged = None
+
+    def remove(self, value: str) -> bool:
+        key = value.casefold()
+        if self._items.pop(key, None) is None:
+            return False
+        self._ids.pop(key, None)
+        self._merged = None
+        return True
+
+
+_DEFAULT_INDEXES: Dict[int, Dict[str, int]] = {}
+
+
+def _default_index(defaults: Sequence[str]) -> Dict[str, int]:
+    # Списки дефолтов общие для всех пользователей — индекс строим один раз на список
+    index = _DEFAULT_INDEXES.get(id(defaults))
+    if index is None:
+        index = _DEFAULT_INDEXES[id(defaults)] = {d.casefold(): i for i, d in enumerate(defaults)}
+    return index
+
+
+def parse_token(token: str) -> Tuple[str, Union[int, str]]:
+    """Разбирает токен кнопки: ("u", id), ("b", индекс) или ("name", имя) для старых кнопок."""
+    if len(token) > 1 and token[0] in "ub" and token[1:].isdigit():
+        return token[0], int(token[1:])
+    return "name", token
+
+
+def _default_categories() -> Dict[str, PrefList]:
+    return {mode: PrefList(defaults=defaults) for mode, defaults in DEFAULT_CATEGORIES.items()}
+
+
+@dataclass(slots=True)
+class UserPrefs:
+    """Списки пользователя: валюты общие, категории — по режимам."""
+    currencies: PrefList = field(default_factory=lambda: PrefList(defaults=BASE_CURRENCIES))
+    categories: Dict[str, PrefList] = field(default_factory=_default_categories)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "UserPrefs":
+        """Из результата `get_user_prefs_snapshot`."""
+        categories = snapshot["categories"]
+        return cls(
+            currencies=PrefList(snapshot["currencies"], BASE_CURRENCIES),
+            categories={
+                mode: PrefList(categories.get(mode, ()), defaults)
+                for mode, defaults in DEFAULT_CATEGORIES.items()
+            },
+        )
+
+    def items(self, mode: Optional[str] = None) -> PrefList:
+        """Список валют (`mode=None`) или категорий режима `mode`."""
+        if mode is None:
+            return self.currencies
+        return self.categories[mode]
+
+
+def _sizeof(prefs: UserPrefs) -> int:
+    lists = [prefs.currencies, *prefs.categories.values()]
+    # Строки значений плюс примерные накладные расходы OrderedDict и слитого списка
+    return 512 + sum(
+        sum(2 * sys.getsizeof(value) + 160 for value, _ in seq.user_items()) for seq in lists
+    )
+
+
+class PrefsCache:
+    """LRU списков пользователей с ленивой загрузкой из БД."""
+
+    def __init__(
+        self,
+        max_items: int = PREFS_CACHE_MAX_ITEMS,
+        max_bytes: int = PREFS_CACHE_MAX_BYTES,
+        session_factory: Callable[[], Awaitable[AsyncSession]] = get_read_session,
+    ):
+        self._cache = LRUCache(max_items=max_items, max_bytes=max_bytes, sizeof=_sizeof, name="user_prefs")
+        self._session_factory = session_factory
+
+    def version(self, user_id: int) -> int:
+        return get_version("prefs", user_id)
+
+    def get(self, user_id: int) -> UserPrefs:
+        """Списки из памяти; если их там нет (не загружены или вытеснены) — пустые."""
+        return self._cache.get(user_id) or UserPrefs()
+
+    async def load(self, user_id: int) -> UserPrefs:
+        """Возвращает списки пользователя, при промахе загружая их из БД."""
+        prefs = self._cache.get(user_id)
+        if prefs is None:
+            prefs = await self.reload(user_id)
+        return prefs
+
+    async def reload(self, user_id: int) -> UserPrefs:
+        """Перечитывает списки пользователя из БД."""
+        async with await self._session_factory() as session:
+            snapshot = await get_user_prefs_snapshot(session, user_id)
+        prefs = UserPrefs.from_snapshot(snapshot)
+        self._cache.put(user_id, prefs)
+        bump("prefs", user_id)
+        return prefs
+
+    async def resolve(self, user_id: int, token: str, mode: Optional[str] = None) -> Optional[Tuple[str, Optional[int]]]:
+        """(значение, id строки) по токену кнопки; `u{id}`, которого нет в памяти, ищется по PK."""
+        resolved = self.get(user_id).items(mode).resolve(token)
+        if resolved is not None:
+            return resolved
+        kind, row_id = parse_token(token)
+        if kind != "u":
+            return None
+        model = Currency if mode is None else Category
+        async with await self._session_factory() as session:
+            row = await session.get(model, row_id)
+        if row is None or row.user_id != user_id or (mode is not None and row.mode != mode):
+            return None
+        return (row.code if mode is None else row.name), row.id
+
+    def push_front(self, user_id: int, value: str, mode: Optional[str] = None, row_id: Optional[int] = None) -> None:
+        """Перемещает значение в начало списка (выбор пользователя)."""
+        value = value.strip()
+        prefs = self._cache.get(user_id)
+        if not value or prefs is None:
+            return
+        prefs.items(mode).push_front(value, row_id)
+        self._changed(user_id, prefs)
+
+    def remove(self, user_id: int, value: str, mode: Optional[str] = None) -> None:
+        """Удаляет значение из списка (без учёта регистра)."""
+        prefs = self._cache.get(user_id)
+        if prefs is None or not prefs.items(mode).remove(value):
+            return
+        self._changed(user_id, prefs)
+
+    def invalidate(self, user_id: int) -> None:
+        """Забывает списки пользователя: следующий `load` перечитает их из БД."""
+        self._cache.pop(user_id)
+        bump("prefs", user_id)
+
+    def _changed(self, user_id: int, prefs: UserPrefs) -> None:
+        # Размер записи не пересчитываем: списки ограничены PREFS_MAX_LEN,
+        # а точная оценка обновится при следующей загрузке
+        bump("prefs", user_id)
+
+
+prefs_cache = PrefsCache()
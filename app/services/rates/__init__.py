@@ -0,0 +1,30 @@
+"""
+Клиенты курсов валют, криптовалют и акций.
+
+Общие для провайдеров метрики: задержка HTTP-запросов, ошибки обновления и
+попадания во внутренний кэш курсов.
+"""
+import time
+
+import httpx
+
+from app.utils.metrics import counter, histogram
+
+RATES_FETCH_SECONDS = histogram("rates_fetch_seconds", "Задержка HTTP-запроса к провайдеру курсов", ["provider"])
+RATES_FETCH_ERRORS = counter("rates_fetch_errors_total", "Неудачные обновления курсов (ушли в кэш или fallback)", ["provider"])
+RATES_CACHE = counter("rates_cache_total", "Обращения к кэшу курсов провайдера", ["provider", "result"])
+
+
+def http_client(provider: str) -> httpx.AsyncClient:
+    """HTTP-клиент провайдера курсов, замеряющий задержку каждого запроса."""
+    observe = RATES_FETCH_SECONDS.labels(provider).observe
+
+    async def on_request(request: httpx.Request) -> None:
+        request.extensions["started_at"] = time.perf_counter()
+
+    async def on_response(response: httpx.Response) -> None:
+        started = response.request.extensions.get("started_at")
+        if started is not None:
+            observe(time.perf_counter() - started)
+
+    return httpx.AsyncClient(timeout=10.0, event_hooks={"request": [on_request], "response": [on_response]})
@@ -1,6 +1,7 @@
 import logging
 from typing import Literal
 
+from app.services.rates import rates_fiat, rates_crypto, rates_stocks
 from app.services.rates.rates_fiat import FiatRatesClient
 from app.services.rates.rates_crypto import CryptoRatesClient
 from app.services.rates.rates_stocks import StockRatesClient
@@ -9,6 +10,18 @@ FiatCurrency = Literal["USD", "RUB", "EUR"]
 CryptoCurrency = Literal["BTC", "ETH", "BNB", "USDT", "USDC"]
 
 
+def rates_version() -> tuple | None:
+    """Идентификатор текущего снимка курсов для ключей кэшей.
+
+    Меняется при каждом обновлении кэша курсов. None — если фиатные или крипто-курсы
+    устарели: следующая конвертация их обновит, и кэшировать результат по ним нельзя.
+    """
+    fiat, crypto = rates_fiat.cached_at(), rates_crypto.cached_at()
+    if fiat is None or crypto is None:
+        return None
+    return fiat, crypto, rates_stocks.cached_at()
+
+
 class CurrencyConverter:
     """
     Оркестратор конвертации между фиатом, криптой и акциями.
@@ -1,6 +1,7 @@
 import logging
 from datetime import datetime, timedelta
-import httpx
+
+from app.services.rates import RATES_CACHE, RATES_FETCH_ERRORS, http_client
 
 CRYPTO_API_URL = "https://api.coingecko.com/api/v3/simple/price"
 
@@ -18,6 +19,13 @@ FALLBACK_RATES_CRYPTO_USD = {
 }
 
 
+def cached_at() -> datetime | None:
+    """Время обновления кэша курсов, если он ещё свежий (иначе None)."""
+    if _cache["timestamp"] and datetime.now() - _cache["timestamp"] < _CACHE_TTL and _cache["data"]:
+        return _cache["timestamp"]
+    return None
+
+
 class CryptoRatesClient:
     def __init__(self):
         self._rates_usd: dict[str, float] = {}
@@ -42,13 +50,15 @@ class CryptoRatesClient:
             and _cache["data"]
         ):
             self._rates_usd = _cache["data"]
+            RATES_CACHE.labels("crypto", "hit").inc()
             return
 
+        RATES_CACHE.labels("crypto", "miss").inc()
         try:
             symbols = symbols or list(self._coingecko_id.keys())
             ids = ",".join(self._coingecko_id[s] for s in symbols)
 
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with http_client("crypto") as client:
                 resp = await client.get(CRYPTO_API_URL, params={
                     "ids": ids,
                     "vs_currencies": "usd",
@@ -70,6 +80,7 @@ class CryptoRatesClient:
                 _cache["data"] = self._rates_usd
                 _cache["timestamp"] = datetime.now()
         except Exception as e:
+            RATES_FETCH_ERRORS.labels("crypto").inc()
             if _cache["data"]:
                 self._rates_usd = _cache["data"]
                 logging.warning(f"[CRYPTO] API error, using cached rates: {e}")
@@ -1,6 +1,7 @@
 import logging
 from datetime import datetime, timedelta
-import httpx
+
+from app.services.rates import RATES_CACHE, RATES_FETCH_ERRORS, http_client
 
 FIAT_API_URL_TEMPLATE = "https://open.er-api.com/v6/latest/{base}"
 
@@ -13,6 +14,13 @@ FALLBACK_RATES_FIAT = {
 }
 
 
+def cached_at() -> datetime | None:
+    """Время обновления кэша курсов, если он ещё свежий (иначе None)."""
+    if _cache["timestamp"] and datetime.now() - _cache["timestamp"] < _CACHE_TTL and _cache["data"]:
+        return _cache["timestamp"]
+    return None
+
+
 class FiatRatesClient:
     def __init__(self):
         self._rates: dict[str, float] = {}
@@ -28,11 +36,13 @@ class FiatRatesClient:
             and _cache["data"]
         ):
             self._rates = _cache["data"]
+            RATES_CACHE.labels("fiat", "hit").inc()
             return
 
+        RATES_CACHE.labels("fiat", "miss").inc()
         try:
             url = FIAT_API_URL_TEMPLATE.format(base=base)
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with http_client("fiat") as client:
                 resp = await client.get(url)
                 resp.raise_for_status()
                 data = resp.json()
@@ -42,6 +52,7 @@ class FiatRatesClient:
                 _cache["data"] = self._rates
                 _cache["timestamp"] = datetime.now()
         except Exception as e:
+            RATES_FETCH_ERRORS.labels("fiat").inc()
             if _cache["data"]:
                 self._rates = _cache["data"]
                 logging.warning(f"[FIAT] API error, using cached rates: {e}")
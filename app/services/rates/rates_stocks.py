@@ -1,7 +1,8 @@
 import logging
 from datetime import datetime, timedelta
 from typing import Iterable
-import httpx
+
+from app.services.rates import RATES_CACHE, RATES_FETCH_ERRORS, http_client
 
 MOEX_STOCK_API_TEMPLATE = (
     "https://iss.moex.com/iss/engines/stock/markets/shares/securities/{ticker}.json"
@@ -14,6 +15,13 @@ _cache = {"data": {}, "timestamp": None}
 _CACHE_TTL = timedelta(minutes=10)
 
 
+def cached_at() -> datetime | None:
+    """Время обновления кэша курсов, если он ещё свежий (иначе None)."""
+    if _cache["timestamp"] and datetime.now() - _cache["timestamp"] < _CACHE_TTL and _cache["data"]:
+        return _cache["timestamp"]
+    return None
+
+
 class StockRatesClient:
     def __init__(self, supported: Iterable[str] | None = None):
         self._rates_usd: dict[str, float] = {}
@@ -41,13 +49,15 @@ class StockRatesClient:
             cached: dict[str, float] = _cache["data"]
             if all(t in cached for t in requested):
                 self._rates_usd = cached
+                RATES_CACHE.labels("stocks", "hit").inc()
                 return
 
+        RATES_CACHE.labels("stocks", "miss").inc()
         try:
             # Начинаем с кэша (если есть), чтобы не терять ранее загруженные тикеры
             result: dict[str, float] = dict(_cache["data"]) if _cache["data"] else {}
 
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with http_client("stocks") as client:
                 for ticker in requested:
                     last_price_rub: float | None = None
 
@@ -115,6 +125,7 @@ class StockRatesClient:
                 _cache["data"] = self._rates_usd
                 _cache["timestamp"] = datetime.now()
         except Exception:
+            RATES_FETCH_ERRORS.labels("stocks").inc()
             if _cache["data"]:
                 self._rates_usd = _cache["data"]
                 logging.warning("[STOCK] API error, using cached rates")
@@ -0,0 +1,64 @@
+"""
+Кэш готовых текстов отчётов.
+
+Ключ — (user_id, вид отчёта, период, версия данных, снимок курсов). Запись данных
+пользователя увеличивает версию (`app.db.versions`), обновление курсов меняет снимок,
+поэтому устаревший текст никогда не отдаётся, а просто вытесняется по LRU. Пока
+курсы устарели (`rates_version() is None`), отчёты не кэшируются.
+"""
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Hashable
+
+from app.db.versions import get_version
+from app.services.rates.converter import rates_version
+from app.utils.cache import LRUCache
+
+REPORT_CACHE_MAX_ITEMS = 10_000
+REPORT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+class ReportCache:
+    """LRU готовых текстов отчётов с ограничением по числу и суммарному размеру."""
+
+    def __init__(self, max_items: int = REPORT_CACHE_MAX_ITEMS, max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self._cache = LRUCache(
+            max_items=max_items,
+            max_bytes=max_bytes,
+            sizeof=lambda text: len(text.encode("utf-8")),
+            name="reports",
+        )
+
+    async def get_or_render(
+        self,
+        user_id: int,
+        kind: str,
+        period: Hashable,
+        scope: str,
+        render: Callable[[], Awaitable[str]],
+    ) -> str:
+        """Возвращает закэшированный текст или строит его через `render()` и кэширует.
+
+        Args:
+            kind: Вид отчёта (например, "expense").
+            period: Идентификатор периода (например, ("week", "2025-06-02")).
+            scope: Область версий данных, от которых зависит отчёт ("entries", "assets").
+        """
+        # Версию данных берём до чтения: запись во время построения отчёта сделает ключ устаревшим
+        data_version = get_version(scope, user_id)
+        rates = rates_version()
+        if rates is not None:
+            text = self._cache.get((user_id, kind, period, data_version, rates))
+            if text is not None:
+                return text
+
+        text = await render()
+
+        # Построение могло обновить курсы — кэшируем под снимком, по которому считали
+        rates = rates_version()
+        if rates is not None:
+            self._cache.put((user_id, kind, period, data_version, rates), text)
+        return text
+
+
+report_cache = ReportCache()
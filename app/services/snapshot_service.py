@@ -0,0 +1,94 @@
+"""
+Пакетное создание снэпшотов капитала для всех пользователей.
+
+Вместо цикла по пользователям (проверка существования, расчёт капитала и коммит для
+каждого) загружаем `AssetLatestValues` всех пользователей одним запросом, оцениваем
+позиции по одному снимку курсов векторно (NumPy) и записываем все `CapitalSnapshot`
+одним `INSERT ... ON CONFLICT DO NOTHING`.
+"""
+import logging
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.dialect import dialect_insert
+from app.db.models import AssetLatestValues, CapitalSnapshot
+from app.services.rates.converter import CurrencyConverter
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotService:
+    """Расчёт и сохранение снэпшотов капитала сразу для всех пользователей."""
+
+    def __init__(self, session: AsyncSession, converter: Optional[CurrencyConverter] = None):
+        self.session = session
+        self.converter = converter or CurrencyConverter()
+
+    async def _usd_rates(self, codes: np.ndarray) -> np.ndarray:
+        """Курсы USD за 1 ед. для каждой валюты (NaN, если валюта не распознана)."""
+        await self.converter.update_fiat_rates()
+        await self.converter.update_crypto_rates()
+        rates = np.full(len(codes), np.nan, dtype=float)
+        for i, code in enumerate(codes):
+            try:
+                rates[i] = await self.converter.convert(1.0, str(code), "USD")
+            except Exception as e:
+                logger.error(f"Failed to get rate for {code}, excluded from snapshots: {e}")
+        return rates
+
+    async def compute_all_capitals(self) -> Dict[int, Tuple[float, float]]:
+        """Капитал всех пользователей с активами: `{user_id: (total_usd, total_rub)}`."""
+        result = await self.session.execute(
+            select(AssetLatestValues.user_id, AssetLatestValues.currency_code, AssetLatestValues.amount)
+        )
+        rows = result.all()
+        if not rows:
+            return {}
+
+        user_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        amounts = np.fromiter((float(r[2]) for r in rows), dtype=float, count=len(rows))
+        codes = np.array([r[1] for r in rows], dtype=object)
+
+        unique_users, user_idx = np.unique(user_ids, return_inverse=True)
+        unique_codes, code_idx = np.unique(codes, return_inverse=True)
+
+        rates = await self._usd_rates(unique_codes)
+        values_usd = np.nan_to_num(amounts * rates[code_idx], nan=0.0)
+        totals_usd = np.bincount(user_idx, weights=values_usd, minlength=len(unique_users))
+        rub_per_usd = await self.converter.convert(1.0, "USD", "RUB")
+
+        return {
+            int(uid): (float(usd), float(usd * rub_per_usd))
+            for uid, usd in zip(unique_users, totals_usd)
+        }
+
+    @staticmethod
+    async def save_snapshots(
+        session: AsyncSession,
+        capitals: Dict[int, Tuple[float, float]],
+        snapshot_date: date,
+    ) -> int:
+        """Сохраняет снэпшоты одной пакетной вставкой.
+
+        Уже существующие снэпшоты на эту дату (например, созданные вручную через
+        `/snapshot_asset`) не перезаписываются. Коммит выполняет вызывающая сторона.
+
+        Returns:
+            Количество созданных снэпшотов.
+        """
+        if not capitals:
+            return 0
+        rows = [
+            {"user_id": uid, "snapshot_date": snapshot_date, "total_usd": usd, "total_rub": rub}
+            for uid, (usd, rub) in capitals.items()
+        ]
+        stmt = dialect_insert(session, CapitalSnapshot).on_conflict_do_nothing(
+            index_elements=["user_id", "snapshot_date"]
+        )
+        conn = await session.connection()
+        result = await conn.execute(stmt, rows)
+        return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
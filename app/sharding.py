@@ -0,0 +1,206 @@
+"""
+Режим пула процессов: апдейты раскладываются по воркерам по user_id.
+
+Фронтовой процесс получает апдейты (long polling или webhook) и отправляет каждый
+в один из `WORKER_PROCESSES` процессов-воркеров. Воркер выбирается по консистентному
+хешированию user_id (`HashRing`), поэтому все апдейты пользователя попадают в один
+процесс: сохраняется их порядок, а кэши в памяти (FSM, списки валют и категорий,
+состояние сообщений) остаются согласованными. При изменении числа воркеров
+переезжает лишь ~1/N пользователей; состояние форм лежит в БД, так что переезд
+ничего не теряет.
+
+Каждый воркер — отдельный процесс со своим event loop, ботом и диспетчером (его
+собирает `dispatcher_factory`). Внутри воркера апдейты одного пользователя
+обрабатываются строго по очереди, апдейты разных пользователей — параллельно.
+Упавший воркер перезапускается при следующем апдейте для него и дочитывает свою очередь.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing as mp
+import zlib
+from bisect import bisect
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Сколько точек на кольце у каждого воркера: чем больше, тем ровнее распределение
+RING_REPLICAS = 64
+
+# Таймаут long polling во фронтовом процессе, секунды
+POLL_TIMEOUT = 30
+
+
+def _hash(value: str) -> int:
+    return zlib.crc32(value.encode())
+
+
+class HashRing:
+    """Консистентное хеширование ключей на `nodes` узлов."""
+
+    def __init__(self, nodes: int, replicas: int = RING_REPLICAS):
+        if nodes < 1:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted((_hash(f"{node}:{i}"), node) for node in range(nodes) for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: int) -> int:
+        """Номер узла для ключа."""
+        i = bisect(self._hashes, _hash(str(key)))
+        return self._nodes[i % len(self._nodes)]
+
+
+def update_user_id(update: Update) -> int:
+    """user_id автора апдейта; для апдейтов без пользователя — id чата или update_id."""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class ShardPool:
+    """Пул процессов-воркеров с маршрутизацией апдейтов по user_id."""
+
+    def __init__(
+        self,
+        workers: int,
+        dispatcher_factory: Callable[[], Dispatcher],
+        token: str,
+        replicas: int = RING_REPLICAS,
+    ):
+        # spawn: воркер не наследует event loop, соединения с БД и сессию бота фронта
+        self._ctx = mp.get_context("spawn")
+        self._ring = HashRing(workers, replicas)
+        self._queues = [self._ctx.Queue() for _ in range(workers)]
+        self._factory = dispatcher_factory
+        self._token = token
+        self._processes: List[mp.process.BaseProcess] = []
+        # Сколько апдейтов обработано всеми воркерами (для бенчмарка и мониторинга)
+        self.processed = self._ctx.Value("q", 0)
+        self.submitted = [0] * workers
+        # Сколько раз воркеры перезапускались после падения
+        self.restarts = 0
+
+    @property
+    def workers(self) -> int:
+        return len(self._queues)
+
+    def start(self) -> None:
+        self._processes = [self._spawn(index) for index in range(self.workers)]
+        logger.info(f"Started {self.workers} bot worker processes")
+
+    def _spawn(self, index: int) -> mp.process.BaseProcess:
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self._queues[index], self.processed, self._factory, self._token),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def _ensure_alive(self, index: int) -> None:
+        """Перезапускает упавший воркер; его очередь с непрочитанными апдейтами сохраняется."""
+        process = self._processes[index]
+        if process.is_alive():
+            return
+        logger.error(f"Worker {process.name} died with exit code {process.exitcode}, restarting")
+        self._processes[index] = self._spawn(index)
+        self.restarts += 1
+
+    def submit(self, update: Update) -> int:
+        """Отправляет апдейт воркеру его пользователя; возвращает номер воркера."""
+        user_id = update_user_id(update)
+        index = self._ring.node_for(user_id)
+        if self._processes:
+            self._ensure_alive(index)
+        self._queues[index].put_nowait((user_id, update.model_dump_json(exclude_unset=True)))
+        self.submitted[index] += 1
+        return index
+
+    async def feed_update(self, bot: Bot, update: Update) -> None:
+        """Совместим по сигнатуре с `Dispatcher.feed_update` — для webhook-фронта."""
+        self.submit(update)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Просит воркеры доработать принятые апдейты и завершиться."""
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in {timeout}s, terminating")
+                process.terminate()
+        self._processes.clear()
+
+
+def _worker_main(index: int, queue: Any, processed: Any, factory: Callable[[], Dispatcher], token: str) -> None:
+    asyncio.run(_worker_loop(index, queue, processed, factory, token))
+
+
+async def _worker_loop(index: int, queue: Any, processed: Any, factory: Callable[[], Dispatcher], token: str) -> None:
+    bot = Bot(token=token)
+    dp = factory()
+    # worker_index получают обработчики startup/shutdown, которым он нужен (порт метрик воркера)
+    await dp.emit_startup(bot=bot, worker_index=index)
+    loop = asyncio.get_running_loop()
+    # Последняя задача каждого пользователя: следующий апдейт ждёт её завершения
+    tails: Dict[int, asyncio.Task] = {}
+
+    async def process(update: Update, previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            logger.exception(f"Worker {index} failed to process update {update.update_id}")
+        finally:
+            with processed.get_lock():
+                processed.value += 1
+
+    def release(user_id: int, task: asyncio.Task) -> None:
+        if tails.get(user_id) is task:
+            del tails[user_id]
+
+    try:
+        while True:
+            item = await loop.run_in_executor(None, queue.get)
+            if item is None:
+                break
+            user_id, payload = item
+            update = Update.model_validate_json(payload, context={"bot": bot})
+            task = asyncio.create_task(process(update, tails.get(user_id)))
+            tails[user_id] = task
+            task.add_done_callback(lambda t, u=user_id: release(u, t))
+        if tails:
+            await asyncio.gather(*tails.values(), return_exceptions=True)
+    finally:
+        await dp.emit_shutdown(bot=bot, worker_index=index)
+        await bot.session.close()
+
+
+async def poll_to_pool(bot: Bot, pool: ShardPool, allowed_updates: Optional[Sequence[str]] = None) -> None:
+    """Long polling во фронтовом процессе: апдейты уходят в пул, а не в локальный диспетчер."""
+    offset: Optional[int] = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates)
+        except Exception:
+            logger.exception("Failed to fetch updates")
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            pool.submit(update)
+            offset = update.update_id + 1
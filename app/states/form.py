@@ -15,6 +15,7 @@ class FormState:
     cur_page: int = 0
     cat_page: int = 0
     tab: str = "amount"                   # amount | currency | category
+    edit_entry_id: int | None = None      # запись, которую заменит эта форма при сохранении
 
 class Flow(StatesGroup):
     """Стадии сценария формы ввода."""
@@ -0,0 +1,179 @@
+"""
+FSM storage в базе данных.
+
+Состояние и данные FSM хранятся в таблице `fsm_states`, поэтому незаконченная форма
+ввода переживает рестарт и деплой. Чтение идёт из памяти: запись чата загружается
+из БД один раз, при первом обращении. Изменения внутри обработки одного апдейта
+копятся в памяти, а `FsmFlushMiddleware` после обработки пишет их в БД одной
+записью (`flush`).
+
+`FormState` кодируется позиционно (список значений полей без хвоста из значений
+по умолчанию), остальные данные — обычным компактным JSON.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey, DEFAULT_DESTINY
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import get_read_session, run_write
+from app.db.dialect import dialect_insert
+from app.db.models import FsmRecord
+from app.states.form import FormState
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Ключи данных FSM, значения которых кодируются позиционно, и их поля по порядку.
+# Новые поля добавляются только в конец FormState — иначе сломаются сохранённые формы.
+_PACKED_FIELDS: Dict[str, tuple] = {
+    "st": tuple((f.name, f.default) for f in fields(FormState)),
+}
+
+# Сколько записей чатов держать в памяти
+_MAX_CACHED_RECORDS = 100_000
+
+
+def storage_key_str(key: StorageKey) -> str:
+    """Строковый ключ записи в таблице `fsm_states`."""
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.thread_id is not None or key.business_connection_id is not None or key.destiny != DEFAULT_DESTINY:
+        parts += [str(key.thread_id or ""), key.business_connection_id or "", key.destiny]
+    return ":".join(parts)
+
+
+def encode_data(data: Mapping[str, Any]) -> Optional[str]:
+    """Кодирует данные FSM в компактный JSON (None для пустых данных)."""
+    if not data:
+        return None
+    packed = {}
+    for name, value in data.items():
+        spec = _PACKED_FIELDS.get(name)
+        if spec is not None and isinstance(value, dict) and value.keys() <= {f for f, _ in spec}:
+            values = [value.get(f, default) for f, default in spec]
+            # Хвост из значений по умолчанию не храним
+            while values and values[-1] == spec[len(values) - 1][1]:
+                values.pop()
+            value = values
+        packed[name] = value
+    return json.dumps(packed, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_data(raw: Optional[str]) -> Dict[str, Any]:
+    """Обратное к `encode_data`."""
+    if not raw:
+        return {}
+    data = json.loads(raw)
+    for name, spec in _PACKED_FIELDS.items():
+        values = data.get(name)
+        if isinstance(values, list):
+            data[name] = {f: values[i] if i < len(values) else default for i, (f, default) in enumerate(spec)}
+    return data
+
+
+@dataclass(slots=True)
+class _Record:
+    state: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+
+
+class DbStorage(BaseStorage):
+    """FSM storage с чтением из памяти и отложенной (одной на апдейт) записью в БД."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Awaitable[AsyncSession]] = get_read_session,
+        write: Callable = run_write,
+    ):
+        self._session_factory = session_factory
+        self._write = write
+        self._records = LRUCache(max_items=_MAX_CACHED_RECORDS, name="fsm_states")
+        # Изменённые, но ещё не записанные в БД записи (не вытесняются из памяти)
+        self._dirty: Dict[str, _Record] = {}
+        self.writes = 0
+
+    async def _record(self, key: StorageKey) -> _Record:
+        skey = storage_key_str(key)
+        record = self._dirty.get(skey) or self._records.get(skey)
+        if record is None:
+            async with await self._session_factory() as session:
+                row = (await session.execute(
+                    select(FsmRecord.state, FsmRecord.data).where(FsmRecord.key == skey)
+                )).first()
+            record = _Record(row.state, decode_data(row.data)) if row else _Record()
+            self._records.put(skey, record)
+        return record
+
+    def _mark_dirty(self, key: StorageKey, record: _Record) -> None:
+        skey = storage_key_str(key)
+        self._records.put(skey, record)
+        self._dirty[skey] = record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = dict(data)
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._record(key)).data or {})
+
+    async def flush(self, key: StorageKey) -> bool:
+        """Пишет накопленные изменения записи `key` в БД одним запросом.
+
+        Returns:
+            True, если было что записать.
+        """
+        skey = storage_key_str(key)
+        record = self._dirty.pop(skey, None)
+        if record is None:
+            return False
+        state, data = record.state, encode_data(record.data or {})
+        try:
+            await self._write(lambda session: self._save(session, skey, state, data))
+        except Exception:
+            # Не потеряем изменения: запишем их со следующим апдейтом
+            self._dirty.setdefault(skey, record)
+            raise
+        self.writes += 1
+        return True
+
+    async def flush_all(self) -> None:
+        """Пишет в БД все накопленные изменения."""
+        for skey, record in list(self._dirty.items()):
+            state, data = record.state, encode_data(record.data or {})
+            self._dirty.pop(skey, None)
+            try:
+                await self._write(lambda session: self._save(session, skey, state, data))
+            except Exception:
+                logger.exception(f"Failed to save FSM state {skey}")
+
+    @staticmethod
+    async def _save(session: AsyncSession, skey: str, state: Optional[str], data: Optional[str]) -> None:
+        if state is None and data is None:
+            await session.execute(delete(FsmRecord).where(FsmRecord.key == skey))
+            return
+        stmt = dialect_insert(session, FsmRecord).values(
+            key=skey, state=state, data=data, updated_at=datetime.now(timezone.utc),
+        )
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at},
+        ))
+
+    async def close(self) -> None:
+        await self.flush_all()
@@ -6,6 +6,13 @@
 отдельного бота для алертов. Для подключения достаточно вызвать `setup_alert_logging()`
 при старте приложения (например, в `app/main.py`).
 
+`emit` ничего не отправляет сам: запись кладётся в ограниченный буфер, где
+одинаковые записи (тот же логгер, уровень, место в коде и тип исключения)
+склеиваются в одну со счётчиком и временем первого и последнего появления.
+Фоновый поток раз в `ALERT_FLUSH_SECONDS` отправляет накопленное одним сообщением
+в каждый чат — шквал ошибок превращается в одно сообщение, а не в сотни запросов.
+Обработчик работает и без запущенного event loop.
+
 Переменные окружения:
 - TELEGRAM_BOT_ALERT — токен Telegram-бота для алёртов (обязателен для отправки).
 - TELEGRAM_ALERT_CHAT_ID — идентификатор(-ы) чатов (user/group) через запятую.
@@ -13,8 +20,10 @@
 """
 import asyncio
 import logging
-import os
-from typing import Iterable, List, Optional
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 try:
     from aiogram import Bot
@@ -23,6 +32,30 @@ except Exception:  # pragma: no cover
 
 from app.config import settings
 
+# Лимит длины сообщения Telegram и длины текста одной записи в сводке
+_MESSAGE_LIMIT = 4096
+_RECORD_TEXT_LIMIT = 1000
+
+Fingerprint = Tuple[str, int, str, int, str]
+SendFn = Callable[[int, str], Awaitable[object]]
+
+
+@dataclass(slots=True)
+class _Alert:
+    """Склеенные одинаковые записи."""
+    level: str
+    text: str
+    count: int
+    first_seen: float
+    last_seen: float
+
+
+def _fingerprint(record: logging.LogRecord) -> Fingerprint:
+    # Сообщения в проекте собираются f-строками, поэтому одинаковыми считаем
+    # записи из одного места кода, а не с одинаковым текстом
+    exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else ""
+    return record.name, record.levelno, record.pathname, record.lineno, exc_type
+
 
 class TelegramAlertHandler(logging.Handler):
     """Обработчик логов, отправляющий записи уровня WARNING+ в Telegram через отдельного бота.
@@ -32,14 +65,38 @@ class TelegramAlertHandler(logging.Handler):
     не выполняет отправку (no-op).
     """
 
-    def __init__(self, level: int = logging.WARNING) -> None:
+    def __init__(
+        self,
+        level: int = logging.WARNING,
+        chat_ids: Optional[List[int]] = None,
+        send: Optional[SendFn] = None,
+        flush_interval: Optional[float] = None,
+        max_buffer: Optional[int] = None,
+    ) -> None:
         super().__init__(level=level)
         self._token: Optional[str] = settings.TELEGRAM_BOT_ALERT
-        self._chat_ids: List[int] = self._parse_chat_ids(settings.TELEGRAM_ALERT_CHAT_ID)
+        self._chat_ids: List[int] = (
+            chat_ids if chat_ids is not None else self._parse_chat_ids(settings.TELEGRAM_ALERT_CHAT_ID)
+        )
         self._bot: Optional[Bot] = None
+        self._send: Optional[SendFn] = send
 
-        if self._token and Bot is not None:
+        if self._send is None and self._token and Bot is not None:
             self._bot = Bot(token=self._token)
+            self._send = self._send_via_bot
+
+        self.flush_interval = settings.ALERT_FLUSH_SECONDS if flush_interval is None else flush_interval
+        self.max_buffer = settings.ALERT_BUFFER_SIZE if max_buffer is None else max_buffer
+        self._buffer: Dict[Fingerprint, _Alert] = {}
+        self._buffer_lock = threading.Lock()
+        self.dropped = 0
+        self.batches = 0
+
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._flushed = threading.Condition()
+        self._generation = 0
 
     @staticmethod
     def _parse_chat_ids(raw: Optional[str]) -> List[int]:
@@ -53,32 +110,139 @@ class TelegramAlertHandler(logging.Handler):
             try:
                 ids.append(int(part))
             except ValueError:
-                try:
-                    ids.append(int(part))
-                except Exception:
-                    continue
+                continue
         return ids
 
     def emit(self, record: logging.LogRecord) -> None:  # type: ignore[override]
-        if self._bot is None or not self._chat_ids:
+        if self._send is None or not self._chat_ids:
+            return
+        # Записи, которые пишет сам поток отправки (ошибки сети и т.п.), не зацикливаем
+        if self._thread is not None and threading.get_ident() == self._thread.ident:
             return
 
         try:
-            msg = self.format(record)
-            if record.exc_info and not msg:
-                msg = logging.Formatter().formatException(record.exc_info)  # type: ignore[arg-type]
-
-            asyncio.create_task(self._send(msg))
+            key = _fingerprint(record)
+            with self._buffer_lock:
+                alert = self._buffer.get(key)
+                if alert is not None:
+                    alert.count += 1
+                    alert.last_seen = record.created
+                    return
+                if len(self._buffer) >= self.max_buffer:
+                    self.dropped += 1
+                    return
+                # Текст форматируем только для первой записи из группы
+                self._buffer[key] = _Alert(record.levelname, self._format(record), 1, record.created, record.created)
+            self._ensure_thread()
         except Exception:
-            pass
+            self.handleError(record)
+
+    def _format(self, record: logging.LogRecord) -> str:
+        msg = self.format(record)
+        if record.exc_info and not msg:
+            msg = logging.Formatter().formatException(record.exc_info)  # type: ignore[arg-type]
+        if len(msg) > _RECORD_TEXT_LIMIT:
+            # Из трейсбека важнее конец — там само исключение
+            msg = msg[:_RECORD_TEXT_LIMIT // 2] + "\n…\n" + msg[-_RECORD_TEXT_LIMIT // 2:]
+        return msg
 
-    async def _send(self, text: str) -> None:
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._flushed:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telegram-alerts", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        # У потока свой event loop: сессия бота алертов живёт в нём
+        loop = asyncio.new_event_loop()
+        try:
+            while not self._stopping.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                loop.run_until_complete(self._send_batch())
+            loop.run_until_complete(self._send_batch())
+            if self._bot is not None:
+                loop.run_until_complete(self._bot.session.close())
+        finally:
+            loop.close()
+
+    def _take_batch(self) -> Tuple[List[_Alert], int]:
+        with self._buffer_lock:
+            alerts = list(self._buffer.values())
+            dropped = self.dropped
+            self._buffer = {}
+            self.dropped = 0
+        return alerts, dropped
+
+    async def _send_batch(self) -> None:
+        alerts, dropped = self._take_batch()
+        try:
+            if alerts or dropped:
+                text = render_batch(alerts, dropped)
+                self.batches += 1
+                for chat_id in self._chat_ids:
+                    try:
+                        await self._send(chat_id, text)
+                    except Exception:
+                        continue
+        finally:
+            with self._flushed:
+                self._generation += 1
+                self._flushed.notify_all()
+
+    async def _send_via_bot(self, chat_id: int, text: str) -> None:
         assert self._bot is not None
-        for chat_id in self._chat_ids:
-            try:
-                await self._bot.send_message(chat_id=chat_id, text=f"🚨 Alert:\n{text}")
-            except Exception:
-                continue
+        await self._bot.send_message(chat_id=chat_id, text=text)
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Отправляет накопленное сейчас, не дожидаясь интервала."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            start = self._generation
+            self._wake.set()
+            # Цикл, начатый до вызова, мог забрать буфер раньше новых записей — ждём, пока он опустеет
+            while self._generation == start or self._buffer:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                if self._generation != start:
+                    start = self._generation
+                    self._wake.set()
+                self._flushed.wait(left)
+
+    def close(self) -> None:
+        """Отправляет остаток буфера и останавливает поток (вызывается и из `logging.shutdown`)."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join(timeout=10.0)
+        super().close()
+
+
+def render_batch(alerts: List[_Alert], dropped: int = 0) -> str:
+    """Одно сообщение-сводка из склеенных записей."""
+    total = sum(a.count for a in alerts)
+    if total == 1 and not dropped:
+        return f"🚨 Alert:\n{alerts[0].text}"[:_MESSAGE_LIMIT]
+    lines = [f"🚨 Alert: {total} records, {len(alerts)} kinds"]
+    for alert in sorted(alerts, key=lambda a: a.first_seen):
+        first = time.strftime("%H:%M:%S", time.gmtime(alert.first_seen))
+        if alert.count > 1:
+            last = time.strftime("%H:%M:%S", time.gmtime(alert.last_seen))
+            lines.append(f"\n×{alert.count} ({first}–{last} UTC)\n{alert.text}")
+        else:
+            lines.append(f"\n{alert.text}")
+    if dropped:
+        lines.append(f"\n…and {dropped} more records dropped (alert buffer full)")
+
+    text = "\n".join(lines)
+    if len(text) > _MESSAGE_LIMIT:
+        text = text[:_MESSAGE_LIMIT - 2] + "\n…"
+    return text
 
 
 def setup_alert_logging() -> None:
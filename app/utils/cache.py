@@ -0,0 +1,108 @@
+"""
+Ограниченный LRU-кэш для in-memory кэшей бота.
+
+Ограничивается числом элементов и (опционально) суммарным «весом» значений,
+который считает переданная функция `sizeof`. Ведёт счётчики попаданий/промахов;
+при чтении метрик они переносятся в `cache_*` (суммарно по кэшам с одним `name`).
+"""
+from __future__ import annotations
+
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from app.utils.metrics import counter, gauge, on_collect
+
+_MISSING = object()
+
+# Все живые кэши процесса — для метрик
+_instances: "weakref.WeakSet[LRUCache]" = weakref.WeakSet()
+
+CACHE_REQUESTS = counter("cache_requests_total", "Обращения к in-memory кэшам", ["cache", "result"])
+CACHE_EVICTIONS = counter("cache_evictions_total", "Вытеснения из in-memory кэшей", ["cache"])
+CACHE_ITEMS = gauge("cache_items", "Число элементов в in-memory кэшах", ["cache"])
+CACHE_BYTES = gauge("cache_bytes", "Оценка памяти in-memory кэшей", ["cache"])
+
+
+class LRUCache:
+    """LRU-кэш с лимитом по количеству элементов и по суммарному размеру."""
+
+    def __init__(
+        self,
+        max_items: int = 1024,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        name: str = "cache",
+    ):
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._data: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _instances.add(self)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+        self._data[key] = (value, size)
+        self.total_bytes += size
+        self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        self.total_bytes -= item[1]
+        return item[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.total_bytes = 0
+
+    def _evict(self) -> None:
+        while self._data and (
+            len(self._data) > self.max_items
+            or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            _, (_, size) = self._data.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+
+@on_collect
+def _collect_cache_metrics() -> None:
+    totals: Dict[str, list] = {}
+    for cache in list(_instances):
+        t = totals.setdefault(cache.name, [0, 0, 0, 0, 0])
+        t[0] += cache.hits
+        t[1] += cache.misses
+        t[2] += cache.evictions
+        t[3] += len(cache)
+        t[4] += cache.total_bytes
+    for name, (hits, misses, evictions, items, size) in totals.items():
+        CACHE_REQUESTS.labels(name, "hit").set(hits)
+        CACHE_REQUESTS.labels(name, "miss").set(misses)
+        CACHE_EVICTIONS.labels(name).set(evictions)
+        CACHE_ITEMS.labels(name).set(items)
+        CACHE_BYTES.labels(name).set(size)
@@ -0,0 +1,226 @@
+"""
+Слой редактирования сообщений бота.
+
+Запоминает последний отправленный текст и клавиатуру каждого сообщения и не
+ходит в Bot API, если новое состояние совпадает со старым. Если изменилась только
+клавиатура, вызывается `edit_message_reply_markup`. Ответ «message is not modified»
+считается успехом.
+
+Правки с `debounce=True` (нажатия цифровой клавиатуры) применяются не чаще одного
+раза за окно `KEYPAD_EDIT_DEBOUNCE_MS`: первая правка уходит сразу, остальные в окне
+схлопываются в одну, с последним состоянием.
+
+Состояние хранится в памяти, поэтому сообщение, которое редактирует этот слой, нужно
+править только через него — иначе запомненное состояние устареет.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+from app.config import settings
+from app.utils.cache import LRUCache
+from app.utils.metrics import counter, on_collect
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[int, int]
+
+_NOT_MODIFIED = "message is not modified"
+
+MESSAGE_EDITS = counter("message_edits_total", "Правки сообщений через MessageEditor", ["result"])
+
+
+@dataclass(slots=True)
+class _Rendered:
+    """Что сейчас показано в сообщении (по нашим данным)."""
+    text: Optional[str]
+    parse_mode: Optional[str]
+    reply_markup: Optional[InlineKeyboardMarkup]
+    edited_at: float = 0.0
+
+
+@dataclass(slots=True)
+class _Pending:
+    """Отложенная правка: при срабатывании отправляется последнее состояние."""
+    bot: Bot
+    text: str
+    parse_mode: Optional[str]
+    reply_markup: Optional[InlineKeyboardMarkup]
+    task: Optional[asyncio.Task] = None
+
+
+def _same_markup(a: Optional[InlineKeyboardMarkup], b: Optional[InlineKeyboardMarkup]) -> bool:
+    # Клавиатуры из кэшей приходят тем же объектом — сравнение по полям не нужно
+    return a is b or a == b
+
+
+class MessageEditor:
+    """Редактирует сообщения, пропуская правки, которые ничего не меняют."""
+
+    def __init__(self, debounce: Optional[float] = None, max_items: int = 50_000):
+        self.debounce = settings.KEYPAD_EDIT_DEBOUNCE_MS / 1000 if debounce is None else debounce
+        self._rendered = LRUCache(max_items=max_items, name="message_edits")
+        self._pending: Dict[MessageKey, _Pending] = {}
+        self.edits = 0
+        self.markup_edits = 0
+        self.skipped = 0
+        self.coalesced = 0
+
+    def remember(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: Optional[str],
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        parse_mode: Optional[str] = None,
+    ) -> None:
+        """Запоминает состояние только что отправленного сообщения."""
+        loop_time = asyncio.get_running_loop().time()
+        self._rendered.put((chat_id, message_id), _Rendered(text, parse_mode, reply_markup, loop_time))
+
+    def forget(self, chat_id: int, message_id: int) -> None:
+        """Забывает сообщение (удалено или изменено в обход слоя) и отменяет его отложенную правку."""
+        self._cancel_pending((chat_id, message_id))
+        self._rendered.pop((chat_id, message_id))
+
+    async def edit_text(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        parse_mode: Optional[str] = "HTML",
+        debounce: bool = False,
+    ) -> bool:
+        """Приводит сообщение к тексту `text` с клавиатурой `reply_markup`.
+
+        Returns:
+            True, если запрос в Bot API был отправлен (или отложен), False — если правка не нужна.
+        """
+        key = (chat_id, message_id)
+        if not debounce:
+            self._cancel_pending(key)
+            return await self._apply(bot, key, text, parse_mode, reply_markup)
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Окно уже открыто — отложенная правка отправит последнее состояние
+            pending.bot, pending.text, pending.parse_mode, pending.reply_markup = bot, text, parse_mode, reply_markup
+            self.coalesced += 1
+            return True
+
+        now = asyncio.get_running_loop().time()
+        last = self._rendered.get(key)
+        wait = 0.0 if last is None else self.debounce - (now - last.edited_at)
+        if wait <= 0:
+            return await self._apply(bot, key, text, parse_mode, reply_markup)
+
+        pending = self._pending[key] = _Pending(bot, text, parse_mode, reply_markup)
+        pending.task = asyncio.create_task(self._flush_later(key, wait))
+        return True
+
+    async def edit_markup(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        reply_markup: Optional[InlineKeyboardMarkup],
+    ) -> bool:
+        """Меняет только клавиатуру сообщения, если она отличается от показанной."""
+        key = (chat_id, message_id)
+        self._cancel_pending(key)
+        last = self._rendered.get(key)
+        if last is not None and _same_markup(last.reply_markup, reply_markup):
+            self.skipped += 1
+            return False
+        text, parse_mode = (last.text, last.parse_mode) if last is not None else (None, None)
+        self._store(key, text, parse_mode, reply_markup)
+        try:
+            await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            if _NOT_MODIFIED not in str(e):
+                self._rendered.pop(key)
+                raise
+        self.markup_edits += 1
+        return True
+
+    async def _apply(
+        self,
+        bot: Bot,
+        key: MessageKey,
+        text: str,
+        parse_mode: Optional[str],
+        reply_markup: Optional[InlineKeyboardMarkup],
+    ) -> bool:
+        chat_id, message_id = key
+        last = self._rendered.get(key)
+        same_text = last is not None and last.text == text and last.parse_mode == parse_mode
+        if same_text and _same_markup(last.reply_markup, reply_markup):
+            self.skipped += 1
+            return False
+
+        # Состояние запоминаем до запроса: при гонке правок побеждает последняя вызванная
+        self._store(key, text, parse_mode, reply_markup)
+        try:
+            if same_text:
+                await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+                self.markup_edits += 1
+            else:
+                await bot.edit_message_text(
+                    chat_id=chat_id, message_id=message_id, text=text,
+                    reply_markup=reply_markup, parse_mode=parse_mode,
+                )
+                self.edits += 1
+        except TelegramBadRequest as e:
+            if _NOT_MODIFIED in str(e):
+                return True
+            self._rendered.pop(key)
+            raise
+        except Exception:
+            self._rendered.pop(key)
+            raise
+        return True
+
+    async def _flush_later(self, key: MessageKey, delay: float) -> None:
+        await asyncio.sleep(delay)
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        try:
+            await self._apply(pending.bot, key, pending.text, pending.parse_mode, pending.reply_markup)
+        except Exception:
+            logger.exception(f"Debounced edit of message {key[1]} in chat {key[0]} failed")
+
+    def _cancel_pending(self, key: MessageKey) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is not None and pending.task is not None:
+            pending.task.cancel()
+
+    def _store(
+        self,
+        key: MessageKey,
+        text: Optional[str],
+        parse_mode: Optional[str],
+        reply_markup: Optional[InlineKeyboardMarkup],
+    ) -> None:
+        now = asyncio.get_running_loop().time()
+        self._rendered.put(key, _Rendered(text, parse_mode, reply_markup, now))
+
+
+editor = MessageEditor()
+
+
+@on_collect
+def _collect_edit_metrics() -> None:
+    MESSAGE_EDITS.labels("text").set(editor.edits)
+    MESSAGE_EDITS.labels("markup").set(editor.markup_edits)
+    MESSAGE_EDITS.labels("skipped").set(editor.skipped)
+    MESSAGE_EDITS.labels("coalesced").set(editor.coalesced)
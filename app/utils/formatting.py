@@ -1,7 +1,9 @@
+import logging
+
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
-from app.constants.constants import DEFAULT_CATEGORIES, BASE_CURRENCIES, USER_PREFS
 from app.constants.constants import RU_MONTHS
 
 def fmt_money_str(s: str) -> str:
@@ -92,61 +94,6 @@ def parse_amount(s: str) -> Decimal | None:
     return None
 
 
-def uniq_push_front(seq: list[str], value: str, max_len: int = 50):
-    """Добавляет значение в начало истории ввода пользователя.
-
-    Применяется для хранения часто используемых категорий или валют,
-    чтобы в интерфейсе SmartSavings пользователь видел последние выбранные значения.
-
-    Args:
-        seq (list[str]): Список последних значений (например, категорий).
-        value (str): Новое значение для сохранения.
-        max_len (int, optional): Максимальная длина истории. По умолчанию 50.
-    """
-    value = value.strip()
-    if not value:
-        return
-    seq[:] = [x for x in seq if x.lower() != value.lower()]
-    seq.insert(0, value)
-    if len(seq) > max_len:
-        del seq[max_len:]
-
-
-def currencies_for_user(user_id: int) -> list[str]:
-    """Возвращает список валют для конкретного пользователя.
-
-    Используется при отображении интерфейса выбора валюты в боте SmartSavings.
-    Сначала подставляются пользовательские предпочтения, затем добавляются базовые валюты.
-
-    Args:
-        user_id (int): ID пользователя.
-
-    Returns:
-        list[str]: Список валют, включая выбранные пользователем и стандартные (RUB, USD и др.).
-    """
-    prefs = USER_PREFS[user_id]["currencies"]
-    base_filtered = [c for c in BASE_CURRENCIES if all(c.lower()!=x.lower() for x in prefs)]
-    return prefs + base_filtered
-
-
-def categories_for_user(user_id: int, mode: str) -> list[str]:
-    """Возвращает список категорий расходов/доходов для пользователя.
-
-    Применяется в меню добавления транзакций в SmartSavings.
-    Сначала берутся сохранённые предпочтения пользователя, затем добавляются дефолтные категории.
-
-    Args:
-        user_id (int): ID пользователя.
-        mode (str): Режим категорий — например, 'income' или 'expense'.
-
-    Returns:
-        list[str]: Список категорий, включающий пользовательские и дефолтные.
-    """
-    prefs = USER_PREFS[user_id]["categories"][mode]
-    base_filtered = [c for c in DEFAULT_CATEGORIES[mode] if all(c.lower()!=x.lower() for x in prefs)]
-    return prefs + base_filtered
-
-
 async def safe_delete(bot: Bot, chat_id: int, message_id: int | None):
     """Безопасное удаление сообщений в чате.
 
@@ -162,8 +109,12 @@ async def safe_delete(bot: Bot, chat_id: int, message_id: int | None):
         return
     try:
         await bot.delete_message(chat_id, message_id)
-    except Exception:
+    except TelegramBadRequest:
+        # Сообщение уже удалено или слишком старое — чистить нечего
         pass
+    except Exception:
+        # RetryAfter сюда доходит, только если middleware сессии исчерпал повторы
+        logging.warning(f"Failed to delete message {message_id} in chat {chat_id}", exc_info=True)
 
 
 def normalize_amount_input(value) -> str:
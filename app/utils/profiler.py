@@ -0,0 +1,155 @@
+"""
+Сэмплирующий профайлер корутин asyncio.
+
+cProfile для бота не годится: он профилирует поток целиком, то есть вперемешку
+все корутины event loop, и не видит времени, проведённого в `await`. Поэтому
+стеки снимает отдельный поток раз в `SAMPLE_INTERVAL`, и только у задач, которые
+сейчас профилируются (`Sampler.start`):
+
+- если задача в этот момент выполняется, берётся цепочка её корутин плюс
+  синхронные вызовы поверх неё из `sys._current_frames()` — время Python-кода;
+- если задача ждёт, берётся цепочка `await` до самой глубокой корутины и кадр
+  `(waiting)` — видно, ждёт ли она HTTP, БД или блокировку.
+
+Результат — folded stacks (`кадр;кадр;кадр N`), их понимают flamegraph.pl,
+speedscope и inferno. Пока профилируемых задач нет, поток спит и ничего не стоит.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from types import CodeType, FrameType
+from typing import List, Optional, Set
+
+# Период снятия стеков, секунды
+SAMPLE_INTERVAL = 0.005
+
+WAITING_FRAME = "(waiting)"
+
+_SITE_PACKAGES = "site-packages" + os.sep
+_STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    i = filename.rfind(_SITE_PACKAGES)
+    if i != -1:
+        return filename[i + len(_SITE_PACKAGES):]
+    if filename.startswith(_STDLIB):
+        return filename[len(_STDLIB):]
+    try:
+        relative = os.path.relpath(filename)
+    except ValueError:
+        return filename
+    return filename if relative.startswith("..") else relative
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    # `;` разделяет кадры в folded-формате
+    return f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class TaskProfile:
+    """Сэмплы стеков одной задачи asyncio."""
+
+    def __init__(self, task: asyncio.Task, thread_id: int, root_code: Optional[CodeType] = None):
+        self.task = task
+        self.thread_id = thread_id
+        # Кадры до корутины с этим кодом включительно (диспетчер, middleware) в стек не попадают
+        self.root_code = root_code
+        self.samples: Counter[str] = Counter()
+
+    def sample(self, thread_frame: Optional[FrameType]) -> None:
+        frames: List[FrameType] = []
+        running = False
+        coro = self.task.get_coro()
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+            if frame is None:
+                break
+            frames.append(frame)
+            running = bool(getattr(coro, "cr_running", False) or getattr(coro, "gi_running", False))
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        if not frames:
+            return
+
+        if running and thread_frame is not None:
+            # Поверх самой глубокой корутины — синхронные вызовы, которые выполняются сейчас
+            # (или стек гринлета SQLAlchemy, который до корутины не доходит)
+            above: List[FrameType] = []
+            frame = thread_frame
+            while frame is not None and frame is not frames[-1]:
+                above.append(frame)
+                frame = frame.f_back
+            frames.extend(reversed(above))
+
+        if self.root_code is not None:
+            for i, frame in enumerate(frames):
+                if frame.f_code is self.root_code:
+                    frames = frames[i + 1:]
+                    break
+
+        labels = [_frame_label(frame) for frame in frames]
+        if not running:
+            labels.append(WAITING_FRAME)
+        self.samples[";".join(labels)] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.samples.values())
+
+    def folded(self) -> str:
+        """Профиль в формате folded stacks."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class Sampler:
+    """Фоновый поток, снимающий стеки профилируемых задач."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self._profiles: Set[TaskProfile] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, task: asyncio.Task, root_code: Optional[CodeType] = None) -> TaskProfile:
+        """Начинает профилировать задачу; вызывается из потока её event loop."""
+        profile = TaskProfile(task, threading.get_ident(), root_code)
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return profile
+
+    def stop(self, profile: TaskProfile) -> None:
+        """Заканчивает профилирование; после возврата профиль больше не меняется."""
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                idle = not self._profiles
+            if idle:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            with self._lock:
+                frames = sys._current_frames()
+                for profile in self._profiles:
+                    try:
+                        profile.sample(frames.get(profile.thread_id))
+                    except Exception:
+                        # Стек меняется прямо во время обхода — такой сэмпл просто пропускаем
+                        continue
@@ -0,0 +1,270 @@
+"""
+Token bucket и ограничитель отправки сообщений под лимиты Telegram Bot API.
+
+Telegram допускает примерно 30 сообщений в секунду суммарно и не больше одного
+сообщения в секунду в один чат. `SendRateLimiter` совмещает глобальное ведро и
+вёдра отдельных чатов.
+
+`RateLimitMiddleware` — middleware сессии бота: через него проходит каждый запрос
+к Bot API. Запросы в чат (`send_message`, `edit_message_text`, `delete_message`, ...)
+ждут токены лимитера, а ответ `RetryAfter` выдерживается и запрос повторяется, пока
+не кончатся попытки. Массовые отправки (внутри `bulk_sends()`, например рассылка
+отчётов) уступают интерактивным ответам пользователям и не занимают весь глобальный лимит.
+Счётчики middleware (ожидания лимитера, повторы, отказы) попадают в `/metrics`
+(`telegram_requests_throttled_total`, `telegram_retries_total`, ...).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetUpdates, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from app.config import settings
+from app.utils.metrics import counter, on_collect
+
+logger = logging.getLogger(__name__)
+
+# Сколько ведер чатов держать, прежде чем выбрасывать простаивающие (полные)
+_MAX_IDLE_CHAT_BUCKETS = 10_000
+
+# Какую долю глобального лимита могут занять массовые отправки
+BULK_SHARE = 0.8
+
+# Сколько запросов подряд можно сделать в один чат без паузы (быстрые нажатия клавиатуры)
+CHAT_BURST = 5.0
+
+_middlewares: "weakref.WeakSet[RateLimitMiddleware]" = weakref.WeakSet()
+
+TELEGRAM_REQUESTS = counter("telegram_requests_total", "Запросы к Bot API через лимитер")
+TELEGRAM_THROTTLED = counter("telegram_requests_throttled_total", "Запросы, ждавшие лимитера")
+TELEGRAM_THROTTLED_SECONDS = counter("telegram_throttled_seconds_total", "Суммарное ожидание лимитера, секунды")
+TELEGRAM_RETRIES = counter("telegram_retries_total", "Повторы запросов после RetryAfter")
+TELEGRAM_GAVE_UP = counter("telegram_gave_up_total", "Запросы, не прошедшие после всех повторов")
+
+ChatId = Union[int, str]
+
+_bulk: ContextVar[bool] = ContextVar("bulk_sends", default=False)
+
+
+@contextmanager
+def bulk_sends() -> Iterator[None]:
+    """Помечает запросы к Bot API внутри блока (и созданных в нём задач) как массовые."""
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+class TokenBucket:
+    """Ведро токенов: `rate` токенов в секунду, не больше `capacity` в запасе.
+
+    Ожидающие `acquire()` обслуживаются по очереди (FIFO).
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Забирает токены, если они есть. Возвращает 0 или сколько секунд ещё ждать."""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Ждёт, пока в ведре наберётся `tokens` токенов, и забирает их."""
+        async with self._lock:
+            while True:
+                wait = self.try_acquire(tokens)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def penalize(self, seconds: float) -> None:
+        """Запрещает выдачу токенов на `seconds` секунд (например, после RetryAfter)."""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class SendRateLimiter:
+    """Глобальный лимит на отправку плюс лимит на каждый чат.
+
+    Массовые отправки (`bulk=True`) дополнительно проходят через своё ведро на
+    `BULK_SHARE` глобального лимита и ждут, пока нет ожидающих интерактивных.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        per_chat_rate: float = 1.0,
+        per_chat_burst: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._clock = clock
+        self.global_bucket = TokenBucket(global_rate, clock=clock)
+        self.bulk_bucket = TokenBucket(global_rate * BULK_SHARE, clock=clock)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self._chats: Dict[ChatId, TokenBucket] = {}
+        self._interactive_waiting = 0
+        self._interactive_idle = asyncio.Event()
+        self._interactive_idle.set()
+
+    def _chat_bucket(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_IDLE_CHAT_BUCKETS:
+                self._drop_idle_buckets()
+            bucket = self._chats[chat_id] = TokenBucket(
+                self.per_chat_rate, capacity=self.per_chat_burst, clock=self._clock,
+            )
+        return bucket
+
+    def _drop_idle_buckets(self) -> None:
+        for chat_id in [cid for cid, b in self._chats.items() if b.is_full and not b._lock.locked()]:
+            del self._chats[chat_id]
+
+    async def acquire(self, chat_id: ChatId, bulk: bool = False) -> None:
+        """Ждёт разрешения отправить одно сообщение в чат `chat_id`."""
+        # Сначала чат, потом глобальное ведро: не держим глобальный токен, пока ждём чат
+        await self._chat_bucket(chat_id).acquire()
+        if bulk:
+            await self.bulk_bucket.acquire()
+            # В очередь глобального ведра не встаём: токен берём, только когда
+            # интерактивных ожидающих нет, — иначе они ждали бы за всей рассылкой
+            while True:
+                await self._interactive_idle.wait()
+                wait = self.global_bucket.try_acquire()
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+        self._interactive_waiting += 1
+        self._interactive_idle.clear()
+        try:
+            await self.global_bucket.acquire()
+        finally:
+            self._interactive_waiting -= 1
+            if not self._interactive_waiting:
+                self._interactive_idle.set()
+
+    def retry_after(self, seconds: float, chat_id: Optional[ChatId] = None) -> None:
+        """Учитывает ответ 429 от Telegram: пауза для всех отправок (и для чата)."""
+        self.global_bucket.penalize(seconds)
+        if chat_id is not None:
+            self._chat_bucket(chat_id).penalize(seconds)
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: лимиты Telegram и повторы после `RetryAfter`."""
+
+    def __init__(self, limiter: Optional[SendRateLimiter] = None, max_retries: Optional[int] = None):
+        self.limiter = limiter or SendRateLimiter(
+            settings.TELEGRAM_GLOBAL_RATE_LIMIT, settings.TELEGRAM_PER_CHAT_RATE_LIMIT, CHAT_BURST,
+        )
+        self.max_retries = settings.TELEGRAM_MAX_RETRIES if max_retries is None else max_retries
+        # Счётчики: запросы, ждавшие лимитера (и сколько секунд), повторы и отказы после повторов
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.retried = 0
+        self.gave_up = 0
+        _middlewares.add(self)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        # Long polling сам повторяет запросы, а лимиты на него не распространяются
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        bulk = _bulk.get()
+        self.requests += 1
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self._acquire(chat_id, bulk)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                # Пауза ложится на ведра: повтор встанет в общую очередь лимитера
+                self.limiter.retry_after(e.retry_after, chat_id=chat_id)
+                if attempt >= self.max_retries:
+                    self.gave_up += 1
+                    raise
+                attempt += 1
+                self.retried += 1
+                logger.warning(f"Flood control on {type(method).__name__} for chat {chat_id}, retry in {e.retry_after}s")
+                if chat_id is None:
+                    # Запрос без чата (ответ на callback, правка inline-сообщения) ведра не берёт —
+                    # паузу выдерживаем сами
+                    await asyncio.sleep(e.retry_after)
+
+    async def _acquire(self, chat_id: ChatId, bulk: bool) -> None:
+        started = time.monotonic()
+        await self.limiter.acquire(chat_id, bulk=bulk)
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.throttled += 1
+            self.throttled_seconds += waited
+
+
+def install_rate_limiter(bot: Bot, share: float = 1.0) -> RateLimitMiddleware:
+    """Подключает `RateLimitMiddleware` к сессии бота.
+
+    `share` — доля глобального лимита этого процесса (в пуле из N воркеров — 1/(N+1):
+    у каждого воркера и у основного процесса, который рассылает отчёты).
+    """
+    middleware = RateLimitMiddleware(SendRateLimiter(
+        settings.TELEGRAM_GLOBAL_RATE_LIMIT * share, settings.TELEGRAM_PER_CHAT_RATE_LIMIT, CHAT_BURST,
+    ))
+    bot.session.middleware(middleware)
+    return middleware
+
+
+@on_collect
+def _collect_rate_limit_metrics() -> None:
+    middlewares = list(_middlewares)
+    TELEGRAM_REQUESTS.labels().set(sum(m.requests for m in middlewares))
+    TELEGRAM_THROTTLED.labels().set(sum(m.throttled for m in middlewares))
+    TELEGRAM_THROTTLED_SECONDS.labels().set(sum(m.throttled_seconds for m in middlewares))
+    TELEGRAM_RETRIES.labels().set(sum(m.retried for m in middlewares))
+    TELEGRAM_GAVE_UP.labels().set(sum(m.gave_up for m in middlewares))
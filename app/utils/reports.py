@@ -139,3 +139,24 @@ def report_asset_no_history(current_capital: dict) -> str:
         "",
         "Исторических данных для сравнения пока нет.",
     ])
+
+
+def report_capital_history(series: list) -> str:
+    """Формирует отчёт о динамике капитала по датам.
+
+    series: [(date, {"RUB": ..., "USD": ...}), ...] в порядке возрастания дат.
+    """
+    lines = ["📈 История капитала:", ""]
+    prev_usd = None
+    for point_date, capital in series:
+        usd = capital.get("USD", 0)
+        rub = capital.get("RUB", 0)
+        change = ""
+        if prev_usd:
+            change = f" ({(usd - prev_usd) / prev_usd * 100:+.1f}%)"
+        lines.append(
+            f"{point_date.strftime('%d.%m.%Y')}: {fmt_money_str(str(round(rub, 2)))} RUB"
+            f" / {fmt_money_str(str(round(usd, 2)))} USD{change}"
+        )
+        prev_usd = usd
+    return "\n".join(lines)
@@ -0,0 +1,138 @@
+"""
+Режим webhook: приём апдейтов Telegram через aiohttp-сервер.
+
+Telegram присылает апдейты POST-запросами на `WEBHOOK_PATH` с заголовком
+`X-Telegram-Bot-Api-Secret-Token`; запросы с неверным секретом отклоняются, а без
+заданного `WEBHOOK_SECRET` сервер не запускается.
+Сервер сразу отвечает 200, а апдейт обрабатывается в фоне. Одновременно
+обрабатывается не больше `WEBHOOK_MAX_CONCURRENCY` апдейтов: при превышении
+ответ задерживается, и Telegram сам притормаживает доставку.
+
+Webhook обслуживает один экземпляр бота. Ставить несколько экземпляров за обычный
+балансировщик нельзя: состояние форм (`DbStorage`), настройки пользователей и
+кэши отчётов живут в памяти процесса, поэтому все апдейты пользователя должны
+попадать в один процесс. Для нескольких ядер есть `WORKER_PROCESSES` — он
+раскладывает апдейты по user_id (`app.sharding`). Локально режим проверяется отправкой записанных апдейтов
+(JSON из `getUpdates`) на адрес сервера.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+from typing import Any, Awaitable, Callable, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookHandler:
+    """Принимает апдейты по HTTP и передаёт их диспетчеру с ограничением параллельности."""
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        secret: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        feed: Optional[Callable[[Bot, Update], Awaitable[Any]]] = None,
+    ):
+        self.dp = dp
+        self.bot = bot
+        # Куда передавать апдейт: по умолчанию в диспетчер, в режиме пула — воркерам
+        self._feed = feed or dp.feed_update
+        self.secret = secret
+        self._slots = asyncio.Semaphore(max_concurrency or settings.WEBHOOK_MAX_CONCURRENCY)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _authorized(self, request: web.Request) -> bool:
+        # Без секрета любой мог бы прислать апдейт от имени любого пользователя
+        if not self.secret:
+            return False
+        return hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception:
+            logger.warning("Rejected malformed webhook update")
+            return web.Response(status=400)
+
+        # Ждём свободный слот до ответа: так перегрузка превращается в медленные ответы Telegram
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self._feed(self.bot, update)
+        except Exception:
+            logger.exception(f"Failed to process update {update.update_id}")
+        finally:
+            self._slots.release()
+
+    async def drain(self) -> None:
+        """Дожидается обработки уже принятых апдейтов."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def build_webhook_app(handler: WebhookHandler, path: Optional[str] = None) -> web.Application:
+    """aiohttp-приложение с маршрутом приёма апдейтов."""
+    app = web.Application()
+    app.router.add_post(path or settings.WEBHOOK_PATH, handler.handle)
+
+    async def on_shutdown(_: web.Application) -> None:
+        await handler.drain()
+
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    feed: Optional[Callable[[Bot, Update], Awaitable[Any]]] = None,
+) -> None:
+    """Регистрирует webhook в Telegram и обслуживает его до отмены задачи.
+
+    `feed` заменяет `dp.feed_update` (например, `ShardPool.feed_update`).
+    """
+    if not settings.WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL is required when BOT_MODE=webhook")
+    if not settings.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET is required when BOT_MODE=webhook")
+
+    handler = WebhookHandler(dp, bot, secret=settings.WEBHOOK_SECRET, feed=feed)
+    runner = web.AppRunner(build_webhook_app(handler))
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+
+    await dp.emit_startup(bot=bot)
+    try:
+        await site.start()
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(settings.WEBHOOK_MAX_CONCURRENCY, 100),
+        )
+        logger.info(
+            f"Webhook server listening on {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}"
+        )
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
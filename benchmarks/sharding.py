@@ -0,0 +1,110 @@
+"""
+Бенчмарк режима пула процессов: апдейтов в секунду при 1, 2 и 4 воркерах.
+
+Обработчик синтетический, но по профилю похож на обработчики бота: собирает
+инлайн-клавиатуру и форматирует текст карточки, ничего не отправляя в Telegram.
+Апдейты генерируются от многих пользователей и раскладываются по воркерам так же,
+как в боевом режиме (`ShardPool.submit`).
+
+Запуск:
+    python -m benchmarks.sharding [--updates 2000] [--users 500] [--work 2]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from aiogram import Dispatcher, F
+from aiogram.types import Message, Update
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from app.sharding import ShardPool
+
+TOKEN = "42:BENCHMARK"
+
+# Сколько клавиатур строит обработчик на один апдейт (нагрузка на CPU).
+# Воркеры запускаются через spawn, поэтому значение передаётся им через окружение.
+WORK = int(os.environ.get("BENCH_WORK", "2"))
+
+
+def _render(text: str) -> int:
+    size = 0
+    for page in range(WORK):
+        kb = InlineKeyboardBuilder()
+        for i in range(24):
+            kb.button(text=f"{text} {page}:{i}", callback_data=f"cat:pick:u{page * 24 + i}")
+        kb.adjust(3)
+        markup = kb.as_markup()
+        size += len(markup.model_dump_json())
+    return size
+
+
+async def _on_message(message: Message) -> None:
+    _render(message.text or "")
+
+
+def bench_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    dp.message.register(_on_message, F.text)
+    return dp
+
+
+def _update(update_id: int, user_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": f"{update_id % 1000}.50 USD",
+        },
+    })
+
+
+def _wait_processed(pool: ShardPool, count: int) -> None:
+    while pool.processed.value < count:
+        time.sleep(0.005)
+
+
+def run(workers: int, updates: int, users: int) -> float:
+    """Апдейтов в секунду при `workers` воркерах."""
+    pool = ShardPool(workers, bench_dispatcher, TOKEN)
+    pool.start()
+    try:
+        # Прогрев: дожидаемся, пока все воркеры поднимутся и обработают по апдейту
+        warmup = [_update(i, i) for i in range(workers * 20)]
+        for update in warmup:
+            pool.submit(update)
+        _wait_processed(pool, len(warmup))
+
+        batch = [_update(len(warmup) + i, i % users) for i in range(updates)]
+        started = time.perf_counter()
+        for update in batch:
+            pool.submit(update)
+        _wait_processed(pool, len(warmup) + updates)
+        return updates / (time.perf_counter() - started)
+    finally:
+        pool.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--work", type=int, default=WORK, help="клавиатур на апдейт")
+    args = parser.parse_args()
+    os.environ["BENCH_WORK"] = str(args.work)
+
+    print(f"CPU cores: {os.cpu_count()}, updates: {args.updates}, users: {args.users}, work: {args.work}")
+    base = None
+    for workers in args.workers:
+        rate = run(workers, args.updates, args.users)
+        base = base or rate
+        print(f"{workers} worker(s): {rate:8.0f} updates/s  x{rate / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
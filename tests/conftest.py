@@ -5,3 +5,8 @@ import sys
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
+
+# Настройки читаются при импорте `app.config`; для тестов подставляем безопасные значения,
+# чтобы не трогать реальную БД и токены из .env
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("DB_URL", "sqlite+aiosqlite:///:memory:")
@@ -0,0 +1,39 @@
+from datetime import date
+
+import pytest
+
+from app.services.analytics.asset.capital_series import AssetEvent, build_date_grid, sweep_capital_usd
+
+
+def test_build_date_grid_month_ends():
+    grid = build_date_grid(date(2025, 3, 10), 4, "month")
+    assert grid == [date(2024, 12, 31), date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 10)]
+
+
+def test_build_date_grid_rejects_unknown_frequency():
+    with pytest.raises(ValueError):
+        build_date_grid(date(2025, 3, 10), 3, "year")
+
+
+def test_sweep_uses_latest_position_value_and_rate_as_of_date():
+    events = [
+        AssetEvent(date(2025, 1, 5), (1, 1), "BTC", 1.0),
+        AssetEvent(date(2025, 1, 20), (2, 2), "USD", 100.0),
+        AssetEvent(date(2025, 2, 10), (1, 1), "BTC", 2.0),  # перезаписывает позицию, а не добавляет
+    ]
+    rates = [
+        (date(2025, 1, 1), "BTC", 1000.0),
+        (date(2025, 2, 1), "BTC", 2000.0),
+    ]
+    dates = [date(2024, 12, 31), date(2025, 1, 31), date(2025, 2, 28)]
+
+    capital, usd_rates = sweep_capital_usd(events, rates, dates, {"USD": 1.0, "BTC": 3000.0})
+
+    assert capital.tolist() == [0.0, 1100.0, 4100.0]
+    assert usd_rates["BTC"].tolist() == [3000.0, 1000.0, 2000.0]
+
+
+def test_sweep_ignores_currencies_without_any_rate():
+    events = [AssetEvent(date(2025, 1, 5), (7, None), "XYZ", 5.0)]
+    capital, _ = sweep_capital_usd(events, [], [date(2025, 1, 31)], {})
+    assert capital.tolist() == [0.0]
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, User, Currency, Entry
+from app.services.analytics.expense.expense_reports import build_report, build_reports_batch
+from app.services.rates import rates_fiat, rates_crypto
+
+
+def test_batch_reports_match_per_user_reports(tmp_path, monkeypatch):
+    now = datetime.now()
+    monkeypatch.setitem(rates_fiat._cache, "data", {"USD": 1.0, "RUB": 90.0, "VND": 25000.0, "EUR": 0.9})
+    monkeypatch.setitem(rates_fiat._cache, "timestamp", now)
+    monkeypatch.setitem(rates_crypto._cache, "data", {"BTC": 100000.0})
+    monkeypatch.setitem(rates_crypto._cache, "timestamp", now)
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'weekly.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        recent = datetime.now(timezone.utc) - timedelta(days=2)
+        old = datetime.now(timezone.utc) - timedelta(days=30)
+        async with factory() as session:
+            session.add_all([User(id=1), User(id=2), User(id=3)])
+            rub, eur, usd = Currency(user_id=1, code="RUB"), Currency(user_id=1, code="EUR"), Currency(user_id=2, code="USD")
+            session.add_all([rub, eur, usd])
+            await session.flush()
+            session.add_all([
+                Entry(user_id=1, mode="expense", amount=Decimal("900"), currency_id=rub.id, created_at=recent),
+                Entry(user_id=1, mode="expense", amount=Decimal("450"), currency_id=rub.id, created_at=recent),
+                Entry(user_id=1, mode="expense", amount=Decimal("9"), currency_id=eur.id, created_at=recent),
+                Entry(user_id=1, mode="income", amount=Decimal("1000"), currency_id=rub.id, created_at=recent),
+                Entry(user_id=2, mode="expense", amount=Decimal("5"), currency_id=usd.id, created_at=recent),
+                Entry(user_id=2, mode="expense", amount=Decimal("7"), currency_id=None, created_at=recent),
+                Entry(user_id=3, mode="expense", amount=Decimal("100"), currency_id=None, created_at=old),
+            ])
+            await session.commit()
+
+        async with factory() as session:
+            batch = await build_reports_batch(session, [1, 2, 3])
+            single = {uid: await build_report(uid, session) for uid in (1, 2, 3)}
+        await engine.dispose()
+        return batch, single
+
+    batch, single = asyncio.run(scenario())
+    assert batch == single
+    assert "25.00 USD" in batch[1]
+    assert "12.00 USD" in batch[2]
+    assert "не было расходов" in batch[3]
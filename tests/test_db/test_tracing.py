@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, User
+from app.db.tracing import assert_max_queries, attach_tracer, bind_trace, trace_queries
+from app.db.writer import SQLiteWriter
+
+
+async def _make_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 't.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    attach_tracer(engine)
+    attach_tracer(engine)  # повторное подключение не удваивает счёт
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+
+def test_trace_counts_queries_and_finds_repeats(tmp_path):
+    async def scenario():
+        engine, factory = await _make_engine(tmp_path)
+        async with factory() as session:
+            with trace_queries("loop") as trace:
+                for uid in range(5):
+                    await session.scalar(select(User).where(User.id == uid))
+            with pytest.raises(AssertionError, match="at most 3 queries"):
+                with assert_max_queries(3):
+                    for uid in range(5):
+                        await session.scalar(select(User).where(User.id == uid))
+            with assert_max_queries(1):
+                await session.scalar(select(User))
+        await engine.dispose()
+        return trace
+
+    trace = asyncio.run(scenario())
+    assert trace.count == 5
+    assert trace.total_seconds > 0
+    [(count, sql)] = trace.repeated()
+    assert count == 5 and "FROM users" in sql
+
+
+def test_trace_follows_writes_into_writer_task(tmp_path, caplog):
+    async def scenario():
+        engine, factory = await _make_engine(tmp_path)
+        writer = SQLiteWriter(factory, batch_size=16)
+
+        async def add_user(session):
+            session.add(User(id=1, username="u1"))
+            await session.flush()
+
+        with caplog.at_level(logging.WARNING, logger="app.db.tracing"):
+            with trace_queries("update 1", budget=0) as trace:
+                await writer.submit(bind_trace(add_user))
+        await writer.stop()
+        await engine.dispose()
+        return trace
+
+    trace = asyncio.run(scenario())
+    assert trace.count >= 1
+    assert "SQL query budget 0 exceeded by update 1" in caplog.text
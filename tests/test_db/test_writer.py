@@ -0,0 +1,106 @@
+import asyncio
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, User
+from app.db.versions import get_version, mark_changed
+from app.db.writer import SQLiteWriter, enable_savepoints
+
+
+async def _make_writer(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'w.db'}")
+    enable_savepoints(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    return engine, factory, SQLiteWriter(factory, batch_size=16)
+
+
+def test_writer_commits_concurrent_writes(tmp_path):
+    async def scenario():
+        engine, factory, writer = await _make_writer(tmp_path)
+
+        def add_user(uid):
+            async def fn(session):
+                session.add(User(id=uid, username=f"u{uid}"))
+                await session.flush()
+                return uid
+            return fn
+
+        results = await asyncio.gather(*(writer.submit(add_user(i)) for i in range(1, 51)))
+        await writer.stop()
+
+        async with factory() as session:
+            count = await session.scalar(select(func.count(User.id)))
+        await engine.dispose()
+        return results, count
+
+    results, count = asyncio.run(scenario())
+    assert results == list(range(1, 51))
+    assert count == 50
+
+
+def test_writer_failure_is_isolated(tmp_path):
+    async def scenario():
+        engine, factory, writer = await _make_writer(tmp_path)
+
+        async def ok(session):
+            session.add(User(id=1, username="ok"))
+            await session.flush()
+
+        async def boom(session):
+            raise ValueError("boom")
+
+        good, bad = await asyncio.gather(writer.submit(ok), writer.submit(boom), return_exceptions=True)
+        await writer.stop()
+
+        async with factory() as session:
+            count = await session.scalar(select(func.count(User.id)))
+        await engine.dispose()
+        return good, bad, count
+
+    good, bad, count = asyncio.run(scenario())
+    assert good is None
+    assert isinstance(bad, ValueError)
+    assert count == 1
+
+
+def test_failed_write_in_batch_rolls_back_alone_and_nothing_runs_twice(tmp_path):
+    calls = []
+
+    def add_user(uid, fail=False):
+        async def fn(session):
+            calls.append(uid)
+            session.add(User(id=uid, username=f"u{uid}"))
+            mark_changed(session, "entries", uid)
+            await session.flush()
+            if fail:
+                raise ValueError("boom")
+            return uid
+        return fn
+
+    async def scenario():
+        engine, factory, writer = await _make_writer(tmp_path)
+        results = await asyncio.gather(
+            writer.submit(add_user(101)),
+            writer.submit(add_user(102, fail=True)),
+            writer.submit(add_user(103)),
+            return_exceptions=True,
+        )
+        await writer.stop()
+
+        async with factory() as session:
+            ids = (await session.scalars(select(User.id).order_by(User.id))).all()
+        await engine.dispose()
+        return results, ids
+
+    versions = [get_version("entries", uid) for uid in (101, 102, 103)]
+    results, ids = asyncio.run(scenario())
+    assert results[0] == 101 and results[2] == 103
+    assert isinstance(results[1], ValueError)
+    assert ids == [101, 103]
+    assert calls == [101, 102, 103]
+    assert [get_version("entries", uid) for uid in (101, 102, 103)] == [
+        versions[0] + 1, versions[1], versions[2] + 1,
+    ]
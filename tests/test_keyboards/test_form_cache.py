@@ -0,0 +1,51 @@
+import asyncio
+
+import app.keyboards.form as form
+from app.keyboards.form import kb_amount_tab, kb_currency_tab
+from app.services.prefs import PrefsCache
+from app.states.form import FormState
+
+
+def _texts(markup):
+    return [button.text for row in markup.inline_keyboard for button in row]
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_amount_keypad_is_shared_per_mode_and_note_flag():
+    first = kb_amount_tab(FormState(mode="income", amount_str="12"))
+    assert kb_amount_tab(FormState(mode="income", amount_str="345")) is first
+    assert kb_amount_tab(FormState(mode="income", note="обед")) is not first
+    assert "● ДОХОД" in _texts(first)
+    assert "📝 Описание ✅" in _texts(kb_amount_tab(FormState(mode="asset", note="x")))
+
+
+def test_currency_page_is_rebuilt_after_prefs_change(monkeypatch):
+    user_id = 777001
+
+    async def session_factory():
+        return FakeSession()
+
+    async def snapshot(session, uid):
+        return {"currencies": [("GBP", 1)], "categories": {}}
+
+    monkeypatch.setattr("app.services.prefs.get_user_prefs_snapshot", snapshot)
+    cache = PrefsCache(session_factory=session_factory)
+    monkeypatch.setattr(form, "prefs_cache", cache)
+    asyncio.run(cache.load(user_id))
+    st = FormState(currency="gbp")
+
+    first = kb_currency_tab(user_id, st)
+    assert kb_currency_tab(user_id, st) is first
+    assert "GBP ✅" in _texts(first)
+
+    cache.push_front(user_id, "KZT")
+    rebuilt = kb_currency_tab(user_id, st)
+    assert rebuilt is not first
+    assert _texts(rebuilt)[:2] == ["KZT", "GBP ✅"]
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from app.middlewares.profiling import ProfilingMiddleware
+from app.utils.profiler import Sampler, WAITING_FRAME
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def list_assets(event, data):
+    await asyncio.sleep(0.1)
+    _busy(0.1)
+
+
+def _data(callback):
+    return {"handler": SimpleNamespace(callback=callback), "event_from_user": SimpleNamespace(id=42)}
+
+
+def test_sampled_handler_dumps_folded_stacks(tmp_path):
+    mw = ProfilingMiddleware(sample_rate=1.0, slow_seconds=None, directory=str(tmp_path), sampler=Sampler(0.002))
+    asyncio.run(mw(list_assets, SimpleNamespace(), _data(list_assets)))
+
+    [dump] = tmp_path.iterdir()
+    assert dump.name.startswith("list_assets-u") and dump.suffix == ".folded"
+    stacks = {}
+    for line in dump.read_text().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        stacks[stack] = int(count)
+    # Первый кадр — сам обработчик; видно и ожидание в sleep, и работу Python-кода
+    assert all(stack.startswith("list_assets ") for stack in stacks)
+    assert any("sleep" in s and s.endswith(WAITING_FRAME) for s in stacks)
+    assert any("_busy" in s and not s.endswith(WAITING_FRAME) for s in stacks)
+
+
+def test_fast_handler_below_threshold_is_not_profiled(tmp_path):
+    async def quick(event, data):
+        await asyncio.sleep(0)
+        return "ok"
+
+    async def slow(event, data):
+        await asyncio.sleep(0.1)
+
+    mw = ProfilingMiddleware(sample_rate=0.0, slow_seconds=0.05, directory=str(tmp_path), sampler=Sampler(0.002))
+
+    async def scenario():
+        assert await mw(quick, SimpleNamespace(), _data(quick)) == "ok"
+        assert mw.dumps == 0
+        await mw(slow, SimpleNamespace(), _data(slow))
+
+    asyncio.run(scenario())
+    assert mw.dumps == 1
+    assert [p.name.split("-")[0] for p in tmp_path.iterdir()] == ["slow"]
+
+
+def test_only_latest_dumps_are_kept(tmp_path):
+    for i in range(3):
+        old = tmp_path / f"old{i}-u00-20240101T000000-1ms.folded"
+        old.write_text("a;b 1\n")
+        os.utime(old, (1_700_000_000 + i, 1_700_000_000 + i))
+
+    mw = ProfilingMiddleware(sample_rate=1.0, slow_seconds=None, directory=str(tmp_path),
+                             sampler=Sampler(0.002), max_dumps=2)
+    asyncio.run(mw(list_assets, SimpleNamespace(), _data(list_assets)))
+
+    names = sorted(p.name.split("-")[0] for p in tmp_path.iterdir())
+    assert names == ["list_assets", "old2"]
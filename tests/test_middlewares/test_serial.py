@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.middlewares.serial import SerialUpdateMiddleware, HandlerTimeoutMiddleware, TIMEOUT_TEXT
+
+
+def test_same_user_runs_in_order_and_users_run_in_parallel():
+    mw = SerialUpdateMiddleware(max_concurrency=2)
+    log = []
+    running = []
+
+    async def handler(event, data):
+        running.append(event)
+        log.append(("start", event))
+        await asyncio.sleep(0.02)
+        log.append(("end", event))
+        running.remove(event)
+        return event
+
+    def data(user_id):
+        return {"event_from_user": SimpleNamespace(id=user_id)}
+
+    async def scenario():
+        peak = 0
+
+        async def watch():
+            nonlocal peak
+            while True:
+                peak = max(peak, len(running))
+                await asyncio.sleep(0.001)
+
+        watcher = asyncio.create_task(watch())
+        results = await asyncio.gather(
+            mw(handler, "a1", data(1)), mw(handler, "a2", data(1)),
+            mw(handler, "b1", data(2)), mw(handler, "c1", data(3)),
+        )
+        watcher.cancel()
+        return results, peak
+
+    results, peak = asyncio.run(scenario())
+    assert results == ["a1", "a2", "b1", "c1"]
+    # a2 стартует только после завершения a1
+    assert log.index(("end", "a1")) < log.index(("start", "a2"))
+    assert peak == 2
+    assert mw.queued == 0
+
+
+def test_handler_over_budget_is_cancelled_and_user_notified():
+    mw = HandlerTimeoutMiddleware(default=0.02)
+    answers = []
+
+    class Event:
+        async def answer(self, text):
+            answers.append(text)
+
+    async def slow(event, data):
+        await asyncio.sleep(1)
+
+    async def fast(event, data):
+        return "ok"
+
+    assert asyncio.run(mw(slow, Event(), {})) is None
+    assert asyncio.run(mw(fast, Event(), {})) == "ok"
+    assert answers == [TIMEOUT_TEXT]
+    assert mw.timeouts == 1
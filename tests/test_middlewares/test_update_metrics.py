@@ -0,0 +1,39 @@
+import asyncio
+
+from aiogram.types import Update
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, User
+from app.db.tracing import attach_tracer, bind_trace
+from app.db.writer import SQLiteWriter
+from app.middlewares.metrics import UPDATE_DB_QUERIES, UpdateMetricsMiddleware
+
+
+def test_update_query_count_includes_writes_from_writer_task(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'm.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        attach_tracer(engine)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        writer = SQLiteWriter(factory, batch_size=16)
+
+        async def add_user(session):
+            session.add(User(id=1))
+            await session.flush()
+
+        async def handler(event, data):
+            async with factory() as session:
+                await session.scalar(select(User).where(User.id == 1))
+            # Как run_write: запись выполняет задача-писатель
+            await writer.submit(bind_trace(add_user))
+
+        before = UPDATE_DB_QUERIES._default.sum
+        await UpdateMetricsMiddleware(query_budget=None)(handler, Update(update_id=1), {})
+        await writer.stop()
+        await engine.dispose()
+        return UPDATE_DB_QUERIES._default.sum - before
+
+    # SELECT в обработчике и INSERT в задаче-писателе
+    assert asyncio.run(scenario()) >= 2
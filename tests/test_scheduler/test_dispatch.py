@@ -0,0 +1,62 @@
+import asyncio
+
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from app.scheduler.dispatch import ReportDispatcher
+from app.utils.rate_limit import _bulk
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+async def fake_session_factory():
+    return FakeSession()
+
+
+class FakeBot:
+    def __init__(self, blocked=()):
+        self.sent = []
+        self.bulk = set()
+        self._blocked = set(blocked)
+
+    async def send_message(self, chat_id, text):
+        method = SendMessage(chat_id=chat_id, text=text)
+        if chat_id in self._blocked:
+            raise TelegramForbiddenError(method=method, message="bot was blocked by the user")
+        self.bulk.add(_bulk.get())
+        self.sent.append((chat_id, text))
+
+
+async def report_fn(user_id, session):
+    if user_id == 13:
+        raise RuntimeError("broken report")
+    return f"report for {user_id}"
+
+
+def _dispatcher(bot):
+    return ReportDispatcher(
+        bot=bot,
+        report_fn=report_fn,
+        report_name="test",
+        concurrency=4,
+        session_factory=fake_session_factory,
+    )
+
+
+def test_dispatch_sends_to_all_users_as_bulk_and_counts_outcomes():
+    bot = FakeBot(blocked={5})
+    stats = asyncio.run(_dispatcher(bot).run(range(1, 21)))
+
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [u for u in range(1, 21) if u not in (5, 13)]
+    assert stats.sent == 18
+    assert stats.blocked == 1
+    assert stats.failed == 1
+    # Отправки рассылки помечены массовыми — лимитер пропускает вперёд ответы пользователям
+    assert bot.bulk == {True}
+    assert stats.done == stats.total == 20
@@ -0,0 +1,40 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, JobRun
+from app.scheduler.jobs import _claim_run, _update_run
+
+
+def test_run_lease_is_exclusive_until_it_expires_or_is_done(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def claim(token):
+            async with factory() as session:
+                claimed = await _claim_run(session, "job", "2025-01-15", token)
+                await session.commit()
+                return claimed
+
+        results = [await claim("replica-a"), await claim("replica-b")]
+
+        # Реплика A «упала»: аренда истекла, запуск забирает B
+        async with factory() as session:
+            await session.execute(update(JobRun).values(lease_until=datetime.now(timezone.utc) - timedelta(seconds=1)))
+            await session.commit()
+        results.append(await claim("replica-b"))
+
+        async with factory() as session:
+            await _update_run(session, "job", "2025-01-15", "replica-b", status="done", lease_until=None)
+            await session.commit()
+        results.append(await claim("replica-c"))
+
+        await engine.dispose()
+        return results
+
+    assert asyncio.run(scenario()) == [True, False, True, False]
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.config import settings
+from app.db.models import Base, ScheduledDelivery, User
+from app.scheduler import staggered
+from app.scheduler.staggered import parse_report_time, preferred_due_at, slot_offset
+
+
+def test_slot_offsets_are_stable_and_spread_over_window():
+    window = 3 * 3600
+    offsets = [slot_offset(user_id, window) for user_id in range(1000)]
+    assert offsets == [slot_offset(user_id, window) for user_id in range(1000)]
+    assert all(0 <= o < window for o in offsets)
+    # Примерно равномерно: в каждой трети окна не меньше четверти пользователей
+    for third in range(3):
+        assert sum(third * 3600 <= o < (third + 1) * 3600 for o in offsets) > 250
+
+
+def test_preferred_due_at_picks_next_local_time():
+    run_start = datetime(2025, 6, 2, 9, 0, tzinfo=timezone.utc)
+    # 18:00 в UTC+3 — 15:00 UTC того же дня
+    assert preferred_due_at(run_start, 18 * 60, 180) == datetime(2025, 6, 2, 15, 0, tzinfo=timezone.utc)
+    # 08:00 в UTC+3 уже прошло (сейчас 12:00 по местному) — на следующий день
+    assert preferred_due_at(run_start, 8 * 60, 180) == datetime(2025, 6, 3, 5, 0, tzinfo=timezone.utc)
+
+
+def test_parse_report_time():
+    assert parse_report_time("09:30") == (570, 0)
+    assert parse_report_time("9:30 UTC+3") == (570, 180)
+    assert parse_report_time("21:00 utc-5:30") == (1260, -330)
+    with pytest.raises(ValueError):
+        parse_report_time("25:00")
+    with pytest.raises(ValueError):
+        parse_report_time("завтра")
+
+
+def test_batch_stops_sending_once_another_replica_takes_its_lease(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", 3)
+    monkeypatch.setattr(settings, "REPORT_DISPATCH_CONCURRENCY", 1)
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'slots.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def run_write(fn):
+            async with factory() as session:
+                result = await fn(session)
+                await session.commit()
+                return result
+
+        monkeypatch.setattr(staggered, "run_write", run_write)
+        now = datetime.now(timezone.utc)
+        async with factory() as session:
+            for uid in (1, 2, 3):
+                session.add(User(id=uid))
+                session.add(ScheduledDelivery(job_name="weekly", run_key="k", user_id=uid,
+                                              due_at=now - timedelta(minutes=1), status="pending"))
+            await session.commit()
+
+        sent = []
+
+        class SlowBot:
+            async def send_message(self, chat_id, text):
+                sent.append(chat_id)
+                # Пока первое сообщение застряло в RetryAfter, аренда истекла и пачку забрала другая реплика
+                await run_write(lambda session: session.execute(
+                    update(ScheduledDelivery).values(lease_owner="other-replica")
+                ))
+                await asyncio.sleep(3)
+
+        async def report(user_id, session):
+            return "report"
+
+        scheduler = staggered.StaggeredReportScheduler(bot=SlowBot(), report_fn=report, job_name="weekly")
+        await scheduler.process_due(now)
+
+        async with factory() as session:
+            slots = (await session.execute(select(ScheduledDelivery))).scalars().all()
+        await engine.dispose()
+        return sent, slots
+
+    sent, slots = asyncio.run(scenario())
+    assert sent == [1]
+    assert all(s.status == "pending" and s.lease_owner == "other-replica" for s in slots)
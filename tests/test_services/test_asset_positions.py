@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, User, Currency, Category, Entry, AssetLatestValues
+from app.services.asset_positions import AssetPositionService
+
+
+async def _setup(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'positions.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    async with factory() as session:
+        session.add(User(id=1))
+        cur = Currency(user_id=1, code="USD")
+        cat = Category(user_id=1, mode="asset", name="Кэш")
+        session.add_all([cur, cat])
+        await session.flush()
+        entries = [
+            Entry(user_id=1, mode="asset", amount=Decimal(amount), currency_id=cur.id,
+                  category_id=cat.id, created_at=t0 + timedelta(days=i))
+            for i, amount in enumerate(["100", "200", "300"])
+        ]
+        session.add_all(entries)
+        await session.flush()
+        session.add(AssetLatestValues(user_id=1, currency_code="USD", category_name="Кэш",
+                                      amount=Decimal("300"), entry_id=entries[-1].id))
+        await session.commit()
+    return engine, factory, [e.id for e in entries]
+
+
+def test_remove_latest_entry_falls_back_to_previous_value(tmp_path):
+    async def scenario():
+        engine, factory, ids = await _setup(tmp_path)
+        async with factory() as session:
+            service = AssetPositionService(session)
+            await service.remove_entry(await session.get(Entry, ids[-1]))
+            await session.commit()
+            latest = (await session.execute(select(AssetLatestValues))).scalar_one()
+            problems = await service.verify()
+        await engine.dispose()
+        return ids, latest, problems
+
+    ids, latest, problems = asyncio.run(scenario())
+    assert latest.amount == Decimal("200")
+    assert latest.entry_id == ids[1]
+    assert problems == []
+
+
+def test_remove_last_entry_of_position_drops_latest_value(tmp_path):
+    async def scenario():
+        engine, factory, ids = await _setup(tmp_path)
+        async with factory() as session:
+            service = AssetPositionService(session)
+            for entry_id in ids:
+                await service.remove_entry(await session.get(Entry, entry_id))
+            await session.commit()
+            rows = (await session.execute(select(AssetLatestValues))).scalars().all()
+        await engine.dispose()
+        return rows
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_verify_detects_and_rebuild_repairs_drift(tmp_path):
+    async def scenario():
+        engine, factory, ids = await _setup(tmp_path)
+        async with factory() as session:
+            row = (await session.execute(select(AssetLatestValues))).scalar_one()
+            row.amount = Decimal("1")
+            await session.commit()
+
+            service = AssetPositionService(session)
+            before = await service.verify(user_id=1)
+            rebuilt = await service.rebuild(user_id=1)
+            await session.commit()
+            after = await service.verify(user_id=1)
+        await engine.dispose()
+        return before, rebuilt, after
+
+    before, rebuilt, after = asyncio.run(scenario())
+    assert [p["problem"] for p in before] == ["stale"]
+    assert rebuilt == 1
+    assert after == []
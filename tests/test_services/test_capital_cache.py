@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, User, AssetLatestValues
+from app.services.asset_service import AssetService
+from app.services.rates import rates_fiat, rates_crypto
+from app.services.rates.converter import CurrencyConverter
+
+
+def _fresh_rates(monkeypatch):
+    now = datetime.now()
+    monkeypatch.setitem(rates_fiat._cache, "data", {"USD": 1.0, "RUB": 100.0})
+    monkeypatch.setitem(rates_fiat._cache, "timestamp", now)
+    monkeypatch.setitem(rates_crypto._cache, "data", {"BTC": 100000.0})
+    monkeypatch.setitem(rates_crypto._cache, "timestamp", now)
+
+
+def test_capital_is_cached_until_asset_write(tmp_path, monkeypatch):
+    _fresh_rates(monkeypatch)
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'cache.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with factory() as session:
+            session.add(User(id=7))
+            session.add(AssetLatestValues(user_id=7, currency_code="USD", category_name="Кэш",
+                                          amount=Decimal("100")))
+            await session.commit()
+
+        async with factory() as session:
+            first = await AssetService(session).get_current_capital(7, ["USD"])
+
+        # Изменение в обход сервиса не инвалидирует кэш
+        async with factory() as session:
+            await session.execute(update(AssetLatestValues).values(amount=Decimal("500")))
+            await session.commit()
+            cached = await AssetService(session).get_current_capital(7, ["USD"])
+
+        async with factory() as session:
+            await AssetService(session).update_latest_asset_value(7, "USD", "Кэш", Decimal("200"), None)
+            await session.commit()
+            fresh = await AssetService(session).get_current_capital(7, ["USD"])
+
+        await engine.dispose()
+        return first, cached, fresh
+
+    first, cached, fresh = asyncio.run(scenario())
+    assert first == {"USD": 100.0}
+    assert cached == {"USD": 100.0}
+    assert fresh == {"USD": 200.0}
+
+
+def test_capital_with_failed_conversion_is_not_cached(tmp_path, monkeypatch):
+    _fresh_rates(monkeypatch)
+    convert = CurrencyConverter.convert
+    outage = {"BTC"}
+
+    async def flaky_convert(self, amount, from_currency, to_currency):
+        if from_currency in outage:
+            raise RuntimeError("rates provider is down")
+        return await convert(self, amount, from_currency, to_currency)
+
+    monkeypatch.setattr(CurrencyConverter, "convert", flaky_convert)
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'failed.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with factory() as session:
+            session.add(User(id=8))
+            session.add(AssetLatestValues(user_id=8, currency_code="USD", category_name="Кэш",
+                                          amount=Decimal("100")))
+            session.add(AssetLatestValues(user_id=8, currency_code="BTC", category_name="Крипта",
+                                          amount=Decimal("1")))
+            await session.commit()
+
+        async with factory() as session:
+            partial = await AssetService(session).get_current_capital(8, ["USD"])
+        outage.clear()
+        async with factory() as session:
+            full = await AssetService(session).get_current_capital(8, ["USD"])
+
+        await engine.dispose()
+        return partial, full
+
+    partial, full = asyncio.run(scenario())
+    assert partial == {"USD": 100.0}
+    assert full == {"USD": 100100.0}
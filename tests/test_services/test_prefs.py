@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, User, Currency, Category
+from app.constants.constants import BASE_CURRENCIES, DEFAULT_CATEGORIES
+from app.services.prefs import PrefsCache, PrefList
+
+
+def test_prefs_are_loaded_lazily_in_one_query(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'prefs.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        now = datetime.now(timezone.utc)
+        async with factory() as session:
+            session.add(User(id=5))
+            session.add_all([
+                Currency(user_id=5, code="GBP"),
+                Currency(user_id=5, code="KZT", last_used_at=now),
+                Category(user_id=5, mode="expense", name="Кофе"),
+                Category(user_id=5, mode="income", name="Кэшбэк", last_used_at=now),
+            ])
+            await session.commit()
+
+        queries = []
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+        async def session_factory():
+            return factory()
+
+        cache = PrefsCache(session_factory=session_factory)
+        empty = cache.get(5)
+        prefs = await cache.load(5)
+        again = await cache.load(5)
+        await engine.dispose()
+        return empty, prefs, again, queries
+
+    empty, prefs, again, queries = asyncio.run(scenario())
+    assert empty.currencies.user_items() == []
+    assert [value for value, _ in prefs.currencies.user_items()] == ["KZT", "GBP"]
+    assert [value for value, _ in prefs.items("income").user_items()] == ["Кэшбэк"]
+    assert [value for value, _ in prefs.items("expense").user_items()] == ["Кофе"]
+    assert again is prefs
+    assert len(queries) == 1
+
+
+
+def test_pref_list_merges_defaults_case_insensitively():
+    prefs = PrefList([("usd", 1), ("GBP", 2)], BASE_CURRENCIES)
+    assert [value for value, _ in prefs.merged()] == ["usd", "GBP"] + [c for c in BASE_CURRENCIES if c != "USD"]
+
+    prefs.push_front("Eur")
+    prefs.push_front("gbp")
+    assert [value for value, _ in prefs.user_items()] == ["gbp", "Eur", "usd"]
+    assert "EUR" not in [value for value, _ in prefs.merged()]
+
+    assert prefs.remove("EUR")
+    assert not prefs.remove("EUR")
+    assert "EUR" in [value for value, _ in prefs.merged()]
+    assert prefs.merged() is prefs.merged()
+
+
+def test_buttons_carry_short_tokens_resolved_back_to_names():
+    name = "Очень длинное название категории для проверки"
+    prefs = PrefList([(name, 123456)], DEFAULT_CATEGORIES["expense"])
+    tokens = dict(prefs.merged())
+
+    assert tokens[name] == "u123456"
+    assert tokens["Транспорт"] == "b1"
+    assert len(f"cat:set:expense:{tokens[name]}".encode()) <= 64
+    assert prefs.resolve("u123456") == (name, 123456)
+    assert prefs.resolve("b1") == ("Транспорт", None)
+    assert prefs.resolve("u999") is None
+    # Кнопки со старым форматом (имя в callback_data) продолжают работать
+    assert prefs.resolve("Еда") == ("Еда", None)
@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime
+
+from app.db.versions import bump
+from app.services.rates import rates_fiat, rates_crypto
+from app.services.report_cache import ReportCache
+
+
+def test_report_is_rendered_again_only_after_data_or_rates_change(monkeypatch):
+    now = datetime.now()
+    monkeypatch.setitem(rates_fiat._cache, "data", {"USD": 1.0, "RUB": 100.0})
+    monkeypatch.setitem(rates_fiat._cache, "timestamp", now)
+    monkeypatch.setitem(rates_crypto._cache, "data", {"BTC": 100000.0})
+    monkeypatch.setitem(rates_crypto._cache, "timestamp", now)
+
+    renders = []
+
+    async def render():
+        renders.append(1)
+        return f"report #{len(renders)}"
+
+    async def scenario():
+        cache = ReportCache()
+        period = ("Расходы за текущую неделю", "2025-06-02T00:00:00")
+        texts = [
+            await cache.get_or_render(501, "expense", period, "entries", render),
+            await cache.get_or_render(501, "expense", period, "entries", render),
+        ]
+        bump("entries", 501)
+        texts.append(await cache.get_or_render(501, "expense", period, "entries", render))
+        monkeypatch.setitem(rates_fiat._cache, "timestamp", datetime.now())
+        texts.append(await cache.get_or_render(501, "expense", period, "entries", render))
+        return texts
+
+    assert asyncio.run(scenario()) == ["report #1", "report #1", "report #2", "report #3"]
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base, User, AssetLatestValues, CapitalSnapshot
+from app.services.asset_service import AssetService
+from app.services.rates import rates_fiat, rates_crypto
+from app.services.snapshot_service import SnapshotService
+
+ASSETS = {
+    1: [("USD", "Кэш", "100"), ("RUB", "Вклад", "5000"), ("BTC", "Крипта", "0.01")],
+    2: [("EUR", "Кэш", "200"), ("USD", "Брокер", "50")],
+    3: [("BTC", "Крипта", "0.5")],
+}
+
+
+def _fresh_rates(monkeypatch):
+    now = datetime.now()
+    monkeypatch.setitem(rates_fiat._cache, "data", {"USD": 1.0, "RUB": 100.0, "EUR": 0.5})
+    monkeypatch.setitem(rates_fiat._cache, "timestamp", now)
+    monkeypatch.setitem(rates_crypto._cache, "data", {"BTC": 100000.0})
+    monkeypatch.setitem(rates_crypto._cache, "timestamp", now)
+
+
+async def _make_db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'snap.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as session:
+        for uid, assets in ASSETS.items():
+            session.add(User(id=uid))
+            for code, category, amount in assets:
+                session.add(AssetLatestValues(user_id=uid, currency_code=code, category_name=category,
+                                              amount=Decimal(amount)))
+        await session.commit()
+    return engine, factory
+
+
+def test_batch_capitals_match_per_user_path(tmp_path, monkeypatch):
+    _fresh_rates(monkeypatch)
+
+    async def scenario():
+        engine, factory = await _make_db(tmp_path)
+        async with factory() as session:
+            batch = await SnapshotService(session).compute_all_capitals()
+            per_user = {uid: await AssetService(session).get_current_capital(uid, ["USD", "RUB"]) for uid in ASSETS}
+        await engine.dispose()
+        return batch, per_user
+
+    batch, per_user = asyncio.run(scenario())
+    assert set(batch) == set(ASSETS)
+    for uid, (usd, rub) in batch.items():
+        assert usd == pytest.approx(per_user[uid]["USD"])
+        assert rub == pytest.approx(per_user[uid]["RUB"])
+    # 100 USD + 5000 RUB + 0.01 BTC
+    assert batch[1][0] == pytest.approx(100 + 50 + 1000)
+
+
+def test_save_snapshots_keeps_existing_snapshot_for_the_date(tmp_path, monkeypatch):
+    _fresh_rates(monkeypatch)
+    day = date(2025, 1, 31)
+
+    async def scenario():
+        engine, factory = await _make_db(tmp_path)
+        async with factory() as session:
+            # Снэпшот, сделанный вручную через /snapshot_asset, не должен перезаписываться
+            session.add(CapitalSnapshot(user_id=2, snapshot_date=day, total_usd=Decimal("1"), total_rub=Decimal("100")))
+            await session.commit()
+
+        async with factory() as session:
+            capitals = await SnapshotService(session).compute_all_capitals()
+            created = await SnapshotService.save_snapshots(session, capitals, day)
+            await session.commit()
+
+        async with factory() as session:
+            rows = (await session.execute(select(CapitalSnapshot).order_by(CapitalSnapshot.user_id))).scalars().all()
+        await engine.dispose()
+        return created, {r.user_id: float(r.total_usd) for r in rows}
+
+    created, saved = asyncio.run(scenario())
+    assert created == 2
+    assert saved[2] == 1.0
+    assert saved[1] == pytest.approx(1150.0)
+    assert saved[3] == pytest.approx(50000.0)
@@ -0,0 +1,78 @@
+from collections import Counter
+
+import pytest
+from aiogram.types import Update
+
+import app.main as main
+from app.config import settings
+from app.sharding import HashRing, ShardPool, update_user_id
+
+
+def test_ring_spreads_users_and_moves_few_when_a_worker_is_added():
+    users = range(10_000)
+    four, five = HashRing(4), HashRing(5)
+
+    counts = Counter(four.node_for(u) for u in users)
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 1500
+
+    moved = sum(four.node_for(u) != five.node_for(u) for u in users)
+    # При добавлении пятого воркера переезжает примерно пятая часть пользователей
+    assert moved < 3500
+    assert all(four.node_for(u) == HashRing(4).node_for(u) for u in range(100))
+
+
+def test_update_user_id_prefers_author_over_chat():
+    message = Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 5, "date": 0,
+            "chat": {"id": -100, "type": "group"},
+            "from": {"id": 42, "is_bot": False, "first_name": "u"},
+            "text": "hi",
+        },
+    })
+    callback = Update.model_validate({
+        "update_id": 2,
+        "callback_query": {
+            "id": "q", "chat_instance": "c", "data": "x",
+            "from": {"id": 43, "is_bot": False, "first_name": "u"},
+        },
+    })
+    assert update_user_id(message) == 42
+    assert update_user_id(callback) == 43
+    assert update_user_id(Update(update_id=7)) == 7
+
+
+class _ShortLivedPool(ShardPool):
+    """Воркеры сразу завершаются — как упавшие процессы."""
+
+    def _spawn(self, index):
+        process = self._ctx.Process(target=int, daemon=True)
+        process.start()
+        process.join()
+        return process
+
+
+def test_pool_restarts_a_dead_worker_before_submitting_to_it():
+    pool = _ShortLivedPool(2, dispatcher_factory=None, token="42:TEST")
+    pool.start()
+    update = Update(update_id=7)
+    index = pool.submit(update)
+    assert pool.restarts == 1
+    assert pool._queues[index].get(timeout=5)[0] == 7
+
+
+def test_worker_processes_refused_with_sqlite_single_writer(monkeypatch):
+    monkeypatch.setattr(main, "IS_SQLITE", True)
+    monkeypatch.setattr(settings, "WORKER_PROCESSES", 4)
+    monkeypatch.setattr(settings, "SQLITE_SINGLE_WRITER", True)
+    with pytest.raises(RuntimeError):
+        main._check_worker_processes()
+
+    # Без единственного писателя — только предупреждение
+    monkeypatch.setattr(settings, "SQLITE_SINGLE_WRITER", False)
+    main._check_worker_processes()
+    monkeypatch.setattr(settings, "WORKER_PROCESSES", 1)
+    monkeypatch.setattr(settings, "SQLITE_SINGLE_WRITER", True)
+    main._check_worker_processes()
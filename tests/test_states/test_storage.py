@@ -0,0 +1,60 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.db.models import Base
+from app.states.form import FormState, Flow
+from app.states.storage import DbStorage, encode_data, decode_data
+
+
+def test_form_state_is_packed_positionally():
+    st = FormState(main_msg_id=42, mode="income", amount_str="12.5")
+    raw = encode_data({"st": st.__dict__, "other": 1})
+
+    assert raw == '{"st":[42,null,null,"income","12.5"],"other":1}'
+    assert decode_data(raw) == {"st": st.__dict__, "other": 1}
+
+
+def test_updates_are_written_once_per_flush_and_survive_restart(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'fsm.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        writes = []
+
+        async def session_factory():
+            return factory()
+
+        async def write(fn):
+            writes.append(fn)
+            async with factory() as session:
+                result = await fn(session)
+                await session.commit()
+            return result
+
+        key = StorageKey(bot_id=1, chat_id=7, user_id=7)
+        storage = DbStorage(session_factory=session_factory, write=write)
+        await storage.set_state(key, Flow.form)
+        await storage.update_data(key, {"st": FormState(amount_str="1").__dict__})
+        await storage.update_data(key, {"st": FormState(amount_str="12", tab="currency").__dict__})
+        await storage.flush(key)
+        assert not await storage.flush(key)
+
+        restarted = DbStorage(session_factory=session_factory, write=write)
+        state, data = await restarted.get_state(key), await restarted.get_data(key)
+
+        await restarted.set_state(key, None)
+        await restarted.set_data(key, {})
+        await restarted.close()
+        cleared = await DbStorage(session_factory=session_factory, write=write).get_state(key)
+
+        await engine.dispose()
+        return writes, state, data, cleared
+
+    writes, state, data, cleared = asyncio.run(scenario())
+    assert len(writes) == 2
+    assert state == Flow.form.state
+    assert FormState(**data["st"]) == FormState(amount_str="12", tab="currency")
+    assert cleared is None
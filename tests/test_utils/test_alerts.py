@@ -0,0 +1,48 @@
+import logging
+
+from app.utils.alerts import TelegramAlertHandler
+
+
+def _handler(**kwargs):
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append((chat_id, text))
+
+    handler = TelegramAlertHandler(chat_ids=[1, 2], send=send, flush_interval=60, **kwargs)
+    handler.setFormatter(logging.Formatter("%(levelname)s | %(message)s"))
+    logger = logging.getLogger("test_alerts")
+    logger.propagate = False
+    logger.handlers = [handler]
+    return handler, logger, sent
+
+
+def test_error_storm_becomes_one_message_per_chat():
+    handler, logger, sent = _handler()
+    try:
+        for asset in range(100):
+            logger.warning(f"Failed to convert asset {asset}")
+        logger.error("Other failure")
+        handler.flush()
+    finally:
+        handler.close()
+
+    assert [chat_id for chat_id, _ in sent] == [1, 2]
+    text = sent[0][1]
+    assert "101 records, 2 kinds" in text
+    assert "×100" in text and "Failed to convert asset 0" in text
+    assert "Other failure" in text
+
+
+def test_buffer_is_bounded_and_drops_are_reported():
+    handler, logger, sent = _handler(max_buffer=2)
+    try:
+        logger.warning("first")
+        logger.warning("second")
+        logger.warning("third")
+        handler.flush()
+    finally:
+        handler.close()
+
+    assert "1 more records dropped" in sent[0][1]
+    assert "third" not in sent[0][1]
@@ -0,0 +1,61 @@
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.utils.edits import MessageEditor
+
+
+def _kb(text):
+    return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=text, callback_data="noop")]])
+
+
+class FakeBot:
+    def __init__(self, not_modified=False):
+        self.calls = []
+        self._not_modified = not_modified
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None, parse_mode=None):
+        if self._not_modified:
+            method = EditMessageText(chat_id=chat_id, message_id=message_id, text=text)
+            raise TelegramBadRequest(method=method, message="Bad Request: message is not modified")
+        self.calls.append(("text", text))
+
+    async def edit_message_reply_markup(self, chat_id, message_id, reply_markup=None):
+        self.calls.append(("markup", reply_markup.inline_keyboard[0][0].text))
+
+
+def test_identical_edits_are_skipped_and_markup_only_changes_use_markup_edit():
+    bot = FakeBot()
+    editor = MessageEditor(debounce=0)
+
+    async def scenario():
+        await editor.edit_text(bot, 1, 10, "card", _kb("a"))
+        assert not await editor.edit_text(bot, 1, 10, "card", _kb("a"))
+        await editor.edit_text(bot, 1, 10, "card", _kb("b"))
+        assert not await editor.edit_markup(bot, 1, 10, _kb("b"))
+        await editor.edit_text(bot, 1, 10, "card 2", _kb("b"))
+
+    asyncio.run(scenario())
+    assert bot.calls == [("text", "card"), ("markup", "b"), ("text", "card 2")]
+    assert editor.skipped == 2
+
+
+def test_not_modified_is_not_an_error():
+    bot = FakeBot(not_modified=True)
+    assert asyncio.run(MessageEditor(debounce=0).edit_text(bot, 1, 10, "card", _kb("a")))
+
+
+def test_keypad_burst_is_coalesced_into_one_trailing_edit():
+    bot = FakeBot()
+    editor = MessageEditor(debounce=0.05)
+
+    async def scenario():
+        for amount in ("1", "12", "123", "1234"):
+            await editor.edit_text(bot, 1, 10, amount, _kb("a"), debounce=True)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert bot.calls == [("text", "1"), ("text", "1234")]
+    assert editor.coalesced == 2
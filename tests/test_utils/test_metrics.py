@@ -0,0 +1,45 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.utils.cache import LRUCache
+from app.utils.metrics import Registry, Counter, Histogram, build_metrics_app
+
+
+def test_prometheus_text_format():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests", ["route"]))
+    latency = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+
+    requests.labels("a").inc()
+    requests.labels("a").inc(2)
+    requests.labels('b"c').inc()
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="a"} 3' in text
+    assert 'requests_total{route="b\\"c"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+
+
+def test_endpoint_exposes_cache_hit_counters():
+    cache = LRUCache(max_items=10, name="test_metrics_cache")
+    cache.put("k", 1)
+    cache.get("k")
+    cache.get("missing")
+
+    async def scenario():
+        async with TestClient(TestServer(build_metrics_app())) as client:
+            resp = await client.get("/metrics")
+            return resp.status, resp.headers["Content-Type"], await resp.text()
+
+    status, content_type, text = asyncio.run(scenario())
+    assert status == 200
+    assert content_type.startswith("text/plain")
+    assert 'cache_requests_total{cache="test_metrics_cache",result="hit"} 1' in text
+    assert 'cache_requests_total{cache="test_metrics_cache",result="miss"} 1' in text
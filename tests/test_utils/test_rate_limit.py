@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, DeleteMessage, SendMessage
+
+from app.utils.metrics import build_metrics_app
+from app.utils.rate_limit import TokenBucket, SendRateLimiter, RateLimitMiddleware
+
+
+def test_token_bucket_spaces_out_acquires():
+    async def scenario():
+        bucket = TokenBucket(rate=50.0, capacity=1.0)
+        started = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # Первый токен есть сразу, остальные 5 — по одному каждые 20 мс
+    assert asyncio.run(scenario()) >= 0.09
+
+
+def test_penalize_blocks_until_retry_after_passes():
+    now = [0.0]
+    bucket = TokenBucket(rate=10.0, capacity=10.0, clock=lambda: now[0])
+    bucket.penalize(2.0)
+    assert bucket.try_acquire() > 0
+    now[0] = 2.1
+    assert bucket.try_acquire() == 0
+
+
+def test_limiter_limits_each_chat_separately():
+    # Часы стоят: всё, что не требует ожидания, проходит сразу, остальное ждало бы вечно
+    now = [0.0]
+    limiter = SendRateLimiter(global_rate=1000.0, per_chat_rate=20.0, clock=lambda: now[0])
+
+    async def scenario():
+        for chat_id in range(10):
+            await asyncio.wait_for(limiter.acquire(chat_id), timeout=5)
+        await limiter.acquire(42)
+
+    asyncio.run(scenario())
+    # Разные чаты не ждали друг друга, а в тот же чат следующий токен будет через 1/20 с
+    assert limiter._chat_bucket(42).try_acquire() == pytest.approx(0.05)
+    now[0] = 0.05
+    assert limiter._chat_bucket(42).try_acquire() == 0
+
+
+class FakeSession:
+    """Имитирует цепочку middleware сессии: последний вызов — сам запрос."""
+
+    def __init__(self, middleware, retry_after=0, retry_seconds=0):
+        self.middleware = middleware
+        self.retry_after = retry_after
+        self.retry_seconds = retry_seconds
+        self.calls = []
+
+    async def request(self, method):
+        async def make_request(bot, method):
+            self.calls.append(type(method).__name__)
+            if self.retry_after:
+                self.retry_after -= 1
+                raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_seconds)
+            return "ok"
+
+        return await self.middleware(make_request, None, method)
+
+
+def test_middleware_retries_after_flood_control_and_counts():
+    mw = RateLimitMiddleware(SendRateLimiter(global_rate=1000.0, per_chat_rate=1000.0), max_retries=2)
+    session = FakeSession(mw, retry_after=2)
+    assert asyncio.run(session.request(SendMessage(chat_id=1, text="hi"))) == "ok"
+    assert session.calls == ["SendMessage"] * 3
+    assert mw.retried == 2
+
+    session = FakeSession(mw, retry_after=5)
+    try:
+        asyncio.run(session.request(DeleteMessage(chat_id=1, message_id=2)))
+    except TelegramRetryAfter:
+        pass
+    else:
+        raise AssertionError("RetryAfter should propagate after the last retry")
+    assert mw.gave_up == 1
+
+
+def test_middleware_waits_out_retry_after_for_requests_without_chat():
+    mw = RateLimitMiddleware(SendRateLimiter(global_rate=1000.0, per_chat_rate=1000.0), max_retries=1)
+    session = FakeSession(mw, retry_after=1, retry_seconds=1)
+    started = time.monotonic()
+    assert asyncio.run(session.request(AnswerCallbackQuery(callback_query_id="1"))) == "ok"
+    assert session.calls == ["AnswerCallbackQuery"] * 2
+    assert time.monotonic() - started >= 1.0
+
+
+def _scrape(names):
+    async def scenario():
+        async with TestClient(TestServer(build_metrics_app())) as client:
+            return await (await client.get("/metrics")).text()
+
+    values = dict(line.rsplit(" ", 1) for line in asyncio.run(scenario()).splitlines() if not line.startswith("#"))
+    return {name: float(values[name]) for name in names}
+
+
+def test_middleware_counters_are_exposed_as_metrics():
+    names = ["telegram_requests_total", "telegram_retries_total", "telegram_gave_up_total"]
+    before = _scrape(names)
+
+    mw = RateLimitMiddleware(SendRateLimiter(global_rate=1000.0, per_chat_rate=1000.0), max_retries=1)
+    asyncio.run(FakeSession(mw, retry_after=1).request(SendMessage(chat_id=1, text="hi")))
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(FakeSession(mw, retry_after=5).request(SendMessage(chat_id=2, text="hi")))
+
+    after = _scrape(names)
+    assert after["telegram_requests_total"] - before["telegram_requests_total"] == 2
+    assert after["telegram_retries_total"] - before["telegram_retries_total"] == 2
+    assert after["telegram_gave_up_total"] - before["telegram_gave_up_total"] == 1
+
+
+def test_interactive_sends_overtake_queued_bulk_sends():
+    limiter = SendRateLimiter(global_rate=50.0, per_chat_rate=1000.0, per_chat_burst=1000.0)
+    order = []
+
+    async def send(name, chat_id, bulk):
+        await limiter.acquire(chat_id, bulk=bulk)
+        order.append(name)
+
+    async def scenario():
+        # Выбираем запас глобального ведра
+        while limiter.global_bucket.try_acquire() == 0:
+            pass
+        bulk = [asyncio.create_task(send(f"bulk{i}", 100 + i, True)) for i in range(3)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(send("tap", 1, False))
+        await asyncio.gather(*bulk, interactive)
+
+    asyncio.run(scenario())
+    assert order.index("tap") <= 1
@@ -0,0 +1,69 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.filters import CommandStart
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.webhook import SECRET_HEADER, WebhookHandler, build_webhook_app
+
+RECORDED_UPDATE = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 5,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+def test_webhook_validates_secret_and_feeds_updates_to_dispatcher():
+    async def scenario():
+        dp = Dispatcher()
+        seen = []
+
+        @dp.message(CommandStart())
+        async def start(message):
+            seen.append(message.chat.id)
+
+        bot = Bot(token="42:TEST")
+        handler = WebhookHandler(dp, bot, secret="s3cr3t", max_concurrency=2)
+        client = TestClient(TestServer(build_webhook_app(handler, path="/hook")))
+        await client.start_server()
+        try:
+            denied = await client.post("/hook", json=RECORDED_UPDATE, headers={SECRET_HEADER: "wrong"})
+            malformed = await client.post("/hook", data="not json", headers={SECRET_HEADER: "s3cr3t"})
+            accepted = [
+                await client.post("/hook", json=RECORDED_UPDATE, headers={SECRET_HEADER: "s3cr3t"})
+                for _ in range(3)
+            ]
+            await handler.drain()
+        finally:
+            await client.close()
+            await bot.session.close()
+        return denied.status, malformed.status, [r.status for r in accepted], seen
+
+    denied, malformed, accepted, seen = asyncio.run(scenario())
+    assert denied == 401
+    assert malformed == 400
+    assert accepted == [200, 200, 200]
+    assert seen == [42, 42, 42]
+
+
+def test_webhook_without_secret_rejects_every_request():
+    async def scenario():
+        bot = Bot(token="42:TEST")
+        handler = WebhookHandler(Dispatcher(), bot, secret=None)
+        client = TestClient(TestServer(build_webhook_app(handler, path="/hook")))
+        await client.start_server()
+        try:
+            plain = await client.post("/hook", json=RECORDED_UPDATE)
+            empty = await client.post("/hook", json=RECORDED_UPDATE, headers={SECRET_HEADER: ""})
+        finally:
+            await client.close()
+            await bot.session.close()
+        return plain.status, empty.status
+
+    assert asyncio.run(scenario()) == (401, 401)